@@ -0,0 +1,198 @@
+import argparse
+import datetime
+import json
+import sqlite3
+import sys
+import time
+from collections import namedtuple
+
+from connection_manager import DEFAULT_DB_PATH, immediate_transaction, open_connection
+from migrations import migrate
+
+# Loans moved per transaction. Each chunk holds the write lock only for as long as it
+# takes to copy and delete this many loans, so kiosks can commit between chunks.
+DEFAULT_CHUNK_SIZE = 5000
+
+# Closed loans returned more than this many days ago are archived by default.
+DEFAULT_RETENTION_DAYS = 365
+
+# Schema name the archive database is attached under.
+ARCHIVE_NAME = "archive"
+
+# Same columns as Activity and Fine in db.sql. Foreign keys cannot reach across
+# databases, so archived loans keep their copyID and memberID without the checks;
+# archived fines still reference archived loans.
+ARCHIVE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS archive.Activity (
+    loanID INTEGER PRIMARY KEY,
+    copyID INTEGER,
+    memberID INTEGER,
+    borrowDate DATE,
+    dueDate DATE,
+    returnDate DATE,
+    CHECK (returnDate IS NULL OR returnDate >= borrowDate)
+);
+CREATE TABLE IF NOT EXISTS archive.Fine (
+    loanID INTEGER PRIMARY KEY,
+    amount REAL,
+    paymentDate DATE,
+    FOREIGN KEY (loanID) REFERENCES Activity(loanID)
+);
+CREATE INDEX IF NOT EXISTS archive.idx_archive_activity_member ON Activity (memberID);
+CREATE INDEX IF NOT EXISTS archive.idx_archive_activity_copy ON Activity (copyID);
+"""
+
+# Loan and fine history across both databases. A view in main cannot name another
+# schema, so these are TEMP views, created on every connection that attaches the archive.
+HISTORY_VIEWS = """
+CREATE TEMP VIEW IF NOT EXISTS ActivityHistory AS
+    SELECT loanID, copyID, memberID, borrowDate, dueDate, returnDate FROM main.Activity
+    UNION ALL
+    SELECT loanID, copyID, memberID, borrowDate, dueDate, returnDate FROM archive.Activity;
+CREATE TEMP VIEW IF NOT EXISTS FineHistory AS
+    SELECT loanID, amount, paymentDate FROM main.Fine
+    UNION ALL
+    SELECT loanID, amount, paymentDate FROM archive.Fine;
+"""
+
+# The next chunk of closed loans returned before the cutoff with no unpaid fine.
+# The newest loan is never moved: loanID is a plain INTEGER PRIMARY KEY, so deleting
+# the largest one would let the next borrow reuse an ID that is already archived.
+SELECT_CHUNK_SQL = """
+    SELECT loanID FROM main.Activity
+    WHERE loanID > :after AND loanID < (SELECT MAX(loanID) FROM main.Activity)
+      AND returnDate IS NOT NULL AND returnDate < :cutoff
+      AND NOT EXISTS (SELECT 1 FROM main.Fine
+                      WHERE Fine.loanID = Activity.loanID AND Fine.paymentDate IS NULL)
+    ORDER BY loanID
+    LIMIT :chunk_size
+"""
+
+# Bytes of the Activity and Fine b-trees, indexes included.
+WORKING_SET_SQL = """
+    SELECT COALESCE(SUM(dbstat.pgsize), 0)
+    FROM dbstat('main')
+    JOIN main.sqlite_master ON sqlite_master.name = dbstat.name
+    WHERE sqlite_master.tbl_name IN ('Activity', 'Fine')
+"""
+
+# Summary of one archival run. `loans` and `fines` count the rows moved, and the
+# byte counts are the hot tables' size before and after (see working_set_bytes).
+ArchiveStats = namedtuple("ArchiveStats", "cutoff loans fines chunks seconds bytes_before bytes_after")
+
+
+def attach_archive(conn, path):
+    """
+    Attach the archive database at `path` and create its tables and the history views.
+
+    Does nothing if an archive is already attached. Afterwards ActivityHistory and
+    FineHistory answer history queries over hot and archived rows alike.
+    """
+    attached = [row[1] for row in conn.execute("PRAGMA database_list")]
+    if ARCHIVE_NAME not in attached:
+        conn.execute("ATTACH DATABASE ? AS %s" % ARCHIVE_NAME, (path,))
+    conn.executescript(ARCHIVE_SCHEMA + HISTORY_VIEWS)
+
+
+def working_set_bytes(conn):
+    """
+    Return the bytes used by Activity, Fine and their indexes in the main database.
+
+    Pages freed by the archiver go on the freelist and are reused by later writes,
+    so this is what shrinks even though the file does not. Falls back to the pages
+    in use across the whole file when SQLite was built without the dbstat table.
+    """
+    try:
+        return conn.execute(WORKING_SET_SQL).fetchone()[0]
+    except sqlite3.OperationalError:
+        used = (conn.execute("PRAGMA main.page_count").fetchone()[0]
+                - conn.execute("PRAGMA main.freelist_count").fetchone()[0])
+        return used * conn.execute("PRAGMA main.page_size").fetchone()[0]
+
+
+def default_cutoff(today=None, retention_days=DEFAULT_RETENTION_DAYS):
+    """Return the ISO date before which closed loans are archived."""
+    today = today or datetime.date.today()
+    return (today - datetime.timedelta(days=retention_days)).isoformat()
+
+
+def archive_loans(conn, archive_path, cutoff, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Move closed loans returned before `cutoff`, and their settled fines, to the archive.
+
+    A loan is moved once it has a returnDate before `cutoff` and no unpaid fine, so
+    open loans and everything the member account reads stay in the main database.
+    Loans are walked in loanID order, `chunk_size` at a time, each chunk in its own
+    transaction: rows are copied into the archive first and then deleted, fines before
+    their loans so the foreign key from Fine to Activity holds throughout. None of the
+    fine or counter triggers fire, since they only watch open loans and unpaid fines.
+    Copies use INSERT OR REPLACE, so a chunk interrupted between the two databases is
+    simply moved again by the next run. Returns an ArchiveStats.
+    """
+    started = time.perf_counter()
+    attach_archive(conn, archive_path)
+    bytes_before = working_set_bytes(conn)
+    loans = fines = chunks = 0
+    after = 0
+    while True:
+        with immediate_transaction(conn):
+            ids = [row[0] for row in conn.execute(
+                SELECT_CHUNK_SQL, {"after": after, "cutoff": str(cutoff), "chunk_size": chunk_size})]
+            if not ids:
+                break
+            params = (json.dumps(ids),)
+            conn.execute("""
+                INSERT OR REPLACE INTO archive.Activity
+                    (loanID, copyID, memberID, borrowDate, dueDate, returnDate)
+                SELECT loanID, copyID, memberID, borrowDate, dueDate, returnDate FROM main.Activity
+                WHERE loanID IN (SELECT value FROM json_each(?))
+            """, params)
+            conn.execute("""
+                INSERT OR REPLACE INTO archive.Fine (loanID, amount, paymentDate)
+                SELECT loanID, amount, paymentDate FROM main.Fine
+                WHERE loanID IN (SELECT value FROM json_each(?))
+            """, params)
+            fines += conn.execute(
+                "DELETE FROM main.Fine WHERE loanID IN (SELECT value FROM json_each(?))", params).rowcount
+            loans += conn.execute(
+                "DELETE FROM main.Activity WHERE loanID IN (SELECT value FROM json_each(?))", params).rowcount
+            chunks += 1
+            after = ids[-1]
+    return ArchiveStats(str(cutoff), loans, fines, chunks, time.perf_counter() - started,
+                        bytes_before, working_set_bytes(conn))
+
+
+def shrink_percent(stats):
+    """Return how much of the hot working set an archival run removed, in percent."""
+    if not stats.bytes_before:
+        return 0.0
+    return 100.0 * (stats.bytes_before - stats.bytes_after) / stats.bytes_before
+
+
+def main(argv=None):
+    """Command-line entry point: python archive.py [database] [--archive PATH] [--before DATE]."""
+    parser = argparse.ArgumentParser(description="Move old closed loans and settled fines to an archive database.")
+    parser.add_argument("database", nargs="?", default=DEFAULT_DB_PATH)
+    parser.add_argument("--archive", help="archive database (default: <database> with .archive.db)")
+    parser.add_argument("--before", help="archive loans returned before this date (YYYY-MM-DD)")
+    parser.add_argument("--retention-days", type=int, default=DEFAULT_RETENTION_DAYS,
+                        help="with no --before, keep loans returned in the last N days")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--vacuum", action="store_true", help="compact the main database afterwards")
+    args = parser.parse_args(argv)
+    archive_path = args.archive or args.database.rsplit(".db", 1)[0] + ".archive.db"
+    cutoff = args.before or default_cutoff(retention_days=args.retention_days)
+    conn = open_connection(args.database)
+    migrate(conn)
+    stats = archive_loans(conn, archive_path, cutoff, chunk_size=args.chunk_size)
+    if args.vacuum:
+        conn.execute("VACUUM main")
+    conn.close()
+    print(f"Archived loans returned before {stats.cutoff} to {archive_path}: {stats.loans} loans and "
+          f"{stats.fines} fines in {stats.chunks} chunks, {stats.seconds:.3f}s")
+    print(f"Activity and Fine working set: {stats.bytes_before / 1024:.0f} KiB -> "
+          f"{stats.bytes_after / 1024:.0f} KiB ({shrink_percent(stats):.1f}% smaller)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
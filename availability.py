@@ -0,0 +1,171 @@
+import argparse
+import sqlite3
+import sys
+from collections import namedtuple
+
+# Copy and loan counts per ISBN, kept in step with Inventory and Activity by the
+# triggers below so "how many copies can I borrow?" is one primary-key lookup.
+# A copy counts as available when Available is 1; a loan is open while returnDate
+# is NULL. Rows are never deleted, so an ISBN whose copies are all gone keeps zeros.
+AVAILABILITY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ItemAvailability (
+    ISBN TEXT PRIMARY KEY,
+    totalCopies INTEGER NOT NULL DEFAULT 0,
+    availableCopies INTEGER NOT NULL DEFAULT 0,
+    openLoans INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS availability_copy_insert AFTER INSERT ON Inventory
+WHEN NEW.ISBN IS NOT NULL BEGIN
+    INSERT INTO ItemAvailability (ISBN, totalCopies, availableCopies, openLoans)
+    VALUES (NEW.ISBN, 1, NEW.Available IS 1,
+            (SELECT COUNT(*) FROM Activity WHERE copyID = NEW.copyID AND returnDate IS NULL))
+    ON CONFLICT (ISBN) DO UPDATE SET
+        totalCopies = totalCopies + 1,
+        availableCopies = availableCopies + excluded.availableCopies,
+        openLoans = openLoans + excluded.openLoans;
+END;
+
+CREATE TRIGGER IF NOT EXISTS availability_copy_delete AFTER DELETE ON Inventory
+WHEN OLD.ISBN IS NOT NULL BEGIN
+    UPDATE ItemAvailability SET
+        totalCopies = totalCopies - 1,
+        availableCopies = availableCopies - (OLD.Available IS 1),
+        openLoans = openLoans - (SELECT COUNT(*) FROM Activity
+                                 WHERE copyID = OLD.copyID AND returnDate IS NULL)
+    WHERE ISBN = OLD.ISBN;
+END;
+
+-- The borrow and return paths only flip Available, which moves one counter.
+CREATE TRIGGER IF NOT EXISTS availability_copy_available AFTER UPDATE OF Available ON Inventory
+WHEN OLD.ISBN IS NEW.ISBN AND (OLD.Available IS 1) <> (NEW.Available IS 1) BEGIN
+    UPDATE ItemAvailability SET availableCopies = availableCopies + (NEW.Available IS 1) - (OLD.Available IS 1)
+    WHERE ISBN = NEW.ISBN;
+END;
+
+-- A copy moved to another ISBN takes its availability and open loans with it.
+CREATE TRIGGER IF NOT EXISTS availability_copy_isbn AFTER UPDATE OF ISBN ON Inventory
+WHEN OLD.ISBN IS NOT NEW.ISBN BEGIN
+    UPDATE ItemAvailability SET
+        totalCopies = totalCopies - 1,
+        availableCopies = availableCopies - (OLD.Available IS 1),
+        openLoans = openLoans - (SELECT COUNT(*) FROM Activity
+                                 WHERE copyID = OLD.copyID AND returnDate IS NULL)
+    WHERE ISBN = OLD.ISBN;
+    INSERT INTO ItemAvailability (ISBN, totalCopies, availableCopies, openLoans)
+    SELECT NEW.ISBN, 1, NEW.Available IS 1,
+           (SELECT COUNT(*) FROM Activity WHERE copyID = NEW.copyID AND returnDate IS NULL)
+    WHERE NEW.ISBN IS NOT NULL
+    ON CONFLICT (ISBN) DO UPDATE SET
+        totalCopies = totalCopies + 1,
+        availableCopies = availableCopies + excluded.availableCopies,
+        openLoans = openLoans + excluded.openLoans;
+END;
+
+CREATE TRIGGER IF NOT EXISTS availability_loan_insert AFTER INSERT ON Activity
+WHEN NEW.returnDate IS NULL BEGIN
+    UPDATE ItemAvailability SET openLoans = openLoans + 1
+    WHERE ISBN = (SELECT ISBN FROM Inventory WHERE copyID = NEW.copyID);
+END;
+
+CREATE TRIGGER IF NOT EXISTS availability_loan_delete AFTER DELETE ON Activity
+WHEN OLD.returnDate IS NULL BEGIN
+    UPDATE ItemAvailability SET openLoans = openLoans - 1
+    WHERE ISBN = (SELECT ISBN FROM Inventory WHERE copyID = OLD.copyID);
+END;
+
+CREATE TRIGGER IF NOT EXISTS availability_loan_update AFTER UPDATE OF returnDate, copyID ON Activity
+WHEN (OLD.returnDate IS NULL) <> (NEW.returnDate IS NULL) OR OLD.copyID IS NOT NEW.copyID BEGIN
+    UPDATE ItemAvailability SET openLoans = openLoans - 1
+    WHERE OLD.returnDate IS NULL AND ISBN = (SELECT ISBN FROM Inventory WHERE copyID = OLD.copyID);
+    UPDATE ItemAvailability SET openLoans = openLoans + 1
+    WHERE NEW.returnDate IS NULL AND ISBN = (SELECT ISBN FROM Inventory WHERE copyID = NEW.copyID);
+END;
+"""
+
+# The counters recomputed from the base tables.
+COUNT_AVAILABILITY_SQL = """
+    SELECT ISBN, COUNT(*), SUM(Available IS 1),
+           SUM((SELECT COUNT(*) FROM Activity
+                WHERE Activity.copyID = Inventory.copyID AND returnDate IS NULL))
+    FROM Inventory
+    WHERE ISBN IS NOT NULL
+    GROUP BY ISBN
+"""
+
+POPULATE_AVAILABILITY_SQL = """
+    INSERT INTO ItemAvailability (ISBN, totalCopies, availableCopies, openLoans)
+""" + COUNT_AVAILABILITY_SQL
+
+# One ISBN whose stored counters differ from the base tables. `expected` and
+# `actual` are (totalCopies, availableCopies, openLoans); a missing row counts as zeros.
+Discrepancy = namedtuple("Discrepancy", "isbn expected actual")
+
+
+def has_availability_table(conn):
+    """Return True if the ItemAvailability table exists (migration 5 has run)."""
+    cur = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ItemAvailability'")
+    return cur.fetchone() is not None
+
+
+def check_availability(conn, repair=False):
+    """
+    Recompute every ISBN's counters from Inventory and Activity and diff them.
+
+    Runs in one transaction, so the comparison sees a single snapshot. With `repair`
+    the table is rebuilt from the base tables in the same transaction. If `conn` is
+    already in a transaction the check joins it and the caller commits. Returns the
+    list of Discrepancy found before any repair.
+    """
+    owned = not conn.in_transaction
+    if owned:
+        conn.execute("BEGIN IMMEDIATE" if repair else "BEGIN")
+    try:
+        rows = conn.execute("""
+            WITH expected (ISBN, totalCopies, availableCopies, openLoans) AS (%s),
+            isbns AS (SELECT ISBN FROM expected UNION SELECT ISBN FROM ItemAvailability)
+            SELECT isbns.ISBN,
+                   COALESCE(e.totalCopies, 0), COALESCE(e.availableCopies, 0), COALESCE(e.openLoans, 0),
+                   COALESCE(a.totalCopies, 0), COALESCE(a.availableCopies, 0), COALESCE(a.openLoans, 0)
+            FROM isbns
+            LEFT JOIN expected e ON e.ISBN = isbns.ISBN
+            LEFT JOIN ItemAvailability a ON a.ISBN = isbns.ISBN
+            WHERE (COALESCE(e.totalCopies, 0), COALESCE(e.availableCopies, 0), COALESCE(e.openLoans, 0))
+               IS NOT (COALESCE(a.totalCopies, 0), COALESCE(a.availableCopies, 0), COALESCE(a.openLoans, 0))
+            ORDER BY isbns.ISBN
+        """ % COUNT_AVAILABILITY_SQL).fetchall()
+        if repair and rows:
+            conn.execute("DELETE FROM ItemAvailability")
+            conn.execute(POPULATE_AVAILABILITY_SQL)
+    except BaseException:
+        if owned:
+            conn.rollback()
+        raise
+    if owned:
+        conn.commit()
+    return [Discrepancy(row[0], tuple(row[1:4]), tuple(row[4:7])) for row in rows]
+
+
+def main(argv=None):
+    """Command-line entry point: python availability.py [database] [--repair]."""
+    parser = argparse.ArgumentParser(description="Check the per-ISBN availability counters.")
+    parser.add_argument("database", nargs="?", default="library.db")
+    parser.add_argument("--repair", action="store_true", help="rebuild the counters if they differ")
+    args = parser.parse_args(argv)
+    conn = sqlite3.connect(args.database)
+    if not has_availability_table(conn):
+        print(f"{args.database} has no ItemAvailability table; run migrations.py first.")
+        return 1
+    discrepancies = check_availability(conn, repair=args.repair)
+    conn.close()
+    for isbn, expected, actual in discrepancies:
+        print(f"{isbn}: expected total/available/open {expected}, found {actual}")
+    if not discrepancies:
+        print("Availability counters match Inventory and Activity.")
+    elif args.repair:
+        print(f"Rebuilt the counters; {len(discrepancies)} ISBNs were wrong.")
+    return 1 if discrepancies and not args.repair else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
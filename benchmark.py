@@ -0,0 +1,417 @@
+import argparse
+import datetime
+import glob
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+from catalog_search import DEFAULT_PAGE_SIZE, RANK_WEIGHTS, build_match_query
+from connection_manager import open_connection
+from datagen import SCALES, WORDS, generate
+from fines import accrue_fines
+from instrumentation import Metrics
+from library_service import (
+    Event,
+    EventFullError,
+    Item,
+    Librarian,
+    LibraryService,
+    ScheduleConflictError,
+    make_cache,
+)
+from migrations import migrate
+
+# Default location of the stored results that new runs are compared against.
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+
+# A benchmark regresses when its median latency exceeds the baseline by more than this.
+DEFAULT_TOLERANCE = 0.5
+
+# Absolute p99 latency budgets in milliseconds, checked on every run at any scale.
+# The member account must stay under a millisecond even at --scale full (50M loans).
+LATENCY_TARGETS_MS = {"member_account": 1.0}
+
+
+class BenchContext:
+    """State shared by the benchmark operations: the service, a seeded RNG and sample keys."""
+
+    def __init__(self, conn, seed):
+        self.conn = conn
+        self.service = LibraryService(conn)
+        self.cached = LibraryService(conn, cache=make_cache())
+        self.rng = random.Random(seed)
+        self.today = datetime.date.today()
+        self.members = conn.execute("SELECT MAX(memberID) FROM Member").fetchone()[0]
+        self.events = conn.execute("SELECT MAX(EventID) FROM Event").fetchone()[0]
+        self.rooms = conn.execute("SELECT COUNT(*) FROM Room").fetchone()[0]
+        self.isbns = [row[0] for row in conn.execute("SELECT ISBN FROM Item LIMIT 1000")]
+        self.available = [row[0] for row in conn.execute(
+            "SELECT copyID FROM Inventory WHERE Available = 1 LIMIT 5000")]
+
+    def member(self):
+        return self.rng.randint(1, self.members)
+
+    def copy(self):
+        return self.rng.choice(self.available)
+
+
+# Each benchmark is (name, prepare, run). prepare(ctx) is untimed and returns the
+# argument for one timed run(ctx, arg); it may be None.
+
+def _search(ctx, arg):
+    ctx.service.find_items(ctx.rng.choice(WORDS))
+
+def _search_two_words(ctx, arg):
+    ctx.service.find_items("%s %s" % (ctx.rng.choice(WORDS), ctx.rng.choice(WORDS)[:3]))
+
+def _search_cached(ctx, arg):
+    # Kiosk traffic repeats a small set of searches.
+    ctx.cached.find_items(ctx.rng.choice(WORDS[:20]))
+
+def _find_events(ctx, arg):
+    ctx.service.find_events(ctx.rng.choice(WORDS))
+
+def _find_librarian(ctx, arg):
+    ctx.service.find_librarian("R001")
+
+def _borrow(ctx, arg):
+    loan = ctx.service.borrow(ctx.member(), arg)
+    # Give the copy back straight away so the pool of available copies stays the same.
+    ctx.service.return_loan(loan.loan_id)
+
+def _borrow_many(ctx, arg):
+    results = ctx.service.borrow_many([(ctx.member(), copy_id) for copy_id in arg])
+    ctx.service.return_many([r.result.loan_id for r in results if r.ok])
+
+def _prepare_batch(ctx):
+    return ctx.rng.sample(ctx.available, 20)
+
+def _prepare_late_loan(ctx):
+    # A loan borrowed 30 days ago, so returning it today fires the fine triggers.
+    borrowed = ctx.today - datetime.timedelta(days=30)
+    return ctx.service.borrow(ctx.member(), ctx.copy(), today=borrowed).loan_id
+
+def _return_late(ctx, loan_id):
+    ctx.service.return_loan(loan_id)
+
+def _register(ctx, arg):
+    try:
+        ctx.service.register(ctx.rng.randint(1, ctx.events))
+    except EventFullError:
+        pass
+
+def _donate(ctx, arg):
+    ctx.service.donate(ctx.rng.choice(ctx.isbns), "Z1", "Good")
+
+def _prepare_slot(ctx):
+    # A two-hour slot in the year either side of today, like datagen's events.
+    start = datetime.datetime.combine(ctx.today, datetime.time(ctx.rng.randint(9, 19)))
+    start += datetime.timedelta(days=ctx.rng.randint(-365, 365))
+    return start, start + datetime.timedelta(hours=2)
+
+def _schedule_event(ctx, slot):
+    try:
+        ctx.service.schedule_event("Bench Talk", "Lecture", "R%03d" % ctx.rng.randint(1, ctx.rooms), *slot)
+    except ScheduleConflictError:
+        pass
+
+def _free_rooms(ctx, slot):
+    ctx.service.free_rooms(*slot, seats=ctx.rng.randint(1, 100))
+
+def _member_account(ctx, arg):
+    ctx.service.member_account(ctx.member())
+
+def _accrue_fines(ctx, arg):
+    accrue_fines(ctx.conn, force=True)
+
+BENCHMARKS = [
+    ("find_items", None, _search),
+    ("find_items_prefix", None, _search_two_words),
+    ("find_items_cached", None, _search_cached),
+    ("find_events", None, _find_events),
+    ("find_librarian", None, _find_librarian),
+    ("borrow_and_return", lambda ctx: ctx.copy(), _borrow),
+    ("borrow_many_20", _prepare_batch, _borrow_many),
+    ("return_late_with_fine", _prepare_late_loan, _return_late),
+    ("register_event", None, _register),
+    ("donate_item", None, _donate),
+    ("schedule_event", _prepare_slot, _schedule_event),
+    ("free_rooms", _prepare_slot, _free_rooms),
+    ("member_account", None, _member_account),
+    ("accrue_fines", None, _accrue_fines),
+]
+
+# Benchmarks that touch every open loan run fewer times.
+ITERATION_SCALE = {"accrue_fines": 0.05}
+
+
+def _summary(samples):
+    samples = sorted(samples)
+    count = len(samples)
+    total = sum(samples)
+    return {
+        "iterations": count,
+        "mean_ms": total / count * 1000,
+        "p50_ms": samples[count // 2] * 1000,
+        "p99_ms": samples[min(count - 1, int(count * 0.99))] * 1000,
+        "ops_per_sec": count / total if total else 0.0,
+    }
+
+
+def run_benchmarks(conn, iterations=200, seed=1, only=None):
+    """
+    Time every operation in BENCHMARKS against `conn`.
+
+    The database is modified (loans, registrations, donations), so use a copy.
+    Returns {name: summary} with iterations, mean_ms, p50_ms, p99_ms and ops_per_sec.
+    """
+    ctx = BenchContext(conn, seed)
+    results = {}
+    for name, prepare, run in BENCHMARKS:
+        if only and name not in only:
+            continue
+        count = max(1, int(iterations * ITERATION_SCALE.get(name, 1)))
+        samples = []
+        for _ in range(count):
+            arg = prepare(ctx) if prepare else None
+            started = time.perf_counter()
+            run(ctx, arg)
+            samples.append(time.perf_counter() - started)
+        results[name] = _summary(samples)
+    return results
+
+
+# The lookups as they were written before library_service.STATEMENTS: a fresh cursor
+# and multi-line SQL text per call, and records built row by row while iterating.
+
+def _adhoc_find_items(conn, query):
+    # One query, as before: the counts that find_items() adds with its own lookup are
+    # joined in, so both sides return the same Items without a query per row here.
+    cur = conn.execute("""
+        SELECT Item.ISBN, Item.title, Item.author, Item.itemType,
+               coalesce(a.totalCopies, 0), coalesce(a.availableCopies, 0), coalesce(a.openLoans, 0)
+        FROM ItemSearch
+        JOIN Item ON Item.rowid = ItemSearch.rowid
+        LEFT JOIN ItemAvailability a ON a.ISBN = Item.ISBN
+        WHERE ItemSearch MATCH ?
+        ORDER BY bm25(ItemSearch, ?, ?, ?, ?), Item.rowid
+        LIMIT ?
+    """, (build_match_query(query),) + RANK_WEIGHTS + (DEFAULT_PAGE_SIZE,))
+    return [Item._make(row) for row in cur]
+
+def _adhoc_item_exists(conn, isbn):
+    cur = conn.execute("SELECT 1 FROM Item WHERE ISBN = ?", (isbn,))
+    return cur.fetchone() is not None
+
+def _adhoc_find_events(conn, query):
+    cur = conn.execute("""
+        SELECT EventID, eventName, eventType, startDate, startTime, roomNumber
+        FROM Event
+        WHERE eventName LIKE ? OR eventType LIKE ?
+    """, ('%' + query + '%', '%' + query + '%'))
+    return [Event._make(row) for row in cur]
+
+def _adhoc_find_librarian(conn, room_number):
+    cur = conn.execute("""
+        SELECT personnelID, Position, roomNumber
+        FROM Personnel
+        WHERE Position LIKE '%Librarian%' AND roomNumber = ?
+        LIMIT 1
+    """, (room_number,))
+    row = cur.fetchone()
+    return Librarian._make(row) if row else None
+
+# (name, ad hoc version, prepared version, argument)
+STATEMENT_BENCHMARKS = [
+    ("find_items", _adhoc_find_items, LibraryService.find_items, "potter"),
+    ("item_exists", _adhoc_item_exists, LibraryService.item_exists, "9780439708180"),
+    ("find_events", _adhoc_find_events, LibraryService.find_events, "Book"),
+    ("find_librarian", _adhoc_find_librarian, LibraryService.find_librarian, "R001"),
+]
+
+
+def statement_microbenchmark(conn, calls=20000, repeat=5):
+    """
+    Compare calls/sec of the ad hoc lookups with LibraryService's prepared statements.
+
+    Each side runs `calls` calls `repeat` times, alternating, and keeps its best run.
+    Returns {name: (ad hoc calls/sec, prepared calls/sec)}.
+    """
+    service = LibraryService(conn)
+    results = {}
+    for name, adhoc, prepared, arg in STATEMENT_BENCHMARKS:
+        best = [float("inf"), float("inf")]
+        for _ in range(repeat):
+            for side, run, target in ((0, adhoc, conn), (1, prepared, service)):
+                started = time.perf_counter()
+                for _ in range(calls):
+                    run(target, arg)
+                best[side] = min(best[side], time.perf_counter() - started)
+        results[name] = (calls / best[0], calls / best[1])
+    return results
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compare a run with a baseline run.
+
+    Returns a list of (name, baseline p50 ms, current p50 ms) for every benchmark
+    whose median latency grew by more than `tolerance` (0.5 = 50%).
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous and current["p50_ms"] > previous["p50_ms"] * (1 + tolerance):
+            regressions.append((name, previous["p50_ms"], current["p50_ms"]))
+    return regressions
+
+
+def missed_targets(results, targets=LATENCY_TARGETS_MS):
+    """Return (name, target ms, p99 ms) for every benchmark over its latency target."""
+    return [(name, target, results[name]["p99_ms"]) for name, target in targets.items()
+            if name in results and results[name]["p99_ms"] > target]
+
+
+def instrumentation_overhead(plain, instrumented):
+    """
+    Return {name: (extra p50 ms, relative p50 cost)} of running with instrumentation on.
+
+    `plain` and `instrumented` are results of run_benchmarks() on identical copies of
+    the database; a relative cost of 0.05 means instrumented runs took 5% longer.
+    """
+    return {name: (instrumented[name]["p50_ms"] - plain[name]["p50_ms"],
+                   instrumented[name]["p50_ms"] / plain[name]["p50_ms"] - 1)
+            for name in plain if name in instrumented and plain[name]["p50_ms"]}
+
+
+def _copy_database(source, path):
+    copy = sqlite3.connect(path)
+    try:
+        original = sqlite3.connect(source)
+        try:
+            original.backup(copy)
+        finally:
+            original.close()
+    finally:
+        copy.close()
+
+
+def benchmark_database(scale, seed=1, cache_dir=None, today=None):
+    """
+    Return the path of a generated database for `scale`, generating it if needed.
+
+    Generated files are kept in `cache_dir` (default: the system temp directory) so
+    repeated runs skip the load. datagen dates loans and events relative to `today`
+    (default: the current date), which is therefore part of the file name: a file
+    generated on an earlier day is replaced rather than reused with stale dates.
+    Callers should benchmark a copy of the file.
+    """
+    today = today or datetime.date.today()
+    cache_dir = cache_dir or tempfile.gettempdir()
+    prefix = os.path.join(cache_dir, f"library-bench-{scale}-{seed}-")
+    path = prefix + today.isoformat() + ".db"
+    if not os.path.exists(path):
+        partial = path + ".partial"
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(partial + suffix):
+                os.remove(partial + suffix)
+        generate(partial, seed=seed, today=today, **SCALES[scale])
+        os.replace(partial, path)
+        # Earlier days' files for this scale and seed will not be used again.
+        for stale in glob.glob(glob.escape(prefix) + "????-??-??.db"):
+            if stale != path:
+                os.remove(stale)
+    return path
+
+
+def main(argv=None):
+    """Command-line entry point: python benchmark.py [--scale NAME | --db PATH] [options]."""
+    parser = argparse.ArgumentParser(description="Benchmark the library operations.")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="tiny")
+    parser.add_argument("--db", help="benchmark a copy of this database instead of a generated one")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--only", nargs="*", help="run only these benchmarks")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="store this run as the new baseline")
+    parser.add_argument("--instrument", action="store_true",
+                        help="also run with query instrumentation on and report its overhead")
+    parser.add_argument("--statements", action="store_true",
+                        help="only compare ad hoc SQL with the prepared-statement registry")
+    args = parser.parse_args(argv)
+
+    source = args.db or benchmark_database(args.scale, args.seed)
+    workdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(workdir, "library.db")
+        _copy_database(source, path)
+        conn = open_connection(path)
+        # A cached database may predate the latest migrations.
+        migrate(conn)
+        if args.statements:
+            for name, (adhoc, prepared) in statement_microbenchmark(conn).items():
+                print(f"{name:16} {adhoc:10.0f} calls/s ad hoc {prepared:10.0f} calls/s prepared "
+                      f"{(prepared / adhoc - 1) * 100:+6.1f}%")
+            conn.close()
+            return 0
+        results = run_benchmarks(conn, args.iterations, args.seed, args.only)
+        conn.close()
+        if args.instrument:
+            path = os.path.join(workdir, "instrumented.db")
+            _copy_database(source, path)
+            metrics = Metrics()
+            conn = metrics.connect(path)
+            migrate(conn)
+            instrumented = run_benchmarks(conn, args.iterations, args.seed, args.only)
+            conn.close()
+    finally:
+        shutil.rmtree(workdir)
+
+    report = {
+        "scale": "custom" if args.db else args.scale,
+        "sqlite_version": sqlite3.sqlite_version,
+        "python_version": sys.version.split()[0],
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    for name, summary in results.items():
+        print(f"{name:24} {summary['p50_ms']:9.3f} ms p50 {summary['p99_ms']:9.3f} ms p99 "
+              f"{summary['ops_per_sec']:10.0f} ops/s")
+    if args.instrument:
+        print("\nInstrumentation overhead (p50):")
+        for name, (extra, relative) in instrumentation_overhead(results, instrumented).items():
+            print(f"{name:24} {extra * 1000:+8.1f} us {relative * 100:+7.1f}%")
+        print()
+        print(metrics.export_text(), end="")
+
+    status = 0
+    for name, target, p99 in missed_targets(results):
+        print(f"TARGET MISSED {name}: p99 {p99:.3f} ms > {target:.3f} ms")
+        status = 1
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("scale") != report["scale"]:
+            print(f"Baseline is for scale {baseline.get('scale')!r}; not comparing.")
+        else:
+            for name, before, after in compare(results, baseline["results"], args.tolerance):
+                print(f"REGRESSION {name}: p50 {before:.3f} ms -> {after:.3f} ms")
+                status = 1
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+import argparse
+import hashlib
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+from migrations import MIGRATIONS, migrate
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# The schema and the sample data. db.sql is the single source of truth for the tables
+# and triggers; MIGRATIONS brings a fresh database from there to the latest version.
+SCHEMA_PATH = os.path.join(HERE, "db.sql")
+SAMPLE_DATA_PATH = os.path.join(HERE, "populate.sql")
+
+# Templates already built or found by this process, by (sample_data, cache_dir).
+_templates = {}
+
+
+def _scripts(sample_data):
+    paths = [SCHEMA_PATH, SAMPLE_DATA_PATH] if sample_data else [SCHEMA_PATH]
+    scripts = []
+    for path in paths:
+        with open(path) as f:
+            scripts.append(f.read())
+    return scripts
+
+
+def template_path(sample_data=False, cache_dir=None):
+    """
+    Return the path of a migrated template database, building it on first use.
+
+    The template is db.sql (plus populate.sql with `sample_data`) brought to the latest
+    migration. Its file name carries a digest of those scripts and of MIGRATIONS, so
+    editing any of them builds a new template instead of reusing a stale one. Templates
+    live in `cache_dir` (default: the system temp directory) and are shared by every
+    process; treat them as read-only and clone them with clone_into() or create_database().
+    """
+    key = (sample_data, cache_dir)
+    if key in _templates:
+        return _templates[key]
+    scripts = _scripts(sample_data)
+    digest = hashlib.sha1()
+    for text in scripts + [sql for _, _, sql in MIGRATIONS]:
+        digest.update(text.encode())
+    cache_dir = cache_dir or tempfile.gettempdir()
+    path = os.path.join(cache_dir, "library-template-%s-%s.db"
+                        % ("sample" if sample_data else "empty", digest.hexdigest()[:16]))
+    if not os.path.exists(path):
+        # Build under a private name and rename, so a concurrent process never sees
+        # a half-built template.
+        fd, partial = tempfile.mkstemp(suffix=".partial", dir=cache_dir)
+        os.close(fd)
+        try:
+            conn = sqlite3.connect(partial)
+            for script in scripts:
+                conn.executescript(script)
+            migrate(conn)
+            conn.close()
+            os.replace(partial, path)
+        except BaseException:
+            os.remove(partial)
+            raise
+    _templates[key] = path
+    return path
+
+
+def clone_into(conn, sample_data=True, cache_dir=None):
+    """
+    Copy the template into the open connection `conn` with the sqlite backup API.
+
+    Replaces whatever `conn` held. Works for ":memory:" connections, which is what the
+    tests use: one page copy instead of running db.sql, populate.sql and every migration.
+    """
+    source = sqlite3.connect(template_path(sample_data, cache_dir))
+    try:
+        source.backup(conn)
+    finally:
+        source.close()
+    return conn
+
+
+def memory_database(sample_data=True, cache_dir=None):
+    """Return a new in-memory connection holding a copy of the template, foreign keys on."""
+    conn = sqlite3.connect(":memory:")
+    clone_into(conn, sample_data, cache_dir)
+    conn.execute("PRAGMA foreign_keys = ON")
+    return conn
+
+
+def create_database(path, sample_data=True, cache_dir=None):
+    """
+    Create a ready-to-use database at `path` by copying the template file.
+
+    Does nothing and returns False if `path` already holds a database; an empty file,
+    as left by opening a missing path, is replaced. Returns True if it was created.
+    """
+    if os.path.exists(path) and os.path.getsize(path) > 0:
+        return False
+    partial = path + ".partial"
+    shutil.copyfile(template_path(sample_data, cache_dir), partial)
+    os.replace(partial, path)
+    return True
+
+
+def main(argv=None):
+    """Command-line entry point: python bootstrap.py [database] [--empty]."""
+    parser = argparse.ArgumentParser(description="Create a library database from db.sql.")
+    parser.add_argument("database", nargs="?", default="library.db")
+    parser.add_argument("--empty", action="store_true", help="leave out the sample data in populate.sql")
+    args = parser.parse_args(argv)
+    if not create_database(args.database, sample_data=not args.empty):
+        print(f"{args.database} already exists; leaving it alone.")
+        return 1
+    print(f"Created {args.database}" + (" (empty)" if args.empty else " with the sample data"))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,195 @@
+import re
+
+# Full-text index over the Item catalog. It is an external-content FTS5 table,
+# so the text itself stays in Item and the index only stores the tokens. The
+# triggers below keep it in sync with every insert, update and delete on Item.
+# The one-letter prefix index lets a search for "a" read its matches in rowid order
+# straight from one doclist instead of merging the doclist of every word starting with a.
+SEARCH_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS ItemSearch USING fts5(
+    title, author, Publisher, itemType,
+    content='Item',
+    content_rowid='rowid',
+    prefix='1 2 3 4'
+);
+
+CREATE TRIGGER IF NOT EXISTS item_search_after_insert
+AFTER INSERT ON Item
+BEGIN
+    INSERT INTO ItemSearch (rowid, title, author, Publisher, itemType)
+    VALUES (NEW.rowid, NEW.title, NEW.author, NEW.Publisher, NEW.itemType);
+END;
+
+CREATE TRIGGER IF NOT EXISTS item_search_after_delete
+AFTER DELETE ON Item
+BEGIN
+    INSERT INTO ItemSearch (ItemSearch, rowid, title, author, Publisher, itemType)
+    VALUES ('delete', OLD.rowid, OLD.title, OLD.author, OLD.Publisher, OLD.itemType);
+END;
+
+CREATE TRIGGER IF NOT EXISTS item_search_after_update
+AFTER UPDATE ON Item
+BEGIN
+    INSERT INTO ItemSearch (ItemSearch, rowid, title, author, Publisher, itemType)
+    VALUES ('delete', OLD.rowid, OLD.title, OLD.author, OLD.Publisher, OLD.itemType);
+    INSERT INTO ItemSearch (rowid, title, author, Publisher, itemType)
+    VALUES (NEW.rowid, NEW.title, NEW.author, NEW.Publisher, NEW.itemType);
+END;
+"""
+
+# Default and maximum number of rows returned by one search call.
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 200
+
+# Column weights for bm25(): a hit in the title counts more than one in the author,
+# which counts more than publisher or item type.
+RANK_WEIGHTS = (10.0, 5.0, 1.0, 1.0)
+
+
+# Searches whose longest word is shorter than this are listed in index (rowid) order
+# rather than ranked: "a" matches most of the catalog, and ranking means scoring and
+# sorting every match before the first page can come back.
+MIN_RANKED_TOKEN = 2
+
+
+def has_search_index(conn):
+    """Return True if the ItemSearch table exists in this database."""
+    cur = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ItemSearch'"
+    )
+    return cur.fetchone() is not None
+
+
+def ensure_search_index(conn):
+    """
+    Create the catalog search index if it is missing.
+
+    The index is populated from the existing Item rows when it is first created;
+    after that the triggers keep it up to date. Returns True if the index was built.
+    """
+    if has_search_index(conn):
+        return False
+    conn.executescript(SEARCH_SCHEMA)
+    rebuild_search_index(conn)
+    return True
+
+
+def rebuild_search_index(conn):
+    """
+    Rebuild the search index from the Item table.
+
+    The index is keyed by Item's rowid, which VACUUM may renumber because Item has
+    a TEXT primary key, so run this after a VACUUM.
+    """
+    conn.execute("INSERT INTO ItemSearch (ItemSearch) VALUES ('rebuild')")
+    conn.commit()
+
+
+def build_match_query(search):
+    """
+    Turn free text typed by a user into an FTS5 MATCH expression.
+
+    Each word becomes a quoted prefix token, so "gats fitz" matches
+    "The Great Gatsby" by "F. Scott Fitzgerald". Returns None if the text
+    contains no searchable words.
+    """
+    tokens = re.findall(r"\w+", search)
+    if not tokens:
+        return None
+    return " ".join('"%s"*' % token for token in tokens)
+
+
+def search_items(conn, search, limit=DEFAULT_PAGE_SIZE, offset=0, ensure_index=True):
+    """
+    Search the catalog by title, author, publisher or item type.
+
+    Returns at most `limit` rows of (ISBN, title, author, itemType), best matches
+    first. An empty search returns the first page of the catalog ordered by ISBN.
+    Callers that already know the index exists can skip its check with ensure_index=False.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    offset = max(0, int(offset))
+    if ensure_index:
+        ensure_search_index(conn)
+    match = build_match_query(search)
+    if match is None:
+        cur = conn.execute("""
+            SELECT ISBN, title, author, itemType
+            FROM Item
+            ORDER BY ISBN
+            LIMIT ? OFFSET ?
+        """, (limit, offset))
+        return cur.fetchall()
+    cur = conn.execute("""
+        SELECT Item.ISBN, Item.title, Item.author, Item.itemType
+        FROM ItemSearch
+        JOIN Item ON Item.rowid = ItemSearch.rowid
+        WHERE ItemSearch MATCH ?
+        ORDER BY bm25(ItemSearch, ?, ?, ?, ?), Item.rowid
+        LIMIT ? OFFSET ?
+    """, (match,) + RANK_WEIGHTS + (limit, offset))
+    return cur.fetchall()
+
+
+def search_items_page(conn, search, limit=DEFAULT_PAGE_SIZE, after=None, ensure_index=True):
+    """
+    Return one page of search_items() results using keyset pagination.
+
+    Returns (rows, next_after). Pass next_after back as `after` for the following
+    page; it is None on the last page. Unlike an OFFSET, a key makes SQLite skip
+    straight to the next page rather than re-reading the earlier ones. Results are
+    ordered by (rank, rowid), or by ISBN for an empty search, so pages neither
+    overlap nor skip rows while the catalog is unchanged.
+
+    Ranking has to score and sort every match, so a ranked page costs time in
+    proportion to the number of matches, on the first page and on every later one.
+    Searches whose words are all shorter than MIN_RANKED_TOKEN characters, such as
+    "a", match too much for that: they are listed in index (rowid) order instead,
+    which reads only the rows on the page, and their key is the last rowid.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    if ensure_index:
+        ensure_search_index(conn)
+    match = build_match_query(search)
+    if match is not None and max(len(token) for token in re.findall(r"\w+", search)) < MIN_RANKED_TOKEN:
+        cur = conn.execute("""
+            SELECT Item.ISBN, Item.title, Item.author, Item.itemType, ItemSearch.rowid
+            FROM ItemSearch
+            JOIN Item ON Item.rowid = ItemSearch.rowid
+            WHERE ItemSearch MATCH :match AND ItemSearch.rowid > :after
+            ORDER BY ItemSearch.rowid
+            LIMIT :limit
+        """, {"match": match, "after": after or 0, "limit": limit + 1})
+        rows = cur.fetchall()
+        next_after = rows[limit - 1][4] if len(rows) > limit else None
+        return [row[:4] for row in rows[:limit]], next_after
+    if match is None:
+        cur = conn.execute("""
+            SELECT ISBN, title, author, itemType
+            FROM Item
+            WHERE ISBN > :after
+            ORDER BY ISBN
+            LIMIT :limit
+        """, {"after": after or "", "limit": limit + 1})
+        rows = cur.fetchall()
+        next_after = rows[limit - 1][0] if len(rows) > limit else None
+        return rows[:limit], next_after
+    score, rowid = after or (None, None)
+    # The rank is recomputed in WHERE; bm25() gives the same value for the same row
+    # as long as the index has not changed in between.
+    cur = conn.execute("""
+        SELECT Item.ISBN, Item.title, Item.author, Item.itemType,
+               bm25(ItemSearch, :w0, :w1, :w2, :w3) AS score, ItemSearch.rowid
+        FROM ItemSearch
+        JOIN Item ON Item.rowid = ItemSearch.rowid
+        WHERE ItemSearch MATCH :match
+          AND (:score IS NULL
+               OR bm25(ItemSearch, :w0, :w1, :w2, :w3) > :score
+               OR (bm25(ItemSearch, :w0, :w1, :w2, :w3) = :score AND ItemSearch.rowid > :rowid))
+        ORDER BY score, ItemSearch.rowid
+        LIMIT :limit
+    """, {"match": match, "score": score, "rowid": rowid, "limit": limit + 1,
+          "w0": RANK_WEIGHTS[0], "w1": RANK_WEIGHTS[1], "w2": RANK_WEIGHTS[2], "w3": RANK_WEIGHTS[3]})
+    rows = cur.fetchall()
+    next_after = tuple(rows[limit - 1][4:]) if len(rows) > limit else None
+    return [row[:4] for row in rows[:limit]], next_after
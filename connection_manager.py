@@ -0,0 +1,163 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from urllib.parse import quote
+
+from migrations import migrate
+
+# Database used when no path is given. Override with the LIBRARY_DB environment variable.
+DEFAULT_DB_PATH = os.environ.get("LIBRARY_DB", "library.db")
+
+# Settings applied to every connection. WAL lets readers run while a writer commits,
+# and synchronous=NORMAL is durable in WAL mode except for the last commits on power loss.
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "foreign_keys": "ON",
+    "busy_timeout": 5000,         # milliseconds to wait for a lock before "database is locked"
+    "cache_size": -65536,         # negative means KiB, so 64 MiB of page cache
+    "mmap_size": 268435456,       # map up to 256 MiB of the file instead of read() calls
+    "temp_store": "MEMORY",
+}
+
+# Compiled statements each connection keeps, least recently used evicted first. Well
+# above the number of distinct statements the application runs, so none is re-prepared.
+STATEMENT_CACHE_SIZE = 256
+
+# journal_mode is a property of the file and can only be changed by a writer.
+WRITER_ONLY_PRAGMAS = ("journal_mode",)
+
+
+def open_connection(path=DEFAULT_DB_PATH, read_only=False, pragmas=None,
+                    factory=sqlite3.Connection):
+    """
+    Open a tuned connection to the database at `path`.
+
+    `pragmas` overrides entries of DEFAULT_PRAGMAS. A read-only connection is opened
+    with mode=ro, so any write through it fails instead of taking the write lock.
+    `factory` is the sqlite3.Connection subclass to create.
+    """
+    settings = dict(DEFAULT_PRAGMAS)
+    settings.update(pragmas or {})
+    mode = "ro" if read_only else "rwc"
+    uri = "file:%s?mode=%s" % (quote(path), mode)
+    conn = sqlite3.connect(uri, uri=True, timeout=int(settings["busy_timeout"]) / 1000.0,
+                           factory=factory, cached_statements=STATEMENT_CACHE_SIZE)
+    for name, value in settings.items():
+        if read_only and name in WRITER_ONLY_PRAGMAS:
+            continue
+        conn.execute("PRAGMA %s = %s" % (name, value))
+    return conn
+
+
+@contextmanager
+def immediate_transaction(conn):
+    """
+    Run the block inside BEGIN IMMEDIATE, committing on success and rolling back on error.
+
+    IMMEDIATE takes the write lock up front, so two writers cannot both read a row and
+    then fail to upgrade their locks. If `conn` is already in a transaction the block
+    runs in a SAVEPOINT inside it: an error undoes only the block's own writes before
+    propagating, and the caller stays responsible for committing. Blocks therefore nest,
+    so several service calls can be made one unit of work by wrapping them in another.
+    """
+    if conn.in_transaction:
+        conn.execute("SAVEPOINT unit_of_work")
+        try:
+            yield conn
+        except BaseException:
+            # Some errors (SQLITE_FULL, an interrupt) roll back the whole transaction.
+            if conn.in_transaction:
+                conn.execute("ROLLBACK TO unit_of_work")
+                conn.execute("RELEASE unit_of_work")
+            raise
+        conn.execute("RELEASE unit_of_work")
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+
+class ConnectionManager:
+    """
+    Hands out one read-write and one read-only connection per thread.
+
+    Connections are created on first use in a thread and reused for the rest of that
+    thread's life, so callers never pay for reconnecting. The schema is migrated once,
+    the first time a writer is opened. Only file databases are supported, since
+    ":memory:" cannot be shared between connections. `connect` opens each connection
+    and takes the same arguments as open_connection().
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH, pragmas=None, migrate_schema=True,
+                 connect=open_connection):
+        if path == ":memory:":
+            raise ValueError("ConnectionManager needs a database file, not ':memory:'")
+        self.path = path
+        self.pragmas = pragmas
+        self.migrate_schema = migrate_schema
+        self.connect = connect
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._migrated = False
+
+    def _open(self, read_only):
+        conn = self.connect(self.path, read_only=read_only, pragmas=self.pragmas)
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    def writer(self):
+        """Return this thread's read-write connection."""
+        conn = getattr(self._local, "writer", None)
+        if conn is None:
+            conn = self._open(read_only=False)
+            with self._lock:
+                if self.migrate_schema and not self._migrated:
+                    migrate(conn)
+                    self._migrated = True
+            self._local.writer = conn
+        return conn
+
+    def reader(self):
+        """Return this thread's read-only connection."""
+        conn = getattr(self._local, "reader", None)
+        if conn is None:
+            # The file must exist and be migrated before it can be opened read-only.
+            if self.migrate_schema and not self._migrated:
+                self.writer()
+            conn = self._open(read_only=True)
+            self._local.reader = conn
+        return conn
+
+    def close_thread(self):
+        """Close the connections owned by the calling thread."""
+        for role in ("writer", "reader"):
+            conn = getattr(self._local, role, None)
+            if conn is not None:
+                with self._lock:
+                    self._connections.remove(conn)
+                conn.close()
+                setattr(self._local, role, None)
+
+    def close_all(self):
+        """
+        Close every connection the manager has opened.
+
+        Call this from the owning thread at shutdown, after worker threads have exited.
+        """
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.ProgrammingError:
+                # Opened by another thread; sqlite3 will close it when it is collected.
+                pass
+        self._local = threading.local()
@@ -0,0 +1,203 @@
+import argparse
+import datetime
+import os
+import random
+import sqlite3
+import sys
+import time
+from itertools import islice
+
+from migrations import migrate
+
+# Named sizes for generate(). "full" is the production-scale target.
+SCALES = {
+    "tiny": dict(items=2000, members=500, loans=10000, events=200),
+    "small": dict(items=20000, members=5000, loans=100000, events=2000),
+    "medium": dict(items=1000000, members=100000, loans=5000000, events=20000),
+    "full": dict(items=10000000, members=1000000, loans=50000000, events=100000),
+}
+
+# Rows per executemany() call while loading.
+BATCH_SIZE = 50000
+
+ITEM_TYPES = ["Print Book", "Online Book", "Magazine", "Scientific Journal", "CD", "Record", "DVD"]
+WORDS = ("river night garden house winter shadow light stone road city ocean silent empire "
+         "secret last first lost golden broken hidden wild glass iron paper machine dream "
+         "history science music art letters war peace north south kingdom island").split()
+FIRST_NAMES = ("Alice Bob Charlie Diana Edward Fiona George Hannah Ian Jenny Kofi Lena Mateo "
+               "Nadia Omar Priya Quinn Rosa Sven Tara Umar Vera Wei Yusuf Zoe").split()
+LAST_NAMES = ("Smith Johnson Williams Brown Jones Garcia Miller Davis Rodriguez Martinez Chen "
+              "Nguyen Patel Kim Singh Okafor Silva Novak Muller Rossi").split()
+PUBLISHERS = ["Penguin", "Vintage", "Scribner", "Harper", "Nature", "Apple Records", "Warner", "Tor"]
+EVENT_TYPES = ["Book Club", "Film", "Art", "Lecture", "Discussion", "Meetup", "Workshop", "Launch"]
+POSITIONS = ["Librarian", "Assistant Librarian", "Volunteer", "Manager", "Archivist", "IT Support"]
+
+# Loans are spread over this many days before the reference date.
+HISTORY_DAYS = 3650
+# Share of loans still open. Open loans borrowed more than 14 days ago are overdue.
+OPEN_LOAN_RATE = 0.02
+
+
+def isbn_for(n):
+    """Return the synthetic ISBN of item number `n`."""
+    return "979%010d" % n
+
+
+def _batches(rows, size=BATCH_SIZE):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _load(conn, sql, rows):
+    count = 0
+    for batch in _batches(rows):
+        conn.executemany(sql, batch)
+        count += len(batch)
+    return count
+
+
+def generate(path, items, members, loans, events, copies_per_item=2, rooms=50,
+             personnel=200, seed=1, today=None, progress=None):
+    """
+    Create a synthetic library database at `path` (which must not exist).
+
+    The same seed always produces the same data. Rows are streamed in batches of
+    BATCH_SIZE, so memory stays flat at any scale, and the schema's secondary indexes
+    and the search index are built once after loading rather than maintained row by
+    row. Returns a dict of row counts per table.
+    """
+    if os.path.exists(path):
+        raise FileExistsError(path)
+    rng = random.Random(seed)
+    today = today or datetime.date.today()
+    copies = items * copies_per_item
+    conn = sqlite3.connect(path, isolation_level=None)
+    # The file is thrown away if loading fails, so skip the journal and fsyncs.
+    conn.executescript("""
+        PRAGMA journal_mode = OFF;
+        PRAGMA synchronous = OFF;
+        PRAGMA cache_size = -262144;
+        PRAGMA temp_store = MEMORY;
+    """)
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "db.sql")) as f:
+        conn.executescript(f.read())
+    # Every generated key points at a row that exists, so FK checks would only cost time.
+    conn.execute("PRAGMA foreign_keys = OFF")
+    counts = {}
+
+    def step(name, sql, rows):
+        started = time.perf_counter()
+        conn.execute("BEGIN")
+        counts[name] = _load(conn, sql, rows)
+        conn.execute("COMMIT")
+        if progress:
+            progress(f"{name}: {counts[name]} rows in {time.perf_counter() - started:.1f}s")
+
+    def day(offset):
+        return (today - datetime.timedelta(days=offset)).isoformat()
+
+    step("Room", "INSERT INTO Room VALUES (?, ?)",
+         (("R%03d" % n, rng.randint(10, 200)) for n in range(1, rooms + 1)))
+    step("Personnel", "INSERT INTO Personnel VALUES (?, ?, ?, ?, ?)",
+         ((n, POSITIONS[0] if n <= rooms else rng.choice(POSITIONS), day(rng.randint(30, 9000)),
+           rng.choice([0, 35000, 45000, 55000]), "R%03d" % ((n - 1) % rooms + 1))
+          for n in range(1, personnel + 1)))
+    step("Member", "INSERT INTO Member VALUES (?, ?, ?, ?)",
+         ((n, rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), day(rng.randint(6000, 30000)))
+          for n in range(1, members + 1)))
+    step("Item", "INSERT INTO Item VALUES (?, ?, ?, ?, ?, ?)",
+         ((isbn_for(n), rng.choice(ITEM_TYPES),
+           " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))).title(),
+           "%s %s" % (rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)),
+           day(rng.randint(100, 30000)), rng.choice(PUBLISHERS))
+          for n in range(1, items + 1)))
+    step("Inventory", "INSERT INTO Inventory VALUES (?, ?, 1, ?, ?, ?, ?)",
+         ((n, isbn_for((n - 1) // copies_per_item + 1), "%s%d" % (chr(65 + n % 26), n % 50),
+           day(rng.randint(0, 5000)), rng.choice(["New", "Good", "Fair", "Worn"]),
+           rng.choice(["Amazon", "Donated", "Vendor"]))
+          for n in range(1, copies + 1)))
+
+    # Open loans go to distinct copies, one per copy; closed loans may reuse any copy.
+    open_loans = min(int(loans * OPEN_LOAN_RATE), copies)
+    open_copies = rng.sample(range(1, copies + 1), open_loans)
+
+    def loan_rows():
+        for n in range(1, loans + 1):
+            member = rng.randint(1, members)
+            if n <= open_loans:
+                borrowed = rng.randint(0, 40)
+                yield (n, open_copies[n - 1], member, day(borrowed), day(borrowed - 14), None)
+            else:
+                borrowed = rng.randint(25, HISTORY_DAYS)
+                returned = borrowed - rng.randint(1, 21)
+                yield (n, rng.randint(1, copies), member, day(borrowed), day(borrowed - 14), day(returned))
+
+    # The insert trigger adds fines for open overdue loans as it would in production.
+    step("Activity", "INSERT INTO Activity VALUES (?, ?, ?, ?, ?, ?)", loan_rows())
+    # Late returns get the fine adjust_fine_after_return would have set; 70% are paid.
+    started = time.perf_counter()
+    conn.execute("""
+        INSERT OR REPLACE INTO Fine (loanID, amount, paymentDate)
+        SELECT loanID, julianday(returnDate) - julianday(dueDate),
+               CASE WHEN loanID % 10 < 7 THEN date(returnDate, '+3 days') END
+        FROM Activity
+        WHERE returnDate > dueDate
+    """)
+    counts["Fine"] = conn.execute("SELECT COUNT(*) FROM Fine").fetchone()[0]
+    if progress:
+        progress(f"Fine: {counts['Fine']} rows in {time.perf_counter() - started:.1f}s")
+    conn.execute("BEGIN")
+    _load(conn, "UPDATE Inventory SET Available = 0 WHERE copyID = ?",
+          ((copy_id,) for copy_id in open_copies))
+    conn.execute("COMMIT")
+    step("Event", "INSERT INTO Event VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+         _event_rows(rng, events, rooms, personnel, today))
+
+    started = time.perf_counter()
+    conn.isolation_level = ""
+    migrate(conn)
+    conn.execute("ANALYZE")
+    conn.commit()
+    if progress:
+        progress(f"indexes and migrations in {time.perf_counter() - started:.1f}s")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.close()
+    return counts
+
+
+def _event_rows(rng, events, rooms, personnel, today):
+    for n in range(1, events + 1):
+        start = today + datetime.timedelta(days=rng.randint(-365, 365))
+        hour = rng.randint(9, 19)
+        yield (n, start.isoformat(), start.isoformat(), "%02d:00" % hour, "%02d:00" % (hour + 2),
+               rng.randint(0, 10), "R%03d" % rng.randint(1, rooms),
+               "%s %s" % (rng.choice(WORDS).title(), rng.choice(EVENT_TYPES)),
+               rng.choice(EVENT_TYPES), rng.randint(1, personnel))
+
+
+def main(argv=None):
+    """Command-line entry point: python datagen.py PATH [--scale NAME] [--items N] ..."""
+    parser = argparse.ArgumentParser(description="Generate a synthetic library database.")
+    parser.add_argument("path")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--items", type=int)
+    parser.add_argument("--members", type=int)
+    parser.add_argument("--loans", type=int)
+    parser.add_argument("--events", type=int)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+    sizes = dict(SCALES[args.scale])
+    for name in sizes:
+        if getattr(args, name) is not None:
+            sizes[name] = getattr(args, name)
+    started = time.perf_counter()
+    counts = generate(args.path, seed=args.seed, progress=print, **sizes)
+    print(f"Generated {args.path} in {time.perf_counter() - started:.1f}s: {counts}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+import argparse
+import sys
+import time
+from collections import namedtuple
+
+from connection_manager import DEFAULT_DB_PATH, immediate_transaction, open_connection
+from migrations import migrate
+
+# Loans refreshed per transaction. Each chunk holds the write lock only for as long
+# as it takes to upsert this many fines, so kiosks can commit between chunks.
+DEFAULT_CHUNK_SIZE = 5000
+
+# Summary of one accrual run. `scanned` counts open overdue loans visited and
+# `changed` the fines inserted or updated; unchanged fines are not rewritten.
+AccrualStats = namedtuple("AccrualStats", "today scanned changed chunks seconds skipped")
+
+
+def rows_per_second(stats):
+    """Return the number of loans processed per second in an accrual run."""
+    return stats.scanned / stats.seconds if stats.seconds else 0.0
+
+
+def last_run_date(conn):
+    """Return the date of the last completed accrual run, or None."""
+    cur = conn.execute("SELECT MAX(runDate) FROM FineAccrualRun")
+    return cur.fetchone()[0]
+
+
+def accrue_fines(conn, today=None, chunk_size=DEFAULT_CHUNK_SIZE, force=False):
+    """
+    Bring the fines of all open overdue loans up to date.
+
+    Uses the same rule as the insert_fine_for_overdue_loan trigger in db.sql: a loan
+    still out after its dueDate owes one unit per day overdue and the fine is unpaid.
+    `today` defaults to SQLite's date('now') so the result matches the triggers exactly.
+
+    Loans are walked in (dueDate, loanID) order over the open-loan index, `chunk_size`
+    at a time, each chunk in its own transaction. Fines whose amount is already correct
+    and still unpaid are left alone; a paid fine on a loan that is still out is reset to
+    unpaid, as the trigger's INSERT OR REPLACE would. A run is skipped entirely if one
+    already finished for `today` unless `force` is set. Returns an AccrualStats.
+    """
+    if today is None:
+        today = conn.execute("SELECT date('now')").fetchone()[0]
+    today = str(today)
+    started = time.perf_counter()
+    if not force and last_run_date(conn) == today:
+        return AccrualStats(today, 0, 0, 0, 0.0, True)
+
+    scanned = changed = chunks = 0
+    after = ("", 0)
+    while True:
+        with immediate_transaction(conn):
+            keys = conn.execute("""
+                SELECT dueDate, loanID FROM Activity
+                WHERE returnDate IS NULL AND dueDate < :today
+                  AND (dueDate, loanID) > (:after_due, :after_loan)
+                ORDER BY dueDate, loanID
+                LIMIT :chunk_size
+            """, {"today": today, "after_due": after[0], "after_loan": after[1],
+                  "chunk_size": chunk_size}).fetchall()
+            if not keys:
+                conn.execute("""
+                    INSERT OR REPLACE INTO FineAccrualRun (runDate, loansScanned, finesChanged)
+                    VALUES (?, ?, ?)
+                """, (today, scanned, changed))
+                break
+            last = keys[-1]
+            cur = conn.execute("""
+                INSERT INTO Fine (loanID, amount, paymentDate)
+                SELECT loanID, (julianday(:today) - julianday(dueDate)) * 1.0, NULL
+                FROM Activity
+                WHERE returnDate IS NULL AND dueDate < :today
+                  AND (dueDate, loanID) > (:after_due, :after_loan)
+                  AND (dueDate, loanID) <= (:last_due, :last_loan)
+                ON CONFLICT (loanID) DO UPDATE
+                    SET amount = excluded.amount, paymentDate = NULL
+                    WHERE Fine.amount IS NOT excluded.amount OR Fine.paymentDate IS NOT NULL
+            """, {"today": today, "after_due": after[0], "after_loan": after[1],
+                  "last_due": last[0], "last_loan": last[1]})
+            scanned += len(keys)
+            changed += cur.rowcount
+            chunks += 1
+            after = last
+    return AccrualStats(today, scanned, changed, chunks, time.perf_counter() - started, False)
+
+
+def main(argv=None):
+    """Command-line entry point: python fines.py [database] [--today DATE] [--chunk-size N]."""
+    parser = argparse.ArgumentParser(description="Recompute fines for open overdue loans.")
+    parser.add_argument("database", nargs="?", default=DEFAULT_DB_PATH)
+    parser.add_argument("--today", help="accrue as of this date (YYYY-MM-DD); defaults to date('now')")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--force", action="store_true", help="run even if already run for this date")
+    args = parser.parse_args(argv)
+    conn = open_connection(args.database)
+    migrate(conn)
+    stats = accrue_fines(conn, today=args.today, chunk_size=args.chunk_size, force=args.force)
+    conn.close()
+    if stats.skipped:
+        print(f"Fines already accrued for {stats.today}; use --force to run again.")
+    else:
+        print(f"Accrued fines as of {stats.today}: {stats.scanned} overdue loans, "
+              f"{stats.changed} fines changed in {stats.chunks} chunks, "
+              f"{stats.seconds:.3f}s ({rows_per_second(stats):.0f} rows/sec)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+import queue
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+
+from connection_manager import immediate_transaction
+
+# How long the writer waits for more operations after the first one arrives, and the
+# most it puts in one transaction. A few milliseconds is enough for concurrent callers
+# to pile up; the wait is skipped once max_batch operations are queued.
+DEFAULT_WINDOW = 0.002
+DEFAULT_MAX_BATCH = 256
+
+# Totals since the committer started: operations run, groups committed, and groups
+# whose BEGIN or COMMIT failed.
+GroupCommitStats = namedtuple("GroupCommitStats", "operations batches failed")
+
+_STOP = object()
+
+
+class CommitterClosedError(RuntimeError):
+    """The committer was closed, or its writer thread stopped, before the operation ran."""
+
+
+def _fail(future, error):
+    # A future still pending is moved to running first; cancelled ones are left alone.
+    if future.done():
+        return
+    if future.running() or future.set_running_or_notify_cancel():
+        future.set_exception(error)
+
+
+class GroupCommitter:
+    """
+    Runs write operations from many threads on one connection, committing them in groups.
+
+    submit(operation) queues operation(conn) and returns a concurrent.futures.Future.
+    A single writer thread takes the first queued operation, collects whatever else
+    arrives within `window` seconds (up to `max_batch`), then runs the group in one
+    BEGIN IMMEDIATE transaction and commits once, so the commit and its fsync are paid
+    once per group instead of once per caller.
+
+    Each operation runs in its own savepoint (connection_manager.immediate_transaction),
+    so one that raises is rolled back alone and its future gets the exception while
+    the rest of the group still commits. Futures are resolved only after COMMIT has
+    returned: a caller never sees success for work that a crash could still lose, and
+    a crash mid-group loses the whole group, which SQLite's journal rolls back on the
+    next open. `connect` is called on the writer thread to open its connection.
+
+    If the writer thread dies (an operation raising a BaseException such as
+    KeyboardInterrupt, or a failed rollback), every operation still waiting gets a
+    CommitterClosedError and later submit() calls raise it, so no caller waits forever.
+    """
+
+    def __init__(self, connect, window=DEFAULT_WINDOW, max_batch=DEFAULT_MAX_BATCH):
+        self.window = window
+        self.max_batch = max_batch
+        self._connect = connect
+        self._queue = queue.Queue()
+        # Guards _closed, so nothing is queued once the writer has drained the queue.
+        self._lock = threading.Lock()
+        self._closed = False
+        self._operations = self._batches = self._failed = 0
+        self._ready = threading.Event()
+        self._error = None
+        self._thread = threading.Thread(target=self._writer, name="group-commit", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._error is not None:
+            raise self._error
+
+    def submit(self, operation):
+        """
+        Queue operation(conn) for the next group. Returns a Future for its result.
+
+        Raises CommitterClosedError after close() or once the writer thread has stopped.
+        """
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise CommitterClosedError("the group committer is closed")
+            self._queue.put((future, operation))
+        return future
+
+    def call(self, operation, timeout=None):
+        """Run operation(conn) in the next group and return its result (or raise its error)."""
+        return self.submit(operation).result(timeout)
+
+    def stats(self):
+        """Return the GroupCommitStats so far."""
+        return GroupCommitStats(self._operations, self._batches, self._failed)
+
+    def close(self):
+        """Commit whatever is queued, stop the writer thread and close its connection."""
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                self._queue.put(_STOP)
+        self._thread.join()
+
+    def _writer(self):
+        try:
+            conn = self._connect()
+        except Exception as e:
+            self._error = e
+            self._ready.set()
+            return
+        self._ready.set()
+        batch = []
+        try:
+            stopping = False
+            while not stopping:
+                first = self._queue.get()
+                if first is _STOP:
+                    break
+                batch = [first]
+                deadline = time.monotonic() + self.window
+                while len(batch) < self.max_batch:
+                    try:
+                        remaining = deadline - time.monotonic()
+                        item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    batch.append(item)
+                self._run(conn, batch)
+                batch = []
+        finally:
+            with self._lock:
+                self._closed = True
+            # Only reached with work left over when the thread is dying.
+            error = CommitterClosedError("the group committer stopped before committing this operation")
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not _STOP:
+                    batch.append(item)
+            for future, operation in batch:
+                _fail(future, error)
+            conn.close()
+
+    def _run(self, conn, batch):
+        outcomes = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for future, operation in batch:
+                # A caller that timed out and cancelled its future is skipped.
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    with immediate_transaction(conn):
+                        outcomes.append((future, operation(conn), None))
+                except Exception as e:
+                    outcomes.append((future, None, e))
+            conn.commit()
+        except BaseException as e:
+            # BEGIN or COMMIT failed: nothing in the group was written.
+            if conn.in_transaction:
+                conn.rollback()
+            self._failed += 1
+            for future, operation in batch:
+                _fail(future, e)
+            if not isinstance(e, Exception):
+                raise
+            return
+        self._batches += 1
+        self._operations += len(outcomes)
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
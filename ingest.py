@@ -0,0 +1,272 @@
+import argparse
+import csv
+import datetime
+import json
+import os
+import re
+import sys
+import time
+from collections import namedtuple
+from itertools import islice
+
+from connection_manager import DEFAULT_DB_PATH, immediate_transaction, open_connection
+from library_service import LibraryService
+from migrations import migrate
+
+# Feed rows committed per transaction. Memory grows with the batch, never with the file.
+DEFAULT_BATCH_SIZE = 10000
+
+# Most copies one feed row may add; a larger count is almost always a typo.
+MAX_COPIES_PER_ROW = 1000
+
+# Source recorded on copies whose row does not name one.
+DEFAULT_SOURCE = "Purchased"
+
+# Feed columns, matched case-insensitively, and the column each one loads into.
+ITEM_FIELDS = ("itemType", "title", "author", "publishDate", "Publisher")
+COPY_FIELDS = ("shelfNumber", "physicalCondition", "acquisitionDate", "Source")
+COLUMNS = {name.lower(): name for name in ("ISBN", "copies") + ITEM_FIELDS + COPY_FIELDS}
+
+ISBN_PATTERN = re.compile(r"\d{9}[\dX]|\d{13}")
+
+# Summary of one ingest run. `rows` counts feed rows read, including rejected ones;
+# `items_updated` only counts catalog entries whose details actually changed.
+IngestStats = namedtuple("IngestStats", "rows items_added items_updated copies rejected batches seconds")
+
+# Sets each detail the feed provides and leaves the rest alone. Rows whose details
+# are unchanged are not rewritten, so the search index and cache triggers stay quiet.
+UPSERT_ITEM_SQL = """
+    INSERT INTO Item (ISBN, itemType, title, author, publishDate, Publisher)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (ISBN) DO UPDATE SET
+        itemType = COALESCE(excluded.itemType, itemType),
+        title = COALESCE(excluded.title, title),
+        author = COALESCE(excluded.author, author),
+        publishDate = COALESCE(excluded.publishDate, publishDate),
+        Publisher = COALESCE(excluded.Publisher, Publisher)
+    WHERE (COALESCE(excluded.itemType, itemType), COALESCE(excluded.title, title),
+           COALESCE(excluded.author, author), COALESCE(excluded.publishDate, publishDate),
+           COALESCE(excluded.Publisher, Publisher))
+       IS NOT (itemType, title, author, publishDate, Publisher)
+"""
+
+INSERT_COPY_SQL = """
+    INSERT INTO Inventory (ISBN, Available, shelfNumber, acquisitionDate, physicalCondition, Source)
+    VALUES (?, 1, ?, ?, ?, ?)
+"""
+
+EXISTING_ISBNS_SQL = "SELECT ISBN FROM Item WHERE ISBN IN (SELECT value FROM json_each(?))"
+
+# Copies appended after copyID ? whose title has members waiting for it. New copies get
+# the next rowids, so this only reads the batch just inserted.
+LAST_COPY_SQL = "SELECT max(copyID) FROM Inventory"
+NEW_COPIES_WANTED_SQL = """
+    SELECT copyID FROM Inventory
+    WHERE copyID > ?
+      AND EXISTS (SELECT 1 FROM Hold WHERE Hold.ISBN = Inventory.ISBN AND Hold.status = 'waiting')
+    ORDER BY copyID
+"""
+
+
+class RejectedRow(ValueError):
+    """A feed row that cannot be loaded; the message says why."""
+
+
+def rows_per_second(stats):
+    """Return the number of feed rows processed per second in an ingest run."""
+    return stats.rows / stats.seconds if stats.seconds else 0.0
+
+
+def read_feed(f, fmt):
+    """
+    Yield (line number, row dict) for every record of an open feed file.
+
+    `fmt` is "csv" (with a header row) or "jsonl" (one JSON object per line). A JSON
+    line that does not parse is yielded as a RejectedRow instead of a dict.
+    """
+    if fmt == "csv":
+        reader = csv.DictReader(f)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == "jsonl":
+        for lineno, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield lineno, RejectedRow(f"invalid JSON: {e}")
+                continue
+            if not isinstance(row, dict):
+                row = RejectedRow("expected a JSON object")
+            yield lineno, row
+    else:
+        raise ValueError(f"unknown feed format {fmt!r}")
+
+
+def format_for(path):
+    """Guess the feed format from a file name."""
+    return "jsonl" if path.lower().endswith((".jsonl", ".ndjson", ".json")) else "csv"
+
+
+def _date(value, field):
+    try:
+        return datetime.date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise RejectedRow(f"{field} must be a YYYY-MM-DD date, got {value!r}")
+
+
+def parse_row(row, today):
+    """
+    Validate one feed row and return (isbn, item details, copy, copies).
+
+    Item details are a dict of the ITEM_FIELDS the row provides. `copy` is the
+    (shelfNumber, acquisitionDate, physicalCondition, Source) of each of the `copies`
+    copies to add. Raises RejectedRow if the row cannot be loaded.
+    """
+    if isinstance(row, RejectedRow):
+        raise row
+    values = {}
+    for key, value in row.items():
+        column = COLUMNS.get(str(key).strip().lower())
+        if column is None or value is None:
+            continue
+        value = str(value).strip()
+        if value:
+            values[column] = value
+    isbn = re.sub(r"[\s-]", "", values.get("ISBN", "")).upper()
+    if not ISBN_PATTERN.fullmatch(isbn):
+        raise RejectedRow(f"invalid ISBN {values.get('ISBN', '')!r}")
+    details = {field: values[field] for field in ITEM_FIELDS if field in values}
+    if "publishDate" in details:
+        details["publishDate"] = _date(details["publishDate"], "publishDate")
+    try:
+        copies = int(values.get("copies", 1))
+    except ValueError:
+        raise RejectedRow(f"copies must be a whole number, got {values['copies']!r}")
+    if not 0 <= copies <= MAX_COPIES_PER_ROW:
+        raise RejectedRow(f"copies must be between 0 and {MAX_COPIES_PER_ROW}, got {copies}")
+    acquired = _date(values["acquisitionDate"], "acquisitionDate") if "acquisitionDate" in values else today
+    copy = (values.get("shelfNumber"), acquired, values.get("physicalCondition"),
+            values.get("Source", DEFAULT_SOURCE))
+    return isbn, details, copy, copies
+
+
+def _batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def ingest(conn, rows, batch_size=DEFAULT_BATCH_SIZE, rejects=None, defer_foreign_keys=False,
+           today=None):
+    """
+    Load a stream of feed rows into the catalog and inventory.
+
+    `rows` yields (line number, row dict) pairs, e.g. from read_feed(). Each batch of
+    `batch_size` rows is one transaction: ISBNs repeated within the batch are merged in
+    memory (later details win, copies add up), their catalog entries are upserted with
+    one executemany() and the new copies appended with another. A row for an ISBN that
+    is neither in the catalog nor given a title is rejected, as is any row that fails
+    parse_row(); `rejects(lineno, row, reason)` is called for each. With
+    `defer_foreign_keys`, foreign keys are checked once per batch at commit instead of
+    per statement. New copies of titles with waiting holds are set aside for those
+    holds (LibraryService.offer_new_copies) in the same transaction, so they never sit
+    on the shelf in front of the queue. Returns an IngestStats.
+    """
+    today = today or datetime.date.today()
+    acquired = today.isoformat()
+    service = None
+    started = time.perf_counter()
+    total = added = updated = copies_added = rejected = batches = 0
+
+    def reject(lineno, row, reason):
+        nonlocal rejected
+        rejected += 1
+        if rejects:
+            rejects(lineno, row, reason)
+
+    for batch in _batches(rows, batch_size):
+        total += len(batch)
+        items = {}      # isbn -> merged details, in first-seen order
+        copies = []     # (isbn, copy, count, lineno, row)
+        for lineno, row in batch:
+            try:
+                isbn, details, copy, count = parse_row(row, acquired)
+            except RejectedRow as e:
+                reject(lineno, row, str(e))
+                continue
+            items.setdefault(isbn, {}).update(details)
+            copies.append((isbn, copy, count, lineno, row))
+        with immediate_transaction(conn):
+            if defer_foreign_keys:
+                # Reset by SQLite at the end of every transaction.
+                conn.execute("PRAGMA defer_foreign_keys = ON")
+            existing = {row[0] for row in conn.execute(EXISTING_ISBNS_SQL, (json.dumps(list(items)),))}
+            loadable = {isbn for isbn, details in items.items()
+                        if isbn in existing or details.get("title")}
+            new = loadable - existing
+            cur = conn.executemany(UPSERT_ITEM_SQL, [
+                (isbn,) + tuple(details.get(field) for field in ITEM_FIELDS)
+                for isbn, details in items.items() if isbn in loadable and details])
+            added += len(new)
+            updated += max(cur.rowcount, 0) - len(new)
+            inventory = []
+            for isbn, copy, count, lineno, row in copies:
+                if isbn not in loadable:
+                    reject(lineno, row, f"ISBN {isbn} is not in the catalog and the row has no title")
+                    continue
+                inventory.extend([(isbn,) + copy] * count)
+            last_copy = conn.execute(LAST_COPY_SQL).fetchone()[0] or 0
+            conn.executemany(INSERT_COPY_SQL, inventory)
+            copies_added += len(inventory)
+            wanted = [row[0] for row in conn.execute(NEW_COPIES_WANTED_SQL, (last_copy,))]
+            if wanted:
+                service = service or LibraryService(conn)
+                service.offer_new_copies(wanted, today)
+        batches += 1
+    return IngestStats(total, added, updated, copies_added, rejected, batches,
+                       time.perf_counter() - started)
+
+
+def reject_writer(f):
+    """Return a rejects callback for ingest() that writes JSON Lines to the open file `f`."""
+    def write(lineno, row, reason):
+        if isinstance(row, RejectedRow):
+            row = None
+        f.write(json.dumps({"line": lineno, "error": reason, "row": row}) + "\n")
+    return write
+
+
+def main(argv=None):
+    """Command-line entry point: python ingest.py FEED [database] [--rejects PATH] ..."""
+    parser = argparse.ArgumentParser(description="Load a vendor feed of titles and copies.")
+    parser.add_argument("feed", help="CSV file with a header row, or JSON Lines (.jsonl)")
+    parser.add_argument("database", nargs="?", default=DEFAULT_DB_PATH)
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="defaults to the feed's extension")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--rejects", help="write rejected rows here (default FEED.rejects.jsonl)")
+    parser.add_argument("--defer-foreign-keys", action="store_true",
+                        help="check foreign keys once per batch at commit")
+    args = parser.parse_args(argv)
+    rejects_path = args.rejects or os.path.splitext(args.feed)[0] + ".rejects.jsonl"
+    conn = open_connection(args.database)
+    migrate(conn)
+    with open(args.feed, newline="", encoding="utf-8") as feed, \
+            open(rejects_path, "w", encoding="utf-8") as rejects:
+        stats = ingest(conn, read_feed(feed, args.format or format_for(args.feed)),
+                       batch_size=args.batch_size, rejects=reject_writer(rejects),
+                       defer_foreign_keys=args.defer_foreign_keys)
+    conn.close()
+    print(f"Ingested {stats.rows} rows in {stats.batches} batches: {stats.items_added} titles added, "
+          f"{stats.items_updated} updated, {stats.copies} copies added, {stats.rejected} rejected, "
+          f"{stats.seconds:.3f}s ({rows_per_second(stats):.0f} rows/sec)")
+    if stats.rejected:
+        print(f"Rejected rows written to {rejects_path}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,395 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from collections import deque, namedtuple
+from contextlib import contextmanager
+
+from connection_manager import open_connection
+
+# Upper bounds, in seconds, of the latency histogram buckets.
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+# Statements slower than this many seconds go to the slow-query log.
+DEFAULT_SLOW_THRESHOLD = 0.05
+
+# Operation label used for statements run outside Metrics.operation().
+NO_OPERATION = "-"
+
+# Statement texts whose normalized form is remembered, in case callers build SQL dynamically.
+MAX_NORMALIZED = 10000
+
+# One entry of the slow-query log. `plan` is the EXPLAIN QUERY PLAN detail lines.
+SlowQuery = namedtuple("SlowQuery", "operation sql seconds rows trigger_rows plan at")
+
+# Finds the table and kind of change of an INSERT, UPDATE or DELETE.
+DML_TARGET = re.compile(r"^\s*(?:(INSERT|REPLACE)(?:\s+OR\s+\w+)?\s+INTO|(UPDATE)(?:\s+OR\s+\w+)?"
+                        r"|(DELETE)\s+FROM)\s+[\"\[`]?(\w+)", re.IGNORECASE)
+
+
+def normalize_sql(sql):
+    """Collapse whitespace so the same statement always gets the same key."""
+    return re.sub(r"\s+", " ", sql).strip()
+
+
+def trigger_events(conn):
+    """Return {(table in lower case, "INSERT" | "UPDATE" | "DELETE"): trigger names} for `conn`."""
+    events = {}
+    rows = sqlite3.Connection.execute(conn, "SELECT name, tbl_name, sql FROM sqlite_master WHERE type = 'trigger'")
+    for name, table, text in rows:
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            if re.search(r"\b%s\b" % event, text.split(" ON ", 1)[0], re.IGNORECASE):
+                events.setdefault((table.lower(), event), []).append(name)
+    return {key: tuple(sorted(names)) for key, names in events.items()}
+
+
+def triggers_for(conn, sql, events=None):
+    """
+    Return the names of the triggers that can fire for the INSERT, UPDATE or DELETE `sql`.
+
+    `events` is a trigger_events() result to use instead of reading `conn`'s schema.
+    """
+    match = DML_TARGET.match(sql)
+    if not match:
+        return ()
+    event = "INSERT" if match.group(1) else (match.group(2) or match.group(3)).upper()
+    if events is None:
+        events = trigger_events(conn)
+    return events.get((match.group(4).lower(), event), ())
+
+
+class StatementStats:
+    """Running totals for one statement within one operation."""
+
+    __slots__ = ("calls", "seconds", "rows", "trigger_rows", "slow", "triggers")
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.rows = 0
+        self.trigger_rows = 0
+        self.slow = 0
+        self.triggers = None
+
+
+class Metrics:
+    """
+    Collects per-statement latency, row counts and trigger activity.
+
+    Statistics are keyed by (operation, statement), where the operation is the label
+    set with the operation() context manager on the calling thread, e.g. "find_item".
+    Statements slower than `slow_threshold` seconds are kept, with their query plan,
+    in a slow-query log of the last `slow_log_size` entries. All methods are thread-safe.
+    """
+
+    def __init__(self, slow_threshold=DEFAULT_SLOW_THRESHOLD, slow_log_size=100):
+        self.slow_threshold = slow_threshold
+        self.slow_log = deque(maxlen=slow_log_size)
+        self._stats = {}
+        self._histograms = {}
+        self._normalized = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def operation(self, name):
+        """Attribute statements run by this thread inside the block to `name`."""
+        previous = getattr(self._local, "operation", NO_OPERATION)
+        self._local.operation = name
+        try:
+            yield
+        finally:
+            self._local.operation = previous
+
+    def current_operation(self):
+        return getattr(self._local, "operation", NO_OPERATION)
+
+    def connect(self, path, read_only=False, pragmas=None):
+        """
+        Open a tuned connection whose statements are recorded here.
+
+        Has the same signature as connection_manager.open_connection, so it can be
+        passed to ConnectionManager(connect=...).
+        """
+        conn = open_connection(path, read_only=read_only, pragmas=pragmas,
+                               factory=InstrumentedConnection)
+        conn.metrics = self
+        return conn
+
+    def record(self, sql, seconds, rows, trigger_rows, conn=None, params=()):
+        """
+        Add one execution of `sql` and return its StatementStats.
+
+        Rows fetched later are added with add_fetched(). Statements over the slow-query
+        threshold are logged with their query plan, which needs `conn` and `params`.
+        """
+        operation = self.current_operation()
+        # Statements are mostly module constants, so normalizing once per string is enough.
+        normalized = self._normalized.get(sql)
+        if normalized is None:
+            if len(self._normalized) >= MAX_NORMALIZED:
+                self._normalized.clear()
+            normalized = self._normalized[sql] = normalize_sql(sql)
+        key = (operation, normalized)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = StatementStats()
+                self._histograms.setdefault(operation, [0] * (len(LATENCY_BUCKETS) + 1))
+            stats.calls += 1
+            stats.seconds += seconds
+            stats.rows += rows
+            stats.trigger_rows += trigger_rows
+            self._histograms[operation][bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        if trigger_rows and stats.triggers is None and conn is not None:
+            stats.triggers = triggers_for(conn, sql)
+        if seconds >= self.slow_threshold:
+            self._log_slow(stats, operation, normalized, seconds, rows, trigger_rows, conn, params)
+        return stats
+
+    def add_fetched(self, stats, rows, seconds):
+        """Add rows fetched from a statement, and the time spent fetching them."""
+        with self._lock:
+            stats.rows += rows
+            stats.seconds += seconds
+
+    def _log_slow(self, stats, operation, sql, seconds, rows, trigger_rows, conn, params):
+        with self._lock:
+            stats.slow += 1
+        plan = explain(conn, sql, params) if conn is not None else []
+        self.slow_log.append(SlowQuery(operation, sql, seconds, rows, trigger_rows, plan, time.time()))
+
+    def snapshot(self):
+        """Return {(operation, sql): (calls, seconds, rows, trigger_rows, slow, triggers)}."""
+        with self._lock:
+            return {key: (s.calls, s.seconds, s.rows, s.trigger_rows, s.slow, s.triggers or ())
+                    for key, s in self._stats.items()}
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._histograms.clear()
+        self.slow_log.clear()
+
+    def export_text(self):
+        """Return a human-readable report, most expensive statements first."""
+        lines = []
+        rows = sorted(self.snapshot().items(), key=lambda item: -item[1][1])
+        for (operation, sql), (calls, seconds, fetched, trigger_rows, slow, triggers) in rows:
+            lines.append(f"{operation:16} {calls:8d} calls {seconds * 1000:10.3f} ms "
+                         f"{seconds / calls * 1e6:9.1f} us/call {fetched:9d} rows "
+                         f"{slow:4d} slow  {sql[:100]}")
+            if trigger_rows:
+                lines.append(f"{'':16} {trigger_rows:8d} rows written by triggers: {', '.join(triggers)}")
+        if self.slow_log:
+            lines.append("")
+            lines.append("Slow queries:")
+            for entry in list(self.slow_log):
+                lines.append(f"  {entry.seconds * 1000:.1f} ms [{entry.operation}] {entry.sql[:200]}")
+                for detail in entry.plan:
+                    lines.append(f"      {detail}")
+        return "\n".join(lines) + "\n"
+
+    def export_prometheus(self):
+        """Return the metrics in the Prometheus text exposition format."""
+        def label(value):
+            return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+        snapshot = sorted(self.snapshot().items())
+        lines = []
+        series = [
+            ("library_sql_statements_total", "Statements executed.", 0),
+            ("library_sql_seconds_total", "Time spent executing and fetching.", 1),
+            ("library_sql_rows_total", "Rows returned or changed.", 2),
+            ("library_sql_trigger_rows_total", "Rows written by triggers.", 3),
+            ("library_sql_slow_total", "Statements over the slow-query threshold.", 4),
+        ]
+        for name, help_text, index in series:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for (operation, sql), values in snapshot:
+                lines.append(f'{name}{{operation="{label(operation)}",statement="{label(sql)}"}} '
+                             f"{values[index]}")
+        name = "library_sql_statement_seconds"
+        lines.append(f"# HELP {name} Statement latency per operation, excluding fetches.")
+        lines.append(f"# TYPE {name} histogram")
+        with self._lock:
+            histograms = sorted((op, list(counts)) for op, counts in self._histograms.items())
+        for operation, counts in histograms:
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + (None,), counts):
+                cumulative += count
+                le = "+Inf" if bound is None else repr(bound)
+                lines.append(f'{name}_bucket{{operation="{label(operation)}",le="{le}"}} {cumulative}')
+            lines.append(f'{name}_count{{operation="{label(operation)}"}} {cumulative}')
+        return "\n".join(lines) + "\n"
+
+
+def explain(conn, sql, params=()):
+    """Return the EXPLAIN QUERY PLAN detail lines for `sql`, or [] if it cannot be explained."""
+    try:
+        cur = sqlite3.Connection.execute(conn, "EXPLAIN QUERY PLAN " + sql, params)
+        return [row[3] for row in cur]
+    except (sqlite3.Error, ValueError):
+        return []
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """
+    Cursor that reports each statement's latency and rows to the connection's Metrics.
+
+    Rows fetched by iteration or fetchmany() are counted locally and handed over once
+    the result set is exhausted, or when the cursor runs its next statement.
+    """
+
+    _stats = None
+    _fetched = 0
+    _fetch_seconds = 0.0
+
+    def execute(self, sql, parameters=()):
+        conn = self.connection
+        metrics = conn.metrics
+        if metrics is None:
+            return super().execute(sql, parameters)
+        self._flush()
+        changes = conn.total_changes
+        started = time.perf_counter()
+        super().execute(sql, parameters)
+        elapsed = time.perf_counter() - started
+        if self.description is None:
+            # total_changes also counts rows written by triggers (and FK actions).
+            changed = max(self.rowcount, 0)
+            self._stats = metrics.record(sql, elapsed, changed, conn.total_changes - changes - changed,
+                                         conn, parameters)
+        else:
+            self._stats = metrics.record(sql, elapsed, 0, 0, conn, parameters)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        conn = self.connection
+        metrics = conn.metrics
+        if metrics is None:
+            return super().executemany(sql, seq_of_parameters)
+        self._flush()
+        changes = conn.total_changes
+        started = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        elapsed = time.perf_counter() - started
+        changed = max(self.rowcount, 0)
+        metrics.record(sql, elapsed, changed, conn.total_changes - changes - changed, conn)
+        return self
+
+    def _flush(self):
+        if self._stats is not None:
+            self.connection.metrics.add_fetched(self._stats, self._fetched, self._fetch_seconds)
+            self._stats = None
+            self._fetched = 0
+            self._fetch_seconds = 0.0
+
+    def fetchone(self):
+        if self._stats is None:
+            return super().fetchone()
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetch_seconds += time.perf_counter() - started
+        # fetchone() is mostly used for a single row, so hand it over at once.
+        self._fetched += row is not None
+        self._flush()
+        return row
+
+    def fetchmany(self, size=None):
+        if self._stats is None:
+            return super().fetchmany(self.arraysize if size is None else size)
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetch_seconds += time.perf_counter() - started
+        self._fetched += len(rows)
+        if not rows:
+            self._flush()
+        return rows
+
+    def fetchall(self):
+        if self._stats is None:
+            return super().fetchall()
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetch_seconds += time.perf_counter() - started
+        self._fetched += len(rows)
+        self._flush()
+        return rows
+
+    def __next__(self):
+        if self._stats is None:
+            return super().__next__()
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetch_seconds += time.perf_counter() - started
+            self._flush()
+            raise
+        self._fetch_seconds += time.perf_counter() - started
+        self._fetched += 1
+        return row
+
+    def close(self):
+        self._flush()
+        super().close()
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """
+    Connection whose statements are recorded by a Metrics instance.
+
+    Open it with Metrics.connect(). Until `metrics` is set it behaves like a plain
+    sqlite3.Connection. Trigger activity is measured as the rows a statement changed
+    beyond its own rowcount, and attributed to the triggers defined on its table.
+    """
+
+    metrics = None
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # sqlite3.Connection.execute() does not go through cursor(), so route it there.
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, script):
+        if self.metrics is None:
+            return super().executescript(script)
+        started = time.perf_counter()
+        cur = super().executescript(script)
+        # Scripts are migrations and setup; their first statements are label enough.
+        self.metrics.record(normalize_sql(script)[:120] + " ...", time.perf_counter() - started, 0, 0)
+        return cur
+
+
+def metrics_from_env(environ=None):
+    """
+    Return a Metrics configured from the environment, or None if metrics are off.
+
+    LIBRARY_METRICS names the file the report is written to and turns metrics on.
+    LIBRARY_SLOW_QUERY_MS sets the slow-query threshold in milliseconds.
+    """
+    environ = os.environ if environ is None else environ
+    if not environ.get("LIBRARY_METRICS"):
+        return None
+    threshold = float(environ.get("LIBRARY_SLOW_QUERY_MS", DEFAULT_SLOW_THRESHOLD * 1000)) / 1000
+    return Metrics(slow_threshold=threshold)
+
+
+def write_metrics(metrics, path=None):
+    """
+    Write `metrics` to `path` (default: $LIBRARY_METRICS).
+
+    Files ending in .prom get the Prometheus format; anything else gets the text report.
+    """
+    path = path or os.environ["LIBRARY_METRICS"]
+    text = metrics.export_prometheus() if path.endswith(".prom") else metrics.export_text()
+    with open(path, "w") as f:
+        f.write(text)
@@ -1,24 +1,82 @@
-import sqlite3
-import datetime
+import sys
+from contextlib import nullcontext
 
-def connect_db():
-    """Connect to the SQLite database."""
-    return sqlite3.connect("library.db")
+from bootstrap import create_database
+from catalog_search import DEFAULT_PAGE_SIZE
+from connection_manager import DEFAULT_DB_PATH, ConnectionManager, open_connection
+from instrumentation import metrics_from_env, write_metrics
+from library_service import EventFullError, LibraryService, NotFoundError, make_cache
+from migrations import migrate
+from profiling import profiler_from_env
+
+def connect_db(path=DEFAULT_DB_PATH, metrics=None):
+    """
+    Connect to the SQLite database and bring its schema up to date.
+
+    If `metrics` (an instrumentation.Metrics) is given, every statement on the
+    connection is recorded there.
+    """
+    conn = metrics.connect(path) if metrics else open_connection(path)
+    migrate(conn)
+    return conn
+
+# One service per connection, so its statements' cursors are reused across menu calls.
+_services = {}
+MAX_SERVICES = 8
+
+# Catalog, event and librarian lookups shared by every connection's service. Writes made
+# through the services invalidate it; changes by other processes are detected on lookup.
+CACHE = make_cache()
+
+def service_for(conn):
+    """Return the LibraryService for `conn`, creating it on first use."""
+    service = _services.get(conn)
+    if service is None:
+        if len(_services) >= MAX_SERVICES:
+            _services.clear()
+        service = _services[conn] = LibraryService(conn, cache=CACHE)
+    return service
+
+# Most search results the menu shows before asking the user to refine the search.
+MAX_RESULTS = 200
+
+def show_pages(page, next_page, show):
+    """
+    Print search results a page at a time, starting with `page`.
+
+    `next_page(after)` returns the library_service.Page that follows the key `after`
+    and `show(record)` prints one record. After each page the user can ask for the
+    next one, up to MAX_RESULTS results. Returns the number of results shown.
+    """
+    shown = 0
+    while True:
+        for record in page.records:
+            show(record)
+        shown += len(page.records)
+        if page.next_after is None:
+            return shown
+        if shown >= MAX_RESULTS:
+            print(f"Showing the first {shown} matches. Refine your search to narrow the results.")
+            return shown
+        try:
+            answer = input("Press Enter for more results, or q to stop: ")
+        except EOFError:
+            return shown
+        if answer.strip().lower() == "q":
+            return shown
+        page = next_page(page.next_after)
 
 def find_item(conn):
     """Search for an item by title or author."""
     search = input("Enter title or author to search for: ")
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT ISBN, title, author, itemType 
-        FROM Item 
-        WHERE title LIKE ? OR author LIKE ?
-    """, ('%' + search + '%', '%' + search + '%'))
-    results = cur.fetchall()
-    if results:
+    service = service_for(conn)
+    page = service.find_items_page(search, limit=DEFAULT_PAGE_SIZE)
+    if page.records:
         print("Items found:")
-        for row in results:
-            print(f"ISBN: {row[0]}, Title: {row[1]}, Author: {row[2]}, Type: {row[3]}")
+        show_pages(page, lambda after: service.find_items_page(search, DEFAULT_PAGE_SIZE, after),
+                   lambda item: print(f"ISBN: {item.isbn}, Title: {item.title}, "
+                                      f"Author: {item.author}, Type: {item.item_type}, "
+                                      f"Available: {item.available_copies} of {item.total_copies}"))
     else:
         print("No items found.")
 
@@ -30,19 +88,9 @@ def borrow_item(conn):
     """
     member_id = input("Enter your member ID: ")
     copy_id = input("Enter the copy ID you want to borrow: ")
-    borrow_date = datetime.date.today().isoformat()
-    due_date = (datetime.date.today() + datetime.timedelta(days=14)).isoformat()
-    cur = conn.cursor()
     try:
-        # Insert new loan record. The returnDate is set to NULL until the item is returned.
-        cur.execute("""
-            INSERT INTO Activity (copyID, memberID, borrowDate, dueDate, returnDate)
-            VALUES (?, ?, ?, ?, NULL)
-        """, (copy_id, member_id, borrow_date, due_date))
-        # Update Inventory to mark the copy as unavailable.
-        cur.execute("UPDATE Inventory SET Available = 0 WHERE copyID = ?", (copy_id,))
-        conn.commit()
-        print(f"Item borrowed successfully. Due date is {due_date}")
+        loan = service_for(conn).borrow(member_id, copy_id)
+        print(f"Item borrowed successfully. Due date is {loan.due_date}")
     except Exception as e:
         print("Error borrowing item:", e)
 
@@ -55,24 +103,56 @@ def return_item(conn):
     its record is updated (not deleted) via triggers when the item is returned. A paymentDate
     set from NULL indicates that the fine has been paid.
     """
-    loan_id = input("Enter your loan ID: ")
-    return_date = datetime.date.today().isoformat()
-    cur = conn.cursor()
+    loan_id = input("Enter your loan ID (option 11 lists your loans): ")
     try:
-        # Update the Activity record to record the return date.
-        cur.execute("UPDATE Activity SET returnDate = ? WHERE loanID = ?", (return_date, loan_id))
-        # Retrieve the associated copyID.
-        cur.execute("SELECT copyID FROM Activity WHERE loanID = ?", (loan_id,))
-        result = cur.fetchone()
-        if result:
-            copy_id = result[0]
-            # Mark the item as available in the Inventory.
-            cur.execute("UPDATE Inventory SET Available = 1 WHERE copyID = ?", (copy_id,))
-        conn.commit()
+        returned = service_for(conn).return_loan(loan_id)
         print("Item returned successfully. Fine history is preserved for record purposes.")
+        if returned.hold_id is not None:
+            print(f"Copy {returned.copy_id} is reserved for hold {returned.hold_id}; "
+                  "please place it on the hold shelf.")
     except Exception as e:
         print("Error returning item:", e)
 
+def place_hold(conn):
+    """
+    Join the queue for a title whose copies are all on loan.
+
+    When a copy comes back it is set aside for the member at the head of the queue,
+    who then has library_service.HOLD_DAYS days to borrow it.
+    """
+    member_id = input("Enter your member ID: ")
+    isbn = input("Enter the ISBN of the item to hold: ")
+    try:
+        hold = service_for(conn).place_hold(member_id, isbn)
+        if hold.status == "ready":
+            print(f"Copy {hold.copy_id} is set aside for you until {hold.expires_on}.")
+        else:
+            print(f"Hold {hold.hold_id} placed. You will get the next copy that is returned.")
+    except Exception as e:
+        print("Error placing hold:", e)
+
+def my_account(conn):
+    """Show a member's open loans, with due dates and overdue flags, and unpaid fines."""
+    member_id = input("Enter your member ID: ")
+    try:
+        account = service_for(conn).member_account(member_id)
+    except Exception as e:
+        print("Error looking up account:", e)
+        return
+    if not account.loans:
+        print("You have no items out and no unpaid fines.")
+        return
+    for loan in account.loans:
+        if loan.return_date is None:
+            status = "OVERDUE" if loan.overdue else "on loan"
+            line = f"Loan ID: {loan.loan_id}, Title: {loan.title}, Due: {loan.due_date} ({status})"
+        else:
+            line = f"Loan ID: {loan.loan_id}, Title: {loan.title}, Returned: {loan.return_date}"
+        if loan.fine:
+            line += f", Fine: {loan.fine:.2f}"
+        print(line)
+    print(f"Total unpaid fines: {account.fines_owed:.2f}")
+
 def donate_item(conn):
     """
     Donate an item to the library.
@@ -80,50 +160,41 @@ def donate_item(conn):
     If the item does not exist in the catalog, prompts for additional details to add it.
     Then, adds a new record in Inventory with the source noted as 'Donated'.
     """
+    service = service_for(conn)
     isbn = input("Enter ISBN of the donated item: ")
-    cur = conn.cursor()
+    details = None
     # Check if the item already exists in the catalog.
-    cur.execute("SELECT * FROM Item WHERE ISBN = ?", (isbn,))
-    item = cur.fetchone()
-    if not item:
+    if not service.item_exists(isbn):
         print("Item not found in the catalog. Please provide additional details.")
-        item_type = input("Enter item type (e.g., Print Book, Online Book, Magazine): ")
-        title = input("Enter title: ")
-        author = input("Enter author: ")
-        publish_date = input("Enter publish date (YYYY-MM-DD): ")
-        publisher = input("Enter publisher: ")
-        cur.execute("""
-            INSERT INTO Item (ISBN, itemType, title, author, publishDate, Publisher)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (isbn, item_type, title, author, publish_date, publisher))
+        details = {
+            "itemType": input("Enter item type (e.g., Print Book, Online Book, Magazine): "),
+            "title": input("Enter title: "),
+            "author": input("Enter author: "),
+            "publishDate": input("Enter publish date (YYYY-MM-DD): "),
+            "Publisher": input("Enter publisher: "),
+        }
     shelf_number = input("Enter shelf number: ")
-    acquisition_date = datetime.date.today().isoformat()
     physical_condition = input("Enter physical condition: ")
-    source = "Donated"
     try:
-        cur.execute("""
-            INSERT INTO Inventory (ISBN, Available, shelfNumber, acquisitionDate, physicalCondition, Source)
-            VALUES (?, 1, ?, ?, ?, ?)
-        """, (isbn, shelf_number, acquisition_date, physical_condition, source))
-        conn.commit()
+        donation = service.donate(isbn, shelf_number, physical_condition, details)
         print("Donation recorded successfully.")
+        if donation.hold_id is not None:
+            print(f"Copy {donation.copy_id} is reserved for hold {donation.hold_id}; "
+                  "please place it on the hold shelf.")
     except Exception as e:
         print("Error recording donation:", e)
 
 def find_event(conn):
     """Find an event in the library by event name or type."""
     search = input("Enter event name or type to search for: ")
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT EventID, eventName, eventType, startDate, startTime, roomNumber 
-        FROM Event 
-        WHERE eventName LIKE ? OR eventType LIKE ?
-    """, ('%' + search + '%', '%' + search + '%'))
-    results = cur.fetchall()
-    if results:
+    service = service_for(conn)
+    page = service.find_events_page(search, limit=DEFAULT_PAGE_SIZE)
+    if page.records:
         print("Events found:")
-        for row in results:
-            print(f"ID: {row[0]}, Name: {row[1]}, Type: {row[2]}, Date: {row[3]}, Time: {row[4]}, Room: {row[5]}")
+        show_pages(page, lambda after: service.find_events_page(search, DEFAULT_PAGE_SIZE, after),
+                   lambda event: print(f"ID: {event.event_id}, Name: {event.name}, "
+                                       f"Type: {event.event_type}, Date: {event.start_date}, "
+                                       f"Time: {event.start_time}, Room: {event.room_number}"))
     else:
         print("No events found.")
 
@@ -131,26 +202,16 @@ def register_event(conn):
     """
     Register for an event.
     
-    Checks if the reservedSeats is within the room's capacity, and if so, increments it.
+    Reserves one seat if the event is below its room's capacity.
     """
     event_id = input("Enter the Event ID you want to register for: ")
-    cur = conn.cursor()
     try:
-        cur.execute("SELECT reservedSeats, roomNumber FROM Event WHERE EventID = ?", (event_id,))
-        result = cur.fetchone()
-        if result:
-            current_reserved, room_number = result
-            cur.execute("SELECT maxCapacity FROM Room WHERE roomNumber = ?", (room_number,))
-            room_capacity = cur.fetchone()[0]
-            if current_reserved < room_capacity:
-                new_reserved = current_reserved + 1
-                cur.execute("UPDATE Event SET reservedSeats = ? WHERE EventID = ?", (new_reserved, event_id))
-                conn.commit()
-                print("Successfully registered for the event.")
-            else:
-                print("Sorry, the event is fully booked.")
-        else:
-            print("Event not found.")
+        service_for(conn).register(event_id)
+        print("Successfully registered for the event.")
+    except EventFullError:
+        print("Sorry, the event is fully booked.")
+    except NotFoundError:
+        print("Event not found.")
     except Exception as e:
         print("Error registering for event:", e)
 
@@ -160,19 +221,12 @@ def volunteer(conn):
     
     Adds a new Personnel record with Position set to 'Volunteer'.
     """
+    # Personnel has no name columns; the names are asked for the front desk's benefit.
     first_name = input("Enter your first name: ")
     last_name = input("Enter your last name: ")
-    start_date = datetime.date.today().isoformat()
-    salary = 0.0  # Volunteers do not receive a salary.
     room_number = input("Enter the room number where you'll volunteer (e.g., R001 for front desk): ")
-    position = "Volunteer"
-    cur = conn.cursor()
     try:
-        cur.execute("""
-            INSERT INTO Personnel (Position, startDate, salary, roomNumber)
-            VALUES (?, ?, ?, ?)
-        """, (position, start_date, salary, room_number))
-        conn.commit()
+        service_for(conn).volunteer(room_number)
         print("Thank you for volunteering!")
     except Exception as e:
         print("Error signing up as a volunteer:", e)
@@ -183,15 +237,8 @@ def ask_for_help(conn):
     
     Looks up a librarian assigned to room R001 (front desk) and provides instructions.
     """
-    cur = conn.cursor()
     try:
-        cur.execute("""
-            SELECT personnelID, Position 
-            FROM Personnel 
-            WHERE Position LIKE '%Librarian%' AND roomNumber = 'R001' 
-            LIMIT 1
-        """)
-        librarian = cur.fetchone()
+        librarian = service_for(conn).find_librarian("R001")
         if librarian:
             print("A librarian is available to help you. Please go to room R001.")
         else:
@@ -199,9 +246,42 @@ def ask_for_help(conn):
     except Exception as e:
         print("Error finding a librarian:", e)
 
-def main():
-    """Main menu loop for the library application."""
-    conn = connect_db()
+# Menu choices that run an operation: choice -> (function, whether it only reads).
+ACTIONS = {
+    '1': (find_item, True),
+    '2': (borrow_item, False),
+    '3': (return_item, False),
+    '4': (donate_item, False),
+    '5': (find_event, True),
+    '6': (register_event, False),
+    '7': (volunteer, False),
+    '8': (ask_for_help, True),
+    # 9 is Exit, as it has always been; newer options come after it.
+    '10': (place_hold, False),
+    '11': (my_account, True),
+}
+
+def main(path=DEFAULT_DB_PATH):
+    """
+    Main menu loop for the library application.
+
+    Set LIBRARY_METRICS to a file name to record per-statement timings for each menu
+    operation; they are written there on exit (see instrumentation.metrics_from_env).
+    Set LIBRARY_PROFILE to a directory to write a collapsed-stack profile of each menu
+    operation there on exit (see profiling.profiler_from_env).
+    A missing database is created from the sample-data template (see bootstrap.py).
+    """
+    if create_database(path):
+        print(f"Created {path} with the sample data.")
+    metrics = metrics_from_env()
+    profiler = profiler_from_env()
+    if metrics:
+        manager = ConnectionManager(path, connect=metrics.connect)
+    else:
+        manager = ConnectionManager(path)
+    conn = manager.writer()
+    # Searches and lookups go through a read-only connection so they never take the write lock.
+    reader = manager.reader()
     while True:
         print("\nLibrary Database Application")
         print("1. Find an item")
@@ -213,31 +293,28 @@ def main():
         print("7. Volunteer for the library")
         print("8. Ask for help from a librarian")
         print("9. Exit")
+        print("10. Place a hold on an item")
+        print("11. View my loans and fines")
         choice = input("Enter your choice: ").strip()
         
-        if choice == '1':
-            find_item(conn)
-        elif choice == '2':
-            borrow_item(conn)
-        elif choice == '3':
-            return_item(conn)
-        elif choice == '4':
-            donate_item(conn)
-        elif choice == '5':
-            find_event(conn)
-        elif choice == '6':
-            register_event(conn)
-        elif choice == '7':
-            volunteer(conn)
-        elif choice == '8':
-            ask_for_help(conn)
-        elif choice == '9':
+        if choice == '9':
             print("Exiting application.")
             break
+        elif choice in ACTIONS:
+            action, read_only = ACTIONS[choice]
+            target = reader if read_only else conn
+            with metrics.operation(action.__name__) if metrics else nullcontext(), \
+                    profiler.operation(action.__name__, target) if profiler else nullcontext():
+                action(target)
         else:
             print("Invalid choice. Please try again.")
     
-    conn.close()
+    manager.close_all()
+    if metrics:
+        write_metrics(metrics)
+    if profiler:
+        profiler.write()
+        print(f"Profiles written to {profiler.directory}")
 
 if __name__ == "__main__":
-    main()
+    main(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DB_PATH)
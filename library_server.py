@@ -0,0 +1,437 @@
+import argparse
+import asyncio
+import datetime
+import json
+import re
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from urllib.parse import parse_qs, urlsplit
+
+from bootstrap import create_database
+from connection_manager import DEFAULT_DB_PATH, ConnectionManager
+from group_commit import GroupCommitter
+from instrumentation import DEFAULT_SLOW_THRESHOLD, Metrics
+from library_service import (
+    EventFullError,
+    InvalidRequestError,
+    LibraryError,
+    LibraryService,
+    NotFoundError,
+    ScheduleConflictError,
+    UnavailableError,
+    make_cache,
+)
+
+# HTTP status for each kind of service error.
+ERROR_STATUS = [
+    (NotFoundError, 404),
+    (UnavailableError, 409),
+    (EventFullError, 409),
+    (ScheduleConflictError, 409),
+    (InvalidRequestError, 400),
+    (LibraryError, 400),
+]
+
+REASONS = {
+    200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    409: "Conflict", 413: "Payload Too Large", 431: "Request Header Fields Too Large",
+    500: "Internal Server Error", 503: "Service Unavailable", 504: "Gateway Timeout",
+}
+
+MAX_HEADER_BYTES = 16384
+
+
+class HTTPError(Exception):
+    """An error response to send back to the client."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _to_json(value):
+    """Convert service results (namedtuples, lists of them) into JSON-friendly values."""
+    if hasattr(value, "_asdict"):
+        return {key: _to_json(item) for key, item in value._asdict().items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_json(item) for item in value]
+    if isinstance(value, Exception):
+        return str(value)
+    return value
+
+
+def _batch_json(results):
+    return [{"request": _to_json(r.request), "ok": r.ok,
+             "result": _to_json(r.result), "error": _to_json(r.error)} for r in results]
+
+
+def _require(body, *names):
+    missing = [name for name in names if name not in body]
+    if missing:
+        raise HTTPError(400, "missing field(s): " + ", ".join(missing))
+    return [body[name] for name in names]
+
+
+def _positive_int(body, name, default):
+    """Return body[name] (or `default`) as an int of at least 1; raise HTTPError 400 otherwise."""
+    value = body.get(name, default)
+    if isinstance(value, str) and value.strip().isdigit():
+        value = int(value)
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+        raise HTTPError(400, f"{name} must be a positive integer")
+    return value
+
+
+# Route handlers run on a worker thread with that thread's LibraryService. Each takes
+# (service, match, query, body) and returns (status, JSON-friendly payload).
+
+def _get_items(service, match, query, body):
+    limit = int(query.get("limit", 20))
+    offset = int(query.get("offset", 0))
+    return 200, _to_json(service.find_items(query.get("q", ""), limit=limit, offset=offset))
+
+def _get_events(service, match, query, body):
+    return 200, _to_json(service.find_events(query.get("q", "")))
+
+def _get_librarian(service, match, query, body):
+    librarian = service.find_librarian(query.get("room", "R001"))
+    if librarian is None:
+        raise NotFoundError("no librarian is available in that room")
+    return 200, _to_json(librarian)
+
+def _get_free_rooms(service, match, query, body):
+    start = datetime.datetime.fromisoformat(query.get("start", ""))
+    end = datetime.datetime.fromisoformat(query.get("end", ""))
+    return 200, _to_json(service.free_rooms(start, end, seats=int(query.get("seats", 1))))
+
+def _get_account(service, match, query, body):
+    return 200, _to_json(service.member_account(int(match.group(1))))
+
+def _post_loans(service, match, query, body):
+    if "loans" in body:
+        loans = body["loans"]
+        if not isinstance(loans, list) or not all(isinstance(loan, list) and len(loan) == 2 for loan in loans):
+            raise HTTPError(400, "loans must be a list of [member_id, copy_id] pairs")
+        return 200, _batch_json(service.borrow_many([tuple(loan) for loan in loans]))
+    member_id, copy_id = _require(body, "member_id", "copy_id")
+    return 201, _to_json(service.borrow(member_id, copy_id))
+
+def _post_returns(service, match, query, body):
+    if "loan_ids" in body:
+        if not isinstance(body["loan_ids"], list):
+            raise HTTPError(400, "loan_ids must be a list")
+        return 200, _batch_json(service.return_many(body["loan_ids"]))
+    loan_id, = _require(body, "loan_id")
+    return 200, _to_json(service.return_loan(loan_id))
+
+def _post_events(service, match, query, body):
+    name, event_type, room_number, start, end = _require(
+        body, "name", "event_type", "room_number", "start", "end")
+    return 201, _to_json(service.schedule_event(
+        name, event_type, room_number, datetime.datetime.fromisoformat(start),
+        datetime.datetime.fromisoformat(end), body.get("personnel_id")))
+
+def _post_event_move(service, match, query, body):
+    room_number, start, end = _require(body, "room_number", "start", "end")
+    return 200, _to_json(service.move_event(
+        int(match.group(1)), room_number, datetime.datetime.fromisoformat(start),
+        datetime.datetime.fromisoformat(end)))
+
+def _post_registration(service, match, query, body):
+    seats = _positive_int(body, "seats", 1)
+    service.register(int(match.group(1)), seats=seats)
+    return 201, {"event_id": int(match.group(1)), "seats": seats}
+
+def _post_registrations(service, match, query, body):
+    event_ids, = _require(body, "event_ids")
+    if not isinstance(event_ids, list):
+        raise HTTPError(400, "event_ids must be a list")
+    results = service.register_many(event_ids, seats=_positive_int(body, "seats", 1))
+    return 200, [{"event_id": event_id, "outcome": outcome} for event_id, outcome in results]
+
+def _post_donations(service, match, query, body):
+    isbn, shelf_number, condition = _require(body, "isbn", "shelf_number", "physical_condition")
+    return 201, _to_json(service.donate(isbn, shelf_number, condition, body.get("details")))
+
+def _post_volunteers(service, match, query, body):
+    room_number, = _require(body, "room_number")
+    return 201, {"personnel_id": service.volunteer(room_number)}
+
+def _post_holds(service, match, query, body):
+    member_id, isbn = _require(body, "member_id", "isbn")
+    return 201, _to_json(service.place_hold(member_id, isbn))
+
+# (method, path regex, role, handler). Reads run on the reader pool against read-only
+# connections; writes are serialized on the single writer thread.
+ROUTES = [
+    ("GET", re.compile(r"/items$"), "read", _get_items),
+    ("GET", re.compile(r"/events$"), "read", _get_events),
+    ("GET", re.compile(r"/librarian$"), "read", _get_librarian),
+    ("GET", re.compile(r"/rooms/free$"), "read", _get_free_rooms),
+    ("GET", re.compile(r"/members/(\d+)/account$"), "read", _get_account),
+    ("POST", re.compile(r"/loans$"), "write", _post_loans),
+    ("POST", re.compile(r"/returns$"), "write", _post_returns),
+    ("POST", re.compile(r"/events$"), "write", _post_events),
+    ("POST", re.compile(r"/events/(\d+)/move$"), "write", _post_event_move),
+    ("POST", re.compile(r"/events/(\d+)/registrations$"), "write", _post_registration),
+    ("POST", re.compile(r"/registrations$"), "write", _post_registrations),
+    ("POST", re.compile(r"/donations$"), "write", _post_donations),
+    ("POST", re.compile(r"/volunteers$"), "write", _post_volunteers),
+    ("POST", re.compile(r"/holds$"), "write", _post_holds),
+]
+
+
+class LibraryServer:
+    """
+    HTTP/1.1 JSON front end for LibraryService, built on asyncio streams.
+
+    The event loop only parses requests and writes responses. sqlite work runs on a
+    bounded pool of reader threads, each with its own read-only connection, and on a
+    single writer thread, since SQLite allows one writer at a time anyway. At most
+    `max_pending` requests are in flight; beyond that new requests get 503 at once
+    rather than queueing without bound. Connections are kept alive between requests
+    until the client closes them or they sit idle for `keepalive_timeout` seconds.
+    With an instrumentation.Metrics as `metrics`, statements are recorded per route
+    handler and served in the Prometheus format at GET /metrics. Catalog, event and
+    librarian lookups go through a shared QueryCache unless `cache` is False. With
+    `group_commit_ms`, writes arriving within that many milliseconds of each other are
+    committed together in one transaction (see group_commit.GroupCommitter).
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH, host="127.0.0.1", port=8080, readers=4,
+                 max_pending=64, request_timeout=5.0, keepalive_timeout=15.0,
+                 max_body=1048576, metrics=None, cache=True, group_commit_ms=None):
+        if metrics:
+            self.manager = ConnectionManager(path, connect=metrics.connect)
+        else:
+            self.manager = ConnectionManager(path)
+        self.metrics = metrics
+        self.cache = make_cache() if cache else None
+        self.host = host
+        self.port = port
+        self.max_pending = max_pending
+        self.request_timeout = request_timeout
+        self.keepalive_timeout = keepalive_timeout
+        self.max_body = max_body
+        self._read_pool = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="library-read")
+        self._write_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="library-write")
+        self._services = threading.local()
+        self.group_commit_ms = group_commit_ms
+        self._committer = None
+        self._in_flight = 0
+        self._server = None
+
+    async def start(self):
+        """Start listening. If `port` was 0, the chosen port is stored in self.port."""
+        # Migrate the schema before any worker opens a read-only connection.
+        await asyncio.get_running_loop().run_in_executor(self._write_pool, self.manager.writer)
+        if self.group_commit_ms is not None:
+            self._committer = GroupCommitter(self.manager.writer, window=self.group_commit_ms / 1000)
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        """Stop accepting connections and release the worker threads and connections."""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for pool in (self._read_pool, self._write_pool):
+            pool.shutdown(wait=True)
+        if self._committer is not None:
+            self._committer.close()
+        self.manager.close_all()
+
+    def _run(self, role, handler, match, query, body):
+        """Run a route handler on the calling worker thread."""
+        # Each worker keeps one service per role, so statement cursors are reused.
+        service = getattr(self._services, role, None)
+        if service is None:
+            conn = self.manager.reader() if role == "read" else self.manager.writer()
+            service = LibraryService(conn, cache=self.cache)
+            setattr(self._services, role, service)
+        with self.metrics.operation(handler.__name__.lstrip("_")) if self.metrics else nullcontext():
+            return handler(service, match, query, body)
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), self.keepalive_timeout)
+                except HTTPError as e:
+                    await self._respond(writer, e.status, {"error": str(e)}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                method, target, version, headers, body = request
+                keep_alive = self._wants_keep_alive(version, headers)
+                status, payload = await self._dispatch(method, target, body)
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _read_request(self, reader):
+        """Read one request. Returns None when the client closed the connection cleanly."""
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError as e:
+            if not e.partial:
+                return None
+            raise
+        except asyncio.LimitOverrunError:
+            raise HTTPError(431, "request headers too large")
+        if len(head) > MAX_HEADER_BYTES:
+            raise HTTPError(431, "request headers too large")
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, version = lines[0].split(" ")
+        except ValueError:
+            raise HTTPError(400, "malformed request line")
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length", 0) or 0)
+        if length > self.max_body:
+            raise HTTPError(413, "request body too large")
+        body = await reader.readexactly(length) if length else b""
+        return method, target, version, headers, body
+
+    @staticmethod
+    def _wants_keep_alive(version, headers):
+        connection = headers.get("connection", "").lower()
+        if version == "HTTP/1.0":
+            return connection == "keep-alive"
+        return connection != "close"
+
+    async def _dispatch(self, method, target, body):
+        url = urlsplit(target)
+        if url.path == "/health":
+            health = {"status": "ok", "in_flight": self._in_flight}
+            if self.cache:
+                health["cache"] = self.cache.stats()._asdict()
+            return 200, health
+        if url.path == "/metrics" and self.metrics:
+            return 200, self.metrics.export_prometheus()
+        route = None
+        for route_method, pattern, role, handler in ROUTES:
+            match = pattern.match(url.path)
+            if match:
+                if route_method == method:
+                    route = (role, handler, match)
+                    break
+                route = route or "method"
+        if route is None:
+            return 404, {"error": "no such resource"}
+        if route == "method":
+            return 405, {"error": "method not allowed"}
+        if self._in_flight >= self.max_pending:
+            return 503, {"error": "server busy, retry shortly"}
+        role, handler, match = route
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            payload = json.loads(body) if body else {}
+        except ValueError:
+            return 400, {"error": "request body is not valid JSON"}
+        if not isinstance(payload, dict):
+            return 400, {"error": "request body must be a JSON object"}
+        pool = self._read_pool if role == "read" else self._write_pool
+        loop = asyncio.get_running_loop()
+        self._in_flight += 1
+        try:
+            if role == "write" and self._committer is not None:
+                future = asyncio.wrap_future(self._committer.submit(
+                    lambda conn: self._run(role, handler, match, query, payload)))
+            else:
+                future = loop.run_in_executor(pool, self._run, role, handler, match, query, payload)
+            # On timeout the client gets 504; the worker finishes the statement on its own.
+            return await asyncio.wait_for(future, self.request_timeout)
+        except asyncio.TimeoutError:
+            return 504, {"error": "request timed out"}
+        except HTTPError as e:
+            return e.status, {"error": str(e)}
+        except LibraryError as e:
+            for error_type, status in ERROR_STATUS:
+                if isinstance(e, error_type):
+                    return status, {"error": str(e)}
+        except (ValueError, TypeError) as e:
+            return 400, {"error": str(e)}
+        except Exception as e:
+            return 500, {"error": f"{type(e).__name__}: {e}"}
+        finally:
+            self._in_flight -= 1
+
+    async def _respond(self, writer, status, payload, keep_alive):
+        # Plain strings (the metrics page) go out as text; everything else as JSON.
+        if isinstance(payload, str):
+            body, content_type = payload.encode(), "text/plain; version=0.0.4"
+        else:
+            body, content_type = json.dumps(payload).encode(), "application/json"
+        head = (f"HTTP/1.1 {status} {REASONS.get(status, 'Unknown')}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n")
+        if status == 503:
+            head += "Retry-After: 1\r\n"
+        writer.write(head.encode("latin-1") + b"\r\n" + body)
+        # Wait for the socket buffer to drain so a slow client cannot make us buffer without limit.
+        await writer.drain()
+
+
+def main(argv=None):
+    """Command-line entry point: python library_server.py [database] [--port N]."""
+    parser = argparse.ArgumentParser(description="Serve the library over HTTP/JSON.")
+    parser.add_argument("database", nargs="?", default=DEFAULT_DB_PATH)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--readers", type=int, default=4, help="reader threads")
+    parser.add_argument("--max-pending", type=int, default=64, help="requests in flight before 503")
+    parser.add_argument("--timeout", type=float, default=5.0, help="per-request timeout in seconds")
+    parser.add_argument("--no-cache", action="store_true", help="do not cache lookups")
+    parser.add_argument("--metrics", action="store_true",
+                        help="record statement timings and serve them at /metrics")
+    parser.add_argument("--group-commit-ms", type=float,
+                        help="commit writes arriving within this many milliseconds together")
+    parser.add_argument("--slow-query-ms", type=float, default=DEFAULT_SLOW_THRESHOLD * 1000,
+                        help="log statements slower than this with their query plans")
+    args = parser.parse_args(argv)
+    if create_database(args.database):
+        print(f"Created {args.database} with the sample data.")
+    metrics = Metrics(slow_threshold=args.slow_query_ms / 1000) if args.metrics else None
+    server = LibraryServer(args.database, args.host, args.port, readers=args.readers,
+                           max_pending=args.max_pending, request_timeout=args.timeout,
+                           metrics=metrics, cache=not args.no_cache,
+                           group_commit_ms=args.group_commit_ms)
+
+    async def run():
+        await server.start()
+        print(f"Serving {args.database} on http://{server.host}:{server.port}")
+        try:
+            await server.serve_forever()
+        finally:
+            await server.close()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
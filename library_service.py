@@ -0,0 +1,866 @@
+import datetime
+import json
+import sqlite3
+from collections import namedtuple
+
+from availability import has_availability_table
+from catalog_search import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    build_match_query,
+    ensure_search_index,
+    search_items,
+    search_items_page,
+)
+from connection_manager import immediate_transaction
+from query_cache import QueryCache
+from statements import PreparedStatements
+
+# Loan period in days.
+LOAN_DAYS = 14
+
+# Days a copy set aside for a hold waits for its member before going to the next one.
+HOLD_DAYS = 7
+
+# Holds expired per transaction by expire_holds().
+EXPIRY_CHUNK_SIZE = 1000
+
+# Seat reservation outcomes reported by register_many().
+RESERVED = "reserved"
+FULLY_BOOKED = "fully booked"
+EVENT_NOT_FOUND = "not found"
+
+# Every statement the service runs, by name (see statements.PreparedStatements).
+# The single-item and batch borrow/return paths share their statements. Going through
+# the same UPDATE of Activity.returnDate keeps the fine triggers in db.sql firing
+# per loan exactly as they do for a single return.
+STATEMENTS = {
+    "item_exists": "SELECT 1 FROM Item WHERE ISBN = ?",
+    "insert_item": """
+        INSERT INTO Item (ISBN, itemType, title, author, publishDate, Publisher)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """,
+    "insert_donated_copy": """
+        INSERT INTO Inventory (ISBN, Available, shelfNumber, acquisitionDate, physicalCondition, Source)
+        VALUES (?, 1, ?, ?, ?, 'Donated')
+    """,
+    "availability_in": """
+        SELECT ISBN, totalCopies, availableCopies, openLoans FROM ItemAvailability
+        WHERE ISBN IN (SELECT value FROM json_each(?))
+    """,
+    # The same counts from the base tables, for databases without ItemAvailability.
+    "count_availability_in": """
+        SELECT ISBN, COUNT(*), SUM(Available IS 1),
+               SUM((SELECT COUNT(*) FROM Activity
+                    WHERE Activity.copyID = Inventory.copyID AND returnDate IS NULL))
+        FROM Inventory
+        WHERE ISBN IN (SELECT value FROM json_each(?))
+        GROUP BY ISBN
+    """,
+    "members_in": "SELECT memberID FROM Member WHERE memberID IN (SELECT value FROM json_each(?))",
+    "copies_in": """
+        SELECT copyID, Available FROM Inventory
+        WHERE copyID IN (SELECT value FROM json_each(?))
+    """,
+    "insert_loan": """
+        INSERT INTO Activity (copyID, memberID, borrowDate, dueDate, returnDate)
+        VALUES (?, ?, ?, ?, NULL)
+    """,
+    "mark_unavailable": "UPDATE Inventory SET Available = 0 WHERE copyID = ?",
+    "open_loans_for_copies": """
+        SELECT copyID, loanID FROM Activity
+        WHERE returnDate IS NULL AND copyID IN (SELECT value FROM json_each(?))
+    """,
+    "loans_in": """
+        SELECT loanID, copyID, borrowDate, returnDate FROM Activity
+        WHERE loanID IN (SELECT value FROM json_each(?))
+    """,
+    "return_loan": "UPDATE Activity SET returnDate = ? WHERE loanID = ?",
+    "mark_available": "UPDATE Inventory SET Available = 1 WHERE copyID = ?",
+    "find_events": """
+        SELECT EventID, eventName, eventType, startDate, startTime, roomNumber
+        FROM Event
+        WHERE eventName LIKE ? OR eventType LIKE ?
+    """,
+    "find_events_after": """
+        SELECT EventID, eventName, eventType, startDate, startTime, roomNumber
+        FROM Event
+        WHERE EventID > ? AND (eventName LIKE ? OR eventType LIKE ?)
+        ORDER BY EventID
+        LIMIT ?
+    """,
+    "reserve_seats": """
+        UPDATE Event
+        SET reservedSeats = COALESCE(reservedSeats, 0) + :seats
+        WHERE EventID = :event_id
+          AND COALESCE(reservedSeats, 0) + :seats <=
+              (SELECT maxCapacity FROM Room WHERE Room.roomNumber = Event.roomNumber)
+    """,
+    "event_exists": "SELECT 1 FROM Event WHERE EventID = ?",
+    "find_event": """
+        SELECT EventID, eventName, eventType, startDate, startTime, roomNumber
+        FROM Event WHERE EventID = ?
+    """,
+    "insert_event": """
+        INSERT INTO Event (startDate, endDate, startTime, endTime, reservedSeats, roomNumber,
+                           eventName, eventType, personnelID)
+        VALUES (?, ?, ?, ?, 0, ?, ?, ?, ?)
+    """,
+    "move_event": """
+        UPDATE Event SET startDate = ?, endDate = ?, startTime = ?, endTime = ?, roomNumber = ?
+        WHERE EventID = ?
+    """,
+    "room_capacity": "SELECT maxCapacity FROM Room WHERE roomNumber = ?",
+    # Minute spans as stored in EventSchedule (migration 8): :first and :last are
+    # the first and last minute of the window, both inclusive.
+    "schedule_conflict": """
+        SELECT EventID FROM EventSchedule
+        WHERE startMinute <= :last AND endMinute >= :first
+          AND roomNumber = :room AND EventID IS NOT :event_id
+        LIMIT 1
+    """,
+    "free_rooms": """
+        SELECT roomNumber, maxCapacity FROM Room
+        WHERE maxCapacity >= :seats
+          AND NOT EXISTS (SELECT 1 FROM EventSchedule s
+                          WHERE s.roomNumber = Room.roomNumber
+                            AND s.startMinute <= :last AND s.endMinute >= :first)
+        ORDER BY maxCapacity, roomNumber
+    """,
+    # Volunteers do not receive a salary.
+    "insert_volunteer": """
+        INSERT INTO Personnel (Position, startDate, salary, roomNumber)
+        VALUES ('Volunteer', ?, 0.0, ?)
+    """,
+    "find_librarian": """
+        SELECT personnelID, Position, roomNumber
+        FROM Personnel
+        WHERE Position LIKE '%Librarian%' AND roomNumber = ?
+        LIMIT 1
+    """,
+    # A member's open loans, then the returned loans with an unpaid fine. Open loans
+    # are one range of idx_activity_member_account and unpaid fines one range of
+    # UnpaidFine, so the cost follows what the member has out, not their history.
+    "member_account": """
+        SELECT Activity.loanID, Activity.copyID, Item.title, Activity.borrowDate,
+               Activity.dueDate, Activity.returnDate, Fine.amount
+        FROM Activity
+        LEFT JOIN Fine ON Fine.loanID = Activity.loanID AND Fine.paymentDate IS NULL
+        LEFT JOIN Inventory ON Inventory.copyID = Activity.copyID
+        LEFT JOIN Item ON Item.ISBN = Inventory.ISBN
+        WHERE Activity.memberID = :member AND Activity.returnDate IS NULL
+        UNION ALL
+        SELECT Activity.loanID, Activity.copyID, Item.title, Activity.borrowDate,
+               Activity.dueDate, Activity.returnDate, Fine.amount
+        FROM UnpaidFine
+        JOIN Activity ON Activity.loanID = UnpaidFine.loanID
+        JOIN Fine ON Fine.loanID = UnpaidFine.loanID
+        LEFT JOIN Inventory ON Inventory.copyID = Activity.copyID
+        LEFT JOIN Item ON Item.ISBN = Inventory.ISBN
+        WHERE UnpaidFine.memberID = :member AND Activity.returnDate IS NOT NULL
+        ORDER BY 5
+    """,
+    "insert_hold": "INSERT INTO Hold (ISBN, memberID, placedDate) VALUES (?, ?, ?)",
+    "find_hold": """
+        SELECT holdID, ISBN, memberID, status, copyID, expiresOn FROM Hold WHERE holdID = ?
+    """,
+    "available_copy": "SELECT copyID FROM Inventory WHERE ISBN = ? AND Available = 1 LIMIT 1",
+    # Sets `copy` aside for the first waiting hold on its title, if there is one.
+    "assign_next_hold": """
+        UPDATE Hold
+        SET status = 'ready', copyID = :copy, readyDate = :today, expiresOn = :expires
+        WHERE holdID = (SELECT holdID FROM Hold
+                        WHERE ISBN = (SELECT ISBN FROM Inventory WHERE copyID = :copy)
+                          AND status = 'waiting'
+                        ORDER BY holdID
+                        LIMIT 1)
+        RETURNING holdID
+    """,
+    "copies_wanted_by_holds": """
+        SELECT copyID FROM Inventory
+        WHERE copyID IN (SELECT value FROM json_each(?))
+          AND EXISTS (SELECT 1 FROM Hold WHERE Hold.ISBN = Inventory.ISBN AND Hold.status = 'waiting')
+    """,
+    "ready_holds_for_copies": """
+        SELECT copyID, memberID, holdID FROM Hold
+        WHERE copyID IN (SELECT value FROM json_each(?)) AND status = 'ready'
+    """,
+    "expired_holds": """
+        SELECT holdID, copyID FROM Hold
+        WHERE status = 'ready' AND expiresOn < ?
+        ORDER BY expiresOn
+        LIMIT ?
+    """,
+    "set_hold_status": "UPDATE Hold SET status = ? WHERE holdID = ?",
+}
+
+
+class LibraryError(Exception):
+    """Base class for errors reported by the library service."""
+
+class NotFoundError(LibraryError):
+    """A member, copy, loan, item or event does not exist."""
+
+class UnavailableError(LibraryError):
+    """A copy is already on loan, or a loan has already been returned."""
+
+class EventFullError(LibraryError):
+    """An event has no seats left in its room."""
+
+class InvalidRequestError(LibraryError):
+    """An argument is malformed or contradicts the data, e.g. a non-numeric ID."""
+
+class ScheduleConflictError(LibraryError):
+    """A room is already booked for part of the requested time."""
+
+
+# Cached read paths and the tables their results come from (see QueryCache).
+CACHE_TABLES = {
+    "items": ("Item",),
+    "availability": ("ItemAvailability",),
+    "events": ("Event",),
+    "librarian": ("Personnel",),
+}
+
+
+def make_cache(**limits):
+    """Return a QueryCache for the service's read paths; `limits` go to QueryCache."""
+    return QueryCache(CACHE_TABLES, **limits)
+
+
+# Results returned by the service.
+Item = namedtuple("Item", "isbn title author item_type total_copies available_copies open_loans")
+Availability = namedtuple("Availability", "total_copies available_copies open_loans")
+NO_COPIES = Availability(0, 0, 0)
+Event = namedtuple("Event", "event_id name event_type start_date start_time room_number")
+Loan = namedtuple("Loan", "loan_id copy_id member_id borrow_date due_date")
+# `hold_id` is the hold the returned copy was set aside for, or None.
+ReturnedLoan = namedtuple("ReturnedLoan", "loan_id copy_id return_date hold_id")
+# `hold_id` is the waiting hold the new copy was set aside for, or None.
+Donation = namedtuple("Donation", "isbn copy_id added_to_catalog hold_id")
+Librarian = namedtuple("Librarian", "personnel_id position room_number")
+# One line of a member's account: a loan still out, or a returned loan with an unpaid
+# fine. `fine` is the unpaid amount, or None.
+AccountLoan = namedtuple("AccountLoan", "loan_id copy_id title borrow_date due_date return_date overdue fine")
+MemberAccount = namedtuple("MemberAccount", "member_id loans fines_owed")
+Hold = namedtuple("Hold", "hold_id isbn member_id status copy_id expires_on")
+Room = namedtuple("Room", "room_number capacity")
+
+# One page of a keyset-paginated search. Pass `next_after` back to get the next page;
+# it is None on the last one.
+Page = namedtuple("Page", "records next_after")
+
+# Per-item outcome of borrow_many() and return_many(). `result` is the Loan or
+# ReturnedLoan when the item succeeded; otherwise `error` is the LibraryError.
+BatchResult = namedtuple("BatchResult", "request ok result error")
+
+
+def schedule_span(start, end):
+    """
+    Return the (first, last) minute of the window [start, end) as stored in EventSchedule.
+
+    `start` and `end` are datetimes; minutes count from 1970-01-01 like SQLite's
+    strftime('%s') / 60. Raises InvalidRequestError unless end is after start.
+    """
+    epoch = datetime.datetime(1970, 1, 1)
+    first = int((start - epoch).total_seconds()) // 60
+    end_minute = int((end - epoch).total_seconds()) // 60
+    if end_minute <= first:
+        raise InvalidRequestError("an event must end after it starts")
+    return first, end_minute - 1
+
+
+def seat_count(seats):
+    """Return `seats` if it is a whole number of at least 1; raise InvalidRequestError otherwise."""
+    if isinstance(seats, bool) or not isinstance(seats, int) or seats < 1:
+        raise InvalidRequestError("seats must be a whole number of at least 1")
+    return seats
+
+
+class LibraryService:
+    """
+    The library's operations, free of console input and output.
+
+    Writes go through `conn`; searches and lookups use `reader` when one is given,
+    so they can run on a read-only connection. Methods return the records above and
+    raise LibraryError subclasses for expected failures. sqlite3 errors that indicate
+    a bug or a broken database are left to propagate. Statements come from STATEMENTS
+    and reuse their cursors, so keep one service per connection where calls are hot.
+
+    With a `cache` from make_cache(), find_items, find_events and find_librarian are
+    served from it; it may be shared by services on different connections.
+    """
+
+    def __init__(self, conn, reader=None, cache=None):
+        self.conn = conn
+        self.reader = reader or conn
+        self.cache = cache
+        self.statements = PreparedStatements(conn, STATEMENTS)
+        if self.reader is conn:
+            self.read_statements = self.statements
+        else:
+            self.read_statements = PreparedStatements(self.reader, STATEMENTS)
+        self._search_index_ready = False
+        self._availability_table = None
+
+    # Catalog
+
+    def find_items(self, query, limit=DEFAULT_PAGE_SIZE, offset=0):
+        """Search the catalog by title, author, publisher or type; best matches first."""
+        if self.cache is None:
+            rows = self._find_items(query, limit, offset)
+        else:
+            # Searches that differ only in case or punctuation share one entry.
+            key = (build_match_query(query.lower()), limit, offset)
+            rows = self.cache.get(self.reader, "items", key,
+                                  lambda: self._find_items(query, limit, offset))
+        return self._with_availability(rows)
+
+    def _find_items(self, query, limit, offset):
+        if not self._search_index_ready:
+            ensure_search_index(self.reader)
+            self._search_index_ready = True
+        return search_items(self.reader, query, limit, offset, ensure_index=False)
+
+    def _with_availability(self, rows):
+        # Counts change with every loan, so they are cached apart from the search
+        # results: a loan only drops the "availability" entries.
+        counts = self.availability([row[0] for row in rows])
+        return [Item._make(tuple(row) + tuple(counts.get(row[0], NO_COPIES))) for row in rows]
+
+    def availability(self, isbns):
+        """
+        Return {isbn: Availability} for the given ISBNs, read from the ItemAvailability
+        counters. ISBNs without any copies are left out.
+        """
+        if not isbns:
+            return {}
+        isbns = tuple(isbns)
+        if self.cache is None:
+            return self._availability(isbns)
+        return self.cache.get(self.reader, "availability", isbns, lambda: self._availability(isbns))
+
+    def _availability(self, isbns):
+        if self._availability_table is None:
+            self._availability_table = has_availability_table(self.reader)
+        name = "availability_in" if self._availability_table else "count_availability_in"
+        rows = self.read_statements.fetchall(name, (json.dumps(isbns),))
+        return {row[0]: Availability._make(row[1:]) for row in rows}
+
+    def find_items_page(self, query, limit=DEFAULT_PAGE_SIZE, after=None):
+        """
+        Return a Page of find_items() results, starting after the key `after`.
+
+        Ranked pages cost time in proportion to the number of matches; a search made of
+        one-letter words is listed in index order instead, so its pages cost the same
+        however much of the catalog it matches (see catalog_search.search_items_page).
+        """
+        if self.cache is None:
+            page = self._find_items_page(query, limit, after)
+        else:
+            key = ("page", build_match_query(query.lower()), limit, after)
+            page = self.cache.get(self.reader, "items", key,
+                                  lambda: self._find_items_page(query, limit, after))
+        return page._replace(records=tuple(self._with_availability(page.records)))
+
+    def _find_items_page(self, query, limit, after):
+        if not self._search_index_ready:
+            ensure_search_index(self.reader)
+            self._search_index_ready = True
+        rows, next_after = search_items_page(self.reader, query, limit, after, ensure_index=False)
+        return Page(tuple(rows), next_after)
+
+    def iter_items(self, query, page_size=MAX_PAGE_SIZE):
+        """
+        Yield every Item matching `query`, best matches first, one page at a time.
+
+        Each page is its own short query, so no read transaction is held open while
+        the caller consumes the results, however slowly.
+        """
+        after = None
+        while True:
+            page = self.find_items_page(query, page_size, after)
+            yield from page.records
+            if page.next_after is None:
+                return
+            after = page.next_after
+
+    def item_exists(self, isbn):
+        """Return True if `isbn` is in the catalog."""
+        return self.read_statements.fetchone("item_exists", (isbn,)) is not None
+
+    def donate(self, isbn, shelf_number, physical_condition, details=None, today=None):
+        """
+        Add a donated copy of `isbn` to the inventory.
+
+        If the ISBN is not yet in the catalog, `details` must be a dict with itemType,
+        title, author, publishDate and Publisher; the catalog entry and the copy are
+        then added in the same transaction. A title with waiting holds does not get the
+        copy on its shelf: it is set aside for the first hold in line. Returns a Donation.
+        """
+        acquisition_date = (today or datetime.date.today()).isoformat()
+        statements = self.statements
+        with immediate_transaction(self.conn):
+            added = statements.fetchone("item_exists", (isbn,)) is None
+            if added:
+                if not details:
+                    raise NotFoundError(f"ISBN {isbn} is not in the catalog")
+                statements.execute("insert_item", (
+                    isbn, details.get("itemType"), details.get("title"), details.get("author"),
+                    details.get("publishDate"), details.get("Publisher")))
+            cur = statements.execute("insert_donated_copy",
+                                     (isbn, shelf_number, acquisition_date, physical_condition))
+            copy_id = cur.lastrowid
+            assigned = self._offer([copy_id], today or datetime.date.today())
+        self._invalidate("items")
+        self._invalidate("availability")
+        return Donation(isbn, copy_id, added, assigned.get(copy_id))
+
+    # Loans
+
+    def borrow(self, member_id, copy_id, today=None):
+        """Lend a copy to a member. Returns the Loan or raises a LibraryError."""
+        result = self.borrow_many([(member_id, copy_id)], today=today)[0]
+        if not result.ok:
+            raise result.error
+        return result.result
+
+    def borrow_many(self, loans, today=None):
+        """
+        Check out many copies in one transaction.
+
+        `loans` is a list of (member_id, copy_id). Members and copies are validated with
+        one query each, then every accepted loan is written with executemany. A copy that
+        is unknown, already on loan or requested twice fails on its own without affecting
+        the rest of the batch. Returns one BatchResult per request, in order.
+        """
+        today = today or datetime.date.today()
+        borrow_date = today.isoformat()
+        due_date = (today + datetime.timedelta(days=LOAN_DAYS)).isoformat()
+        results = [None] * len(loans)
+        accepted = []
+        statements = self.statements
+        with immediate_transaction(self.conn):
+            requested = []
+            for index, request in enumerate(loans):
+                try:
+                    # A string has a length too, but is never a (member, copy) pair.
+                    if isinstance(request, (str, bytes)) or len(request) != 2:
+                        raise ValueError(request)
+                    requested.append((index, int(request[0]), int(request[1])))
+                except (TypeError, ValueError):
+                    results[index] = BatchResult(request, False, None,
+                                                 InvalidRequestError("invalid member or copy ID"))
+            members = {row[0] for row in statements.fetchall(
+                "members_in", (json.dumps([member_id for _, member_id, _ in requested]),))}
+            copy_ids = json.dumps([copy_id for _, _, copy_id in requested])
+            available = dict(statements.fetchall("copies_in", (copy_ids,)))
+            # Copies set aside for a hold can only go to the member who placed it.
+            held = {row[0]: row[1:] for row in statements.fetchall("ready_holds_for_copies", (copy_ids,))}
+            fulfilled = []
+            for index, member_id, copy_id in requested:
+                request = loans[index]
+                hold = held.get(copy_id)
+                if member_id not in members:
+                    results[index] = BatchResult(request, False, None, NotFoundError("member not found"))
+                elif copy_id not in available:
+                    results[index] = BatchResult(request, False, None, NotFoundError("copy not found"))
+                elif hold is not None and hold[0] != member_id:
+                    results[index] = BatchResult(request, False, None,
+                                                 UnavailableError("copy is on hold for another member"))
+                elif hold is None and not available[copy_id]:
+                    results[index] = BatchResult(request, False, None, UnavailableError("copy not available"))
+                else:
+                    # Later requests for the same copy in this batch see it as taken.
+                    available[copy_id] = 0
+                    if hold is not None:
+                        fulfilled.append(("fulfilled", hold[1]))
+                        del held[copy_id]
+                    accepted.append((index, member_id, copy_id))
+            statements.executemany("set_hold_status", fulfilled)
+            statements.executemany("insert_loan", [(copy_id, member_id, borrow_date, due_date)
+                                                   for _, member_id, copy_id in accepted])
+            statements.executemany("mark_unavailable", [(copy_id,) for _, _, copy_id in accepted])
+            loan_ids = dict(statements.fetchall(
+                "open_loans_for_copies", (json.dumps([copy_id for _, _, copy_id in accepted]),)))
+        if accepted:
+            self._invalidate("availability")
+        for index, member_id, copy_id in accepted:
+            loan = Loan(loan_ids[copy_id], copy_id, member_id, borrow_date, due_date)
+            results[index] = BatchResult(loans[index], True, loan, None)
+        return results
+
+    def return_loan(self, loan_id, today=None):
+        """Close a loan and make its copy available. Returns a ReturnedLoan."""
+        result = self.return_many([loan_id], today=today)[0]
+        if not result.ok:
+            raise result.error
+        return result.result
+
+    def return_many(self, loan_ids, today=None):
+        """
+        Check in many loans in one transaction.
+
+        The loans are looked up with a single query; unknown loans, loans already returned
+        and duplicates in the batch fail individually. The rest are closed with executemany,
+        which fires the fine triggers once per loan. A returned copy whose title has a
+        waiting hold is set aside for it in the same transaction instead of becoming
+        available. Returns one BatchResult per loan ID.
+        """
+        return_date = (today or datetime.date.today()).isoformat()
+        results = [None] * len(loan_ids)
+        accepted = []
+        statements = self.statements
+        with immediate_transaction(self.conn):
+            requested = []
+            for index, loan_id in enumerate(loan_ids):
+                try:
+                    requested.append((index, int(loan_id)))
+                except (TypeError, ValueError):
+                    results[index] = BatchResult(loan_id, False, None, InvalidRequestError("invalid loan ID"))
+            loans = {row[0]: row[1:] for row in statements.fetchall(
+                "loans_in", (json.dumps([loan_id for _, loan_id in requested]),))}
+            seen = set()
+            for index, loan_id in requested:
+                loan = loans.get(loan_id)
+                request = loan_ids[index]
+                if loan is None:
+                    results[index] = BatchResult(request, False, None, NotFoundError("loan not found"))
+                elif loan[2] is not None or loan_id in seen:
+                    results[index] = BatchResult(request, False, None, UnavailableError("loan already returned"))
+                elif loan[1] is not None and loan[1] > return_date:
+                    results[index] = BatchResult(request, False, None,
+                                                 InvalidRequestError("loan starts after the return date"))
+                else:
+                    seen.add(loan_id)
+                    accepted.append((index, loan_id, loan[0]))
+            statements.executemany("return_loan", [(return_date, loan_id) for _, loan_id, _ in accepted])
+            holds = self._release([copy_id for _, _, copy_id in accepted if copy_id is not None],
+                                  today or datetime.date.today())
+        if accepted:
+            self._invalidate("availability")
+        for index, loan_id, copy_id in accepted:
+            returned = ReturnedLoan(loan_id, copy_id, return_date, holds.get(copy_id))
+            results[index] = BatchResult(loan_ids[index], True, returned, None)
+        return results
+
+    def member_account(self, member_id, today=None):
+        """
+        Return a MemberAccount: the member's open loans and unpaid fines in one query.
+
+        Loans are in due-date order and flagged overdue once past their due date.
+        Fines are those of fines.py and the db.sql triggers: one per overdue loan.
+        Raises NotFoundError for an unknown member.
+        """
+        try:
+            member_id = int(member_id)
+        except (TypeError, ValueError):
+            raise InvalidRequestError("invalid member ID") from None
+        today = (today or datetime.date.today()).isoformat()
+        rows = self.read_statements.fetchall("member_account", {"member": member_id})
+        if not rows and not self.read_statements.fetchall("members_in", (json.dumps([member_id]),)):
+            raise NotFoundError("member not found")
+        loans = [AccountLoan(loan_id, copy_id, title, borrowed, due, returned,
+                             returned is None and due is not None and due < today, fine)
+                 for loan_id, copy_id, title, borrowed, due, returned, fine in rows]
+        return MemberAccount(member_id, loans, sum(loan.fine or 0 for loan in loans))
+
+    # Holds
+
+    def place_hold(self, member_id, isbn, today=None):
+        """
+        Put a member in the queue for a title. Returns the Hold.
+
+        If a copy is on the shelf the hold is served at once and comes back 'ready'.
+        A member can have only one waiting or ready hold per title.
+        """
+        today = today or datetime.date.today()
+        statements = self.statements
+        try:
+            member_id = int(member_id)
+        except (TypeError, ValueError):
+            raise InvalidRequestError("invalid member ID") from None
+        with immediate_transaction(self.conn):
+            if not statements.fetchall("members_in", (json.dumps([member_id]),)):
+                raise NotFoundError("member not found")
+            if statements.fetchone("item_exists", (isbn,)) is None:
+                raise NotFoundError(f"ISBN {isbn} is not in the catalog")
+            try:
+                hold_id = statements.execute("insert_hold", (isbn, member_id, today.isoformat())).lastrowid
+            except sqlite3.IntegrityError:
+                raise InvalidRequestError("the member already holds this title") from None
+            copy = statements.fetchone("available_copy", (isbn,))
+            if copy is not None:
+                # Take the copy off the shelf; _release() gives it to the head of the queue.
+                statements.execute("mark_unavailable", copy)
+                self._release([copy[0]], today)
+            hold = statements.fetchone("find_hold", (hold_id,), Hold)
+        if copy is not None:
+            self._invalidate("availability")
+        return hold
+
+    def find_hold(self, hold_id):
+        """Return the Hold with this ID, or None."""
+        return self.read_statements.fetchone("find_hold", (hold_id,), Hold)
+
+    def cancel_hold(self, hold_id, today=None):
+        """Withdraw a waiting or ready hold; a copy set aside for it goes to the next in line."""
+        with immediate_transaction(self.conn):
+            hold = self.statements.fetchone("find_hold", (hold_id,), Hold)
+            if hold is None:
+                raise NotFoundError("hold not found")
+            if hold.status not in ("waiting", "ready"):
+                raise InvalidRequestError(f"the hold is already {hold.status}")
+            self.statements.execute("set_hold_status", ("cancelled", hold.hold_id))
+            if hold.status == "ready":
+                self._release([hold.copy_id], today or datetime.date.today())
+        if hold.status == "ready":
+            self._invalidate("availability")
+
+    def expire_holds(self, today=None, chunk_size=EXPIRY_CHUNK_SIZE):
+        """
+        Expire ready holds whose member did not collect the copy by expiresOn.
+
+        Expired holds are found through the (status, expiresOn) index, `chunk_size` per
+        transaction, and each freed copy goes to the next hold on its title or back on
+        the shelf. Returns the number of holds expired.
+        """
+        today = today or datetime.date.today()
+        expired = 0
+        while True:
+            with immediate_transaction(self.conn):
+                rows = self.statements.fetchall("expired_holds", (today.isoformat(), chunk_size))
+                self.statements.executemany("set_hold_status", [("expired", hold_id) for hold_id, _ in rows])
+                self._release([copy_id for _, copy_id in rows], today)
+            expired += len(rows)
+            if len(rows) < chunk_size:
+                break
+        if expired:
+            self._invalidate("availability")
+        return expired
+
+    def offer_new_copies(self, copy_ids, today=None):
+        """
+        Set copies just added to the shelf aside for the holds waiting on their titles.
+
+        Without this a new copy of a title with a queue could be borrowed by a walk-in
+        ahead of the members waiting for it. Copies go to the oldest waiting holds in
+        `copy_ids` order and are taken off the shelf; the rest stay available. Runs in
+        the caller's transaction if there is one. Returns {copy_id: hold_id}.
+        """
+        with immediate_transaction(self.conn):
+            assigned = self._offer(copy_ids, today or datetime.date.today())
+        if assigned:
+            self._invalidate("availability")
+        return assigned
+
+    def _offer(self, copy_ids, today):
+        # Copies on the shelf: only those given to a hold change.
+        assigned = self._assign_holds(copy_ids, today)
+        self.statements.executemany("mark_unavailable", [(copy_id,) for copy_id in assigned])
+        return assigned
+
+    def _release(self, copy_ids, today):
+        """
+        Give each copy to the next waiting hold on its title, or put it back on the shelf.
+
+        The copies must be marked unavailable, and this must run inside the caller's
+        transaction. Returns {copy_id: hold_id} for the copies set aside for a hold.
+        """
+        assigned = self._assign_holds(copy_ids, today)
+        self.statements.executemany("mark_available", [(copy_id,) for copy_id in copy_ids
+                                                       if copy_id not in assigned])
+        return assigned
+
+    def _assign_holds(self, copy_ids, today):
+        """Set each copy aside for the next waiting hold on its title. Returns {copy_id: hold_id}."""
+        if not copy_ids:
+            return {}
+        params = {"today": today.isoformat(),
+                  "expires": (today + datetime.timedelta(days=HOLD_DAYS)).isoformat()}
+        assigned = {}
+        # Most titles have no queue; one query finds the copies worth offering.
+        wanted = [row[0] for row in self.statements.fetchall("copies_wanted_by_holds",
+                                                              (json.dumps(copy_ids),))]
+        for copy_id in sorted(wanted, key=copy_ids.index):
+            params["copy"] = copy_id
+            row = self.statements.fetchone("assign_next_hold", params)
+            if row is not None:
+                assigned[copy_id] = row[0]
+        return assigned
+
+    # Events
+
+    def find_events(self, query):
+        """Find events whose name or type contains `query`."""
+        if self.cache is None:
+            return self._find_events(query)
+        return list(self.cache.get(self.reader, "events", query, lambda: self._find_events(query)))
+
+    def find_events_page(self, query, limit=DEFAULT_PAGE_SIZE, after=None):
+        """
+        Return a Page of events whose name or type contains `query`, in EventID order.
+
+        `after` is the EventID the previous page ended with. The scan walks the table
+        in key order and stops as soon as the page is full, so the first page of a
+        common query costs the same however many events there are.
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        if self.cache is None:
+            return self._find_events_page(query, limit, after)
+        return self.cache.get(self.reader, "events", ("page", query, limit, after),
+                              lambda: self._find_events_page(query, limit, after))
+
+    def _find_events_page(self, query, limit, after):
+        pattern = '%' + query + '%'
+        # EventID is the rowid, so -2**63 starts before every event.
+        start = -2 ** 63 if after is None else after
+        records = self.read_statements.fetchall(
+            "find_events_after", (start, pattern, pattern, limit + 1), Event)
+        next_after = records[limit - 1].event_id if len(records) > limit else None
+        return Page(tuple(records[:limit]), next_after)
+
+    def iter_events(self, query, page_size=MAX_PAGE_SIZE):
+        """Yield every Event matching `query` in EventID order, one page at a time."""
+        after = None
+        while True:
+            page = self.find_events_page(query, page_size, after)
+            yield from page.records
+            if page.next_after is None:
+                return
+            after = page.next_after
+
+    def _find_events(self, query):
+        pattern = '%' + query + '%'
+        return self.read_statements.fetchall("find_events", (pattern, pattern), Event)
+
+    def register(self, event_id, seats=1):
+        """
+        Reserve `seats` seats for an event in a single conditional update.
+
+        The capacity check and the increment happen in one statement, so concurrent
+        registrations can never push reservedSeats past the room's maxCapacity.
+        Raises EventFullError or NotFoundError if the seats cannot be reserved, and
+        InvalidRequestError unless `seats` is a whole number of at least 1.
+        """
+        seat_count(seats)
+        with immediate_transaction(self.conn):
+            outcome = self._reserve(event_id, seats)
+        self._invalidate("events")
+        if outcome == FULLY_BOOKED:
+            raise EventFullError("the event is fully booked")
+        if outcome == EVENT_NOT_FOUND:
+            raise NotFoundError("event not found")
+
+    def register_many(self, event_ids, seats=1):
+        """
+        Reserve `seats` seats for each event in `event_ids` in one transaction.
+
+        Events that are full or missing are reported and skipped; the others are booked.
+        Returns a list of (event_id, outcome) in the order given, where outcome is
+        RESERVED, FULLY_BOOKED or EVENT_NOT_FOUND. Raises InvalidRequestError, booking
+        nothing, unless `seats` is a whole number of at least 1.
+        """
+        seat_count(seats)
+        with immediate_transaction(self.conn):
+            outcomes = [(event_id, self._reserve(event_id, seats)) for event_id in event_ids]
+        self._invalidate("events")
+        return outcomes
+
+    def _reserve(self, event_id, seats):
+        cur = self.statements.execute("reserve_seats", {"event_id": event_id, "seats": seats})
+        if cur.rowcount == 1:
+            return RESERVED
+        # Only a failed reservation pays for the second lookup.
+        found = self.statements.fetchone("event_exists", (event_id,))
+        return FULLY_BOOKED if found else EVENT_NOT_FOUND
+
+    def schedule_event(self, name, event_type, room_number, start, end, personnel_id=None):
+        """
+        Book `room_number` from `start` to `end` (datetimes) for a new event. Returns the Event.
+
+        The overlap check and the insert share one write transaction, so two bookings
+        cannot both take the same slot. Raises ScheduleConflictError if the room is
+        taken for any part of the window, NotFoundError if the room does not exist.
+        """
+        with immediate_transaction(self.conn):
+            self._check_slot(None, room_number, start, end)
+            cur = self.statements.execute("insert_event", (
+                start.date().isoformat(), end.date().isoformat(), start.strftime("%H:%M"),
+                end.strftime("%H:%M"), room_number, name, event_type, personnel_id))
+            event = self.statements.fetchone("find_event", (cur.lastrowid,), Event)
+        self._invalidate("events")
+        return event
+
+    def move_event(self, event_id, room_number, start, end):
+        """
+        Move an event to another room or time. Returns the updated Event.
+
+        The event's own booking does not count as a conflict. Raises
+        ScheduleConflictError, NotFoundError, or InvalidRequestError when the new
+        room seats fewer people than have already registered.
+        """
+        with immediate_transaction(self.conn):
+            if self.statements.fetchone("event_exists", (event_id,)) is None:
+                raise NotFoundError("event not found")
+            self._check_slot(event_id, room_number, start, end)
+            try:
+                self.statements.execute("move_event", (
+                    start.date().isoformat(), end.date().isoformat(), start.strftime("%H:%M"),
+                    end.strftime("%H:%M"), room_number, event_id))
+            except sqlite3.IntegrityError:
+                # check_event_reservedSeats_update in db.sql.
+                raise InvalidRequestError(
+                    f"room {room_number} is too small for the seats already reserved") from None
+            event = self.statements.fetchone("find_event", (event_id,), Event)
+        self._invalidate("events")
+        return event
+
+    def _check_slot(self, event_id, room_number, start, end):
+        first, last = schedule_span(start, end)
+        if self.statements.fetchone("room_capacity", (room_number,)) is None:
+            raise NotFoundError(f"room {room_number} does not exist")
+        clash = self.statements.fetchone("schedule_conflict", {
+            "first": first, "last": last, "room": room_number, "event_id": event_id})
+        if clash is not None:
+            raise ScheduleConflictError(f"room {room_number} is booked for event {clash[0]} at that time")
+
+    def free_rooms(self, start, end, seats=1):
+        """
+        Return the Rooms seating at least `seats` with no event between `start` and `end`.
+
+        Smallest suitable rooms come first. The busy rooms come from one EventSchedule
+        query over the window, so the cost follows the events in the window rather
+        than the size of the schedule.
+        """
+        first, last = schedule_span(start, end)
+        return self.read_statements.fetchall(
+            "free_rooms", {"seats": seats, "first": first, "last": last}, Room)
+
+    # Staff
+
+    def volunteer(self, room_number, today=None):
+        """Sign up a volunteer working in `room_number`. Returns the new personnelID."""
+        start_date = (today or datetime.date.today()).isoformat()
+        try:
+            with immediate_transaction(self.conn):
+                cur = self.statements.execute("insert_volunteer", (start_date, room_number))
+        except sqlite3.IntegrityError:
+            raise NotFoundError(f"room {room_number} does not exist") from None
+        self._invalidate("librarian")
+        return cur.lastrowid
+
+    def find_librarian(self, room_number="R001"):
+        """Return a Librarian assigned to `room_number` (the front desk by default), or None."""
+        if self.cache is None:
+            return self._find_librarian(room_number)
+        return self.cache.get(self.reader, "librarian", room_number,
+                              lambda: self._find_librarian(room_number))
+
+    def _find_librarian(self, room_number):
+        return self.read_statements.fetchone("find_librarian", (room_number,), Librarian)
+
+    def _invalidate(self, namespace):
+        # Called after the write committed, so readers reloading now see it.
+        if self.cache is not None:
+            self.cache.invalidate(namespace)
@@ -0,0 +1,106 @@
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+# Request mix: mostly catalog searches, as at the kiosks, with some event lookups and
+# registrations. Weights are relative.
+DEFAULT_MIX = [
+    (70, "GET", "/items?q={word}", None),
+    (15, "GET", "/events?q={word}", None),
+    (10, "GET", "/librarian?room=R001", None),
+    (5, "POST", "/events/{event}/registrations", {"seats": 1}),
+]
+
+SEARCH_WORDS = ["the", "great", "road", "time", "book", "club", "art", "rumours", "a", "orwell"]
+
+
+async def _request(reader, writer, method, path, payload):
+    body = json.dumps(payload).encode() if payload is not None else b""
+    writer.write((f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n"
+                  f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n").encode()
+                 + body)
+    await writer.drain()
+    head = await reader.readuntil(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1])
+    length = 0
+    for line in head.split(b"\r\n"):
+        if line.lower().startswith(b"content-length:"):
+            length = int(line.split(b":", 1)[1])
+    await reader.readexactly(length)
+    return status
+
+
+async def _client(host, port, deadline, mix, rng, latencies, statuses):
+    """One keep-alive connection issuing requests back to back until the deadline."""
+    reader, writer = await asyncio.open_connection(host, port)
+    weights = [weight for weight, _, _, _ in mix]
+    try:
+        while time.perf_counter() < deadline:
+            _, method, path, payload = rng.choices(mix, weights)[0]
+            path = path.format(word=rng.choice(SEARCH_WORDS), event=rng.randint(1, 10))
+            started = time.perf_counter()
+            status = await _request(reader, writer, method, path, payload)
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+    finally:
+        writer.close()
+
+
+def percentile(sorted_values, fraction):
+    """Return the value at `fraction` (0..1) of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def run_load(host, port, concurrency=32, duration=10.0, mix=DEFAULT_MIX, seed=1):
+    """
+    Drive the server with `concurrency` keep-alive clients for `duration` seconds.
+
+    Returns a dict with requests, requests_per_sec, p50_ms, p99_ms, max_ms and the
+    count of each HTTP status seen.
+    """
+    latencies = []
+    statuses = {}
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(*[
+        _client(host, port, deadline, mix, random.Random(rng.random()), latencies, statuses)
+        for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "requests_per_sec": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": (latencies[-1] * 1000) if latencies else 0.0,
+        "statuses": statuses,
+    }
+
+
+def main(argv=None):
+    """Command-line entry point: python loadgen.py [--host H] [--port N] [-c N] [-d SECONDS]."""
+    parser = argparse.ArgumentParser(description="Generate load against library_server.py.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("-c", "--concurrency", type=int, default=32)
+    parser.add_argument("-d", "--duration", type=float, default=10.0)
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    args = parser.parse_args(argv)
+    result = asyncio.run(run_load(args.host, args.port, args.concurrency, args.duration))
+    if args.json:
+        print(json.dumps(result))
+    else:
+        print(f"{result['requests']} requests in {args.duration:.1f}s with {args.concurrency} clients: "
+              f"{result['requests_per_sec']:.0f} req/s, p50 {result['p50_ms']:.2f} ms, "
+              f"p99 {result['p99_ms']:.2f} ms, max {result['max_ms']:.2f} ms, statuses {result['statuses']}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,375 @@
+import ast
+import re
+import sqlite3
+import sys
+
+from availability import AVAILABILITY_SCHEMA, POPULATE_AVAILABILITY_SQL
+from catalog_search import SEARCH_SCHEMA
+
+# Versioned schema changes applied on top of db.sql. The version a database is at
+# is stored in PRAGMA user_version, so each migration runs exactly once per file.
+# Never edit a migration that has shipped; add a new one instead.
+MIGRATIONS = [
+    (1, "catalog search index", SEARCH_SCHEMA + """
+        INSERT INTO ItemSearch (ItemSearch) VALUES ('rebuild');
+    """),
+    (2, "secondary indexes for hot lookup columns", """
+        -- Loan history by copy and by member; also serves the FK checks on
+        -- deletes from Inventory and Member.
+        CREATE INDEX IF NOT EXISTS idx_activity_copy ON Activity (copyID);
+        CREATE INDEX IF NOT EXISTS idx_activity_member ON Activity (memberID);
+        -- Open loans only (returnDate IS NULL): small and hot.
+        CREATE INDEX IF NOT EXISTS idx_activity_open_member
+            ON Activity (memberID, dueDate) WHERE returnDate IS NULL;
+        CREATE INDEX IF NOT EXISTS idx_activity_open_due
+            ON Activity (dueDate) WHERE returnDate IS NULL;
+        -- Copies of a title, and the subset that can be borrowed right now.
+        CREATE INDEX IF NOT EXISTS idx_inventory_isbn ON Inventory (ISBN);
+        CREATE INDEX IF NOT EXISTS idx_inventory_available
+            ON Inventory (ISBN) WHERE Available = 1;
+        -- Events per room and per organiser; also serve the FK checks on Room/Personnel.
+        CREATE INDEX IF NOT EXISTS idx_event_room ON Event (roomNumber);
+        CREATE INDEX IF NOT EXISTS idx_event_personnel ON Event (personnelID);
+        -- Staff per room. roomNumber leads because ask_for_help filters Position
+        -- with LIKE '%...%', which no index can seek on.
+        CREATE INDEX IF NOT EXISTS idx_personnel_room_position
+            ON Personnel (roomNumber, Position);
+    """),
+    (3, "fine accrual run log", """
+        -- One row per day fines.accrue_fines() has brought overdue fines up to date.
+        CREATE TABLE IF NOT EXISTS FineAccrualRun (
+            runDate DATE PRIMARY KEY,
+            loansScanned INTEGER,
+            finesChanged INTEGER
+        );
+    """),
+    (4, "change counters for cached tables", """
+        -- Bumped by the triggers below on every write, so query_cache.QueryCache can
+        -- tell which cached results another connection or process made stale.
+        CREATE TABLE IF NOT EXISTS TableVersion (
+            tableName TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID;
+        INSERT OR IGNORE INTO TableVersion (tableName) VALUES ('Item'), ('Event'), ('Personnel');
+        CREATE TRIGGER IF NOT EXISTS item_version_insert AFTER INSERT ON Item BEGIN
+            UPDATE TableVersion SET version = version + 1 WHERE tableName = 'Item';
+        END;
+        CREATE TRIGGER IF NOT EXISTS item_version_update AFTER UPDATE ON Item BEGIN
+            UPDATE TableVersion SET version = version + 1 WHERE tableName = 'Item';
+        END;
+        CREATE TRIGGER IF NOT EXISTS item_version_delete AFTER DELETE ON Item BEGIN
+            UPDATE TableVersion SET version = version + 1 WHERE tableName = 'Item';
+        END;
+        CREATE TRIGGER IF NOT EXISTS event_version_insert AFTER INSERT ON Event BEGIN
+            UPDATE TableVersion SET version = version + 1 WHERE tableName = 'Event';
+        END;
+        CREATE TRIGGER IF NOT EXISTS event_version_update AFTER UPDATE ON Event BEGIN
+            UPDATE TableVersion SET version = version + 1 WHERE tableName = 'Event';
+        END;
+        CREATE TRIGGER IF NOT EXISTS event_version_delete AFTER DELETE ON Event BEGIN
+            UPDATE TableVersion SET version = version + 1 WHERE tableName = 'Event';
+        END;
+        CREATE TRIGGER IF NOT EXISTS personnel_version_insert AFTER INSERT ON Personnel BEGIN
+            UPDATE TableVersion SET version = version + 1 WHERE tableName = 'Personnel';
+        END;
+        CREATE TRIGGER IF NOT EXISTS personnel_version_update AFTER UPDATE ON Personnel BEGIN
+            UPDATE TableVersion SET version = version + 1 WHERE tableName = 'Personnel';
+        END;
+        CREATE TRIGGER IF NOT EXISTS personnel_version_delete AFTER DELETE ON Personnel BEGIN
+            UPDATE TableVersion SET version = version + 1 WHERE tableName = 'Personnel';
+        END;
+    """),
+    (5, "per-ISBN availability counters", AVAILABILITY_SCHEMA + POPULATE_AVAILABILITY_SQL + """;
+        -- Cached availability lookups follow the counters through TableVersion.
+        INSERT OR IGNORE INTO TableVersion (tableName) VALUES ('ItemAvailability');
+        CREATE TRIGGER IF NOT EXISTS availability_version_insert AFTER INSERT ON ItemAvailability BEGIN
+            UPDATE TableVersion SET version = version + 1 WHERE tableName = 'ItemAvailability';
+        END;
+        CREATE TRIGGER IF NOT EXISTS availability_version_update AFTER UPDATE ON ItemAvailability BEGIN
+            UPDATE TableVersion SET version = version + 1 WHERE tableName = 'ItemAvailability';
+        END;
+        CREATE TRIGGER IF NOT EXISTS availability_version_delete AFTER DELETE ON ItemAvailability BEGIN
+            UPDATE TableVersion SET version = version + 1 WHERE tableName = 'ItemAvailability';
+        END;
+    """),
+    (6, "holds queue", """
+        -- A member waiting for a title. Holds are served first come, first served
+        -- (holdID order). A returned copy is set aside for the next waiting hold,
+        -- which becomes 'ready' until expiresOn; the copy stays unavailable meanwhile.
+        CREATE TABLE IF NOT EXISTS Hold (
+            holdID INTEGER PRIMARY KEY,
+            ISBN TEXT NOT NULL,
+            memberID INTEGER NOT NULL,
+            placedDate DATE NOT NULL,
+            status TEXT NOT NULL DEFAULT 'waiting'
+                CHECK (status IN ('waiting', 'ready', 'fulfilled', 'expired', 'cancelled')),
+            copyID INTEGER,
+            readyDate DATE,
+            expiresOn DATE,
+            FOREIGN KEY (ISBN) REFERENCES Item(ISBN),
+            FOREIGN KEY (memberID) REFERENCES Member(memberID),
+            FOREIGN KEY (copyID) REFERENCES Inventory(copyID)
+        );
+        -- The queue of each title: the next in line is the first entry under
+        -- (ISBN, 'waiting'), one index seek however long the queue.
+        CREATE INDEX IF NOT EXISTS idx_hold_queue ON Hold (ISBN, status, holdID);
+        -- Ready holds by expiry date, for the sweep; also finds a member's holds.
+        CREATE INDEX IF NOT EXISTS idx_hold_expiry ON Hold (status, expiresOn);
+        CREATE INDEX IF NOT EXISTS idx_hold_copy ON Hold (copyID, status);
+        -- At most one waiting or ready hold per member and title.
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_hold_active_member
+            ON Hold (memberID, ISBN) WHERE status IN ('waiting', 'ready');
+    """),
+    (7, "member account lookups", """
+        -- Holds every Activity column the member account reads, so a member's open
+        -- loans are one index range without touching the table. It leads with
+        -- memberID, so it replaces idx_activity_member for lookups and FK checks.
+        CREATE INDEX IF NOT EXISTS idx_activity_member_account
+            ON Activity (memberID, returnDate, dueDate, copyID, borrowDate);
+        DROP INDEX IF EXISTS idx_activity_member;
+        -- Unpaid fines by member. Fine is keyed by loan only, so without this the
+        -- account would have to probe Fine once for every loan in the member's history.
+        CREATE TABLE IF NOT EXISTS UnpaidFine (
+            memberID INTEGER NOT NULL,
+            loanID INTEGER NOT NULL,
+            PRIMARY KEY (memberID, loanID)
+        ) WITHOUT ROWID;
+        INSERT OR IGNORE INTO UnpaidFine (memberID, loanID)
+            SELECT Activity.memberID, Fine.loanID
+            FROM Fine JOIN Activity ON Activity.loanID = Fine.loanID
+            WHERE Fine.paymentDate IS NULL AND Activity.memberID IS NOT NULL
+            ORDER BY 1, 2;
+        CREATE TRIGGER IF NOT EXISTS unpaid_fine_insert AFTER INSERT ON Fine
+        WHEN NEW.paymentDate IS NULL BEGIN
+            INSERT OR IGNORE INTO UnpaidFine (memberID, loanID)
+            SELECT memberID, loanID FROM Activity WHERE loanID = NEW.loanID AND memberID IS NOT NULL;
+        END;
+        CREATE TRIGGER IF NOT EXISTS unpaid_fine_delete AFTER DELETE ON Fine
+        WHEN OLD.paymentDate IS NULL BEGIN
+            DELETE FROM UnpaidFine
+            WHERE memberID = (SELECT memberID FROM Activity WHERE loanID = OLD.loanID)
+              AND loanID = OLD.loanID;
+        END;
+        CREATE TRIGGER IF NOT EXISTS unpaid_fine_paid AFTER UPDATE OF paymentDate ON Fine
+        WHEN (OLD.paymentDate IS NULL) <> (NEW.paymentDate IS NULL) BEGIN
+            DELETE FROM UnpaidFine
+            WHERE NEW.paymentDate IS NOT NULL
+              AND memberID = (SELECT memberID FROM Activity WHERE loanID = OLD.loanID)
+              AND loanID = OLD.loanID;
+            INSERT OR IGNORE INTO UnpaidFine (memberID, loanID)
+            SELECT memberID, loanID FROM Activity
+            WHERE NEW.paymentDate IS NULL AND loanID = NEW.loanID AND memberID IS NOT NULL;
+        END;
+        CREATE TRIGGER IF NOT EXISTS unpaid_fine_member AFTER UPDATE OF memberID ON Activity
+        WHEN OLD.memberID IS NOT NEW.memberID BEGIN
+            UPDATE UnpaidFine SET memberID = NEW.memberID
+            WHERE memberID = OLD.memberID AND loanID = NEW.loanID;
+        END;
+    """),
+    (8, "event schedule interval index", """
+        -- Each event's time span as whole minutes since 1970, in an integer R*Tree, so
+        -- the events overlapping a window are one index query instead of a scan of
+        -- Event. Spans are stored as [start, end - 1] so back-to-back events do not
+        -- overlap. Events with a missing or empty span are left out.
+        CREATE VIRTUAL TABLE IF NOT EXISTS EventSchedule
+            USING rtree_i32(EventID, startMinute, endMinute, +roomNumber);
+        INSERT INTO EventSchedule (EventID, startMinute, endMinute, roomNumber)
+            SELECT EventID, startMinute, endMinute - 1, roomNumber FROM (
+                SELECT EventID, roomNumber,
+                       CAST(strftime('%s', startDate || ' ' || startTime) AS INTEGER) / 60 AS startMinute,
+                       CAST(strftime('%s', endDate || ' ' || endTime) AS INTEGER) / 60 AS endMinute
+                FROM Event)
+            WHERE endMinute > startMinute;
+        CREATE TRIGGER IF NOT EXISTS event_schedule_insert AFTER INSERT ON Event BEGIN
+            INSERT INTO EventSchedule (EventID, startMinute, endMinute, roomNumber)
+            SELECT NEW.EventID, startMinute, endMinute - 1, NEW.roomNumber FROM (
+                SELECT CAST(strftime('%s', NEW.startDate || ' ' || NEW.startTime) AS INTEGER) / 60 AS startMinute,
+                       CAST(strftime('%s', NEW.endDate || ' ' || NEW.endTime) AS INTEGER) / 60 AS endMinute)
+            WHERE endMinute > startMinute;
+        END;
+        -- reservedSeats changes on every registration and is not watched.
+        CREATE TRIGGER IF NOT EXISTS event_schedule_update
+        AFTER UPDATE OF EventID, startDate, endDate, startTime, endTime, roomNumber ON Event BEGIN
+            DELETE FROM EventSchedule WHERE EventID = OLD.EventID;
+            INSERT INTO EventSchedule (EventID, startMinute, endMinute, roomNumber)
+            SELECT NEW.EventID, startMinute, endMinute - 1, NEW.roomNumber FROM (
+                SELECT CAST(strftime('%s', NEW.startDate || ' ' || NEW.startTime) AS INTEGER) / 60 AS startMinute,
+                       CAST(strftime('%s', NEW.endDate || ' ' || NEW.endTime) AS INTEGER) / 60 AS endMinute)
+            WHERE endMinute > startMinute;
+        END;
+        CREATE TRIGGER IF NOT EXISTS event_schedule_delete AFTER DELETE ON Event BEGIN
+            DELETE FROM EventSchedule WHERE EventID = OLD.EventID;
+        END;
+        -- Rooms seating at least N, smallest first.
+        CREATE INDEX IF NOT EXISTS idx_room_capacity ON Room (maxCapacity, roomNumber);
+    """),
+    (9, "keep room-less events out of the event schedule", """
+        -- An event without a room holds no room, so it has no place in EventSchedule.
+        DELETE FROM EventSchedule WHERE roomNumber IS NULL;
+        DROP TRIGGER IF EXISTS event_schedule_insert;
+        CREATE TRIGGER event_schedule_insert AFTER INSERT ON Event
+        WHEN NEW.roomNumber IS NOT NULL BEGIN
+            INSERT INTO EventSchedule (EventID, startMinute, endMinute, roomNumber)
+            SELECT NEW.EventID, startMinute, endMinute - 1, NEW.roomNumber FROM (
+                SELECT CAST(strftime('%s', NEW.startDate || ' ' || NEW.startTime) AS INTEGER) / 60 AS startMinute,
+                       CAST(strftime('%s', NEW.endDate || ' ' || NEW.endTime) AS INTEGER) / 60 AS endMinute)
+            WHERE endMinute > startMinute;
+        END;
+        -- The old entry goes even when the room is cleared; a new one only with a room.
+        DROP TRIGGER IF EXISTS event_schedule_update;
+        CREATE TRIGGER event_schedule_update
+        AFTER UPDATE OF EventID, startDate, endDate, startTime, endTime, roomNumber ON Event BEGIN
+            DELETE FROM EventSchedule WHERE EventID = OLD.EventID;
+            INSERT INTO EventSchedule (EventID, startMinute, endMinute, roomNumber)
+            SELECT NEW.EventID, startMinute, endMinute - 1, NEW.roomNumber FROM (
+                SELECT CAST(strftime('%s', NEW.startDate || ' ' || NEW.startTime) AS INTEGER) / 60 AS startMinute,
+                       CAST(strftime('%s', NEW.endDate || ' ' || NEW.endTime) AS INTEGER) / 60 AS endMinute)
+            WHERE endMinute > startMinute AND NEW.roomNumber IS NOT NULL;
+        END;
+    """),
+    # SEARCH_SCHEMA now declares prefix='1 2 3 4'. Databases created before that have
+    # the '2 3 4' index, and an FTS5 table's prefixes cannot be altered, so it is rebuilt.
+    (10, "one-letter prefix index for catalog search", """
+        DROP TABLE IF EXISTS ItemSearch;
+    """ + SEARCH_SCHEMA + """
+        INSERT INTO ItemSearch (ItemSearch) VALUES ('rebuild');
+    """),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# Modules whose SQL is checked by find_full_scans().
+CHECKED_MODULES = ["library_app.py", "library_service.py", "catalog_search.py", "fines.py",
+                   "availability.py"]
+
+# Full scans that are expected, keyed by (function name, table).
+ALLOWED_SCANS = {
+    # Substring LIKE on event name/type cannot use a b-tree index.
+    ("_find_events", "Event"): "substring search over the event schedule",
+    # An empty catalog search walks the ISBN index and stops at LIMIT.
+    ("search_items", "Item"): "bounded walk of the ISBN index for an empty search",
+    # The consistency checker compares and rebuilds every counter on purpose.
+    ("check_availability", "ItemAvailability"): "full rebuild of the availability counters",
+}
+
+
+def schema_version(conn):
+    """Return the migration version recorded in the database."""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn, target=LATEST_VERSION):
+    """
+    Apply every pending migration up to `target`.
+
+    Each migration runs in its own transaction together with the version bump, so a
+    failure leaves the database at the last migration that succeeded.
+    Returns the list of versions that were applied.
+    """
+    applied = []
+    current = schema_version(conn)
+    for version, description, sql in MIGRATIONS:
+        if version <= current or version > target:
+            continue
+        try:
+            conn.executescript(
+                "BEGIN IMMEDIATE;\n%s\nPRAGMA user_version = %d;\nCOMMIT;" % (sql, version)
+            )
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        applied.append(version)
+    return applied
+
+
+def collect_statements(path):
+    """
+    Return the SQL literals passed to execute()/executemany() in a Python file.
+
+    Returns a list of (function name, line number, sql) for every call whose first
+    argument is a string literal, a module-level string constant, or the name of a
+    statement in a module-level registry dict such as library_service.STATEMENTS
+    (run through PreparedStatements' execute/executemany/fetchall/fetchone).
+    """
+    with open(path) as f:
+        tree = ast.parse(f.read(), filename=path)
+    # Module-level SQL constants such as INSERT_SQL = "..." are resolved by name,
+    # and registries such as STATEMENTS = {"name": "..."} by key.
+    constants = {}
+    registry = {}
+    for node in tree.body:
+        if not isinstance(node, ast.Assign):
+            continue
+        if isinstance(node.value, ast.Constant) and isinstance(node.value.value, str):
+            for target in node.targets:
+                if isinstance(target, ast.Name):
+                    constants[target.id] = node.value.value
+        elif isinstance(node.value, ast.Dict):
+            for key, value in zip(node.value.keys, node.value.values):
+                if (isinstance(key, ast.Constant) and isinstance(value, ast.Constant)
+                        and isinstance(value.value, str)):
+                    registry[key.value] = value.value
+    statements = []
+    for func in ast.walk(tree):
+        if not isinstance(func, ast.FunctionDef):
+            continue
+        for node in ast.walk(func):
+            if not (isinstance(node, ast.Call)
+                    and isinstance(node.func, ast.Attribute)
+                    and node.func.attr in ("execute", "executemany", "fetchall", "fetchone")
+                    and node.args):
+                continue
+            arg = node.args[0]
+            if isinstance(arg, ast.Constant) and isinstance(arg.value, str):
+                statements.append((func.name, node.lineno, registry.get(arg.value, arg.value)))
+            elif isinstance(arg, ast.Name) and arg.id in constants:
+                statements.append((func.name, node.lineno, constants[arg.id]))
+    return statements
+
+
+def find_full_scans(conn, paths=CHECKED_MODULES):
+    """
+    Run EXPLAIN QUERY PLAN over every statement in `paths` and report full scans.
+
+    `conn` must be a migrated database. Returns a list of
+    (path, line, function name, plan detail) for every table scan that is not
+    listed in ALLOWED_SCANS.
+    """
+    offenders = []
+    for path in paths:
+        for func_name, lineno, sql in collect_statements(path):
+            if not re.match(r"\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b", sql, re.I):
+                continue
+            if "sqlite_master" in sql:
+                continue
+            # Placeholders are bound to NULL; the plan does not depend on the values.
+            code = re.sub(r"'[^']*'", "", sql)
+            names = re.findall(r":(\w+)", code)
+            params = dict.fromkeys(names) if names else (None,) * code.count("?")
+            for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params):
+                detail = row[3]
+                match = re.match(r"SCAN (\w+)", detail)
+                if not match or "VIRTUAL TABLE" in detail or "CONSTANT ROW" in detail:
+                    continue
+                if (func_name, match.group(1)) in ALLOWED_SCANS:
+                    continue
+                offenders.append((path, lineno, func_name, detail))
+    return offenders
+
+
+def main(argv):
+    """Migrate the database named on the command line and check query plans."""
+    path = argv[1] if len(argv) > 1 else "library.db"
+    conn = sqlite3.connect(path)
+    applied = migrate(conn)
+    print(f"{path}: schema version {schema_version(conn)}"
+          + (f" (applied {', '.join(map(str, applied))})" if applied else ""))
+    offenders = find_full_scans(conn)
+    for path, lineno, func_name, detail in offenders:
+        print(f"{path}:{lineno} {func_name}: {detail}")
+    conn.close()
+    return 1 if offenders else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,245 @@
+import cProfile
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from instrumentation import normalize_sql, trigger_events, triggers_for
+
+# How often, in seconds, the sampler records the profiled thread's stack.
+DEFAULT_INTERVAL = 0.001
+
+# SQLite virtual-machine instructions between progress-handler calls. Each call charges
+# that many steps to the running statement and marks the thread as busy in SQLite.
+DEFAULT_SQL_STEPS = 1000
+
+# Longest statement text kept in a flame-graph frame.
+MAX_SQL_LABEL = 80
+
+# Statements shown per operation in summary.txt.
+SUMMARY_STATEMENTS = 10
+
+# String and number literals, which the trace callback sees inlined into the statement.
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+def statement_shape(sql):
+    """Return `sql` with its literals replaced by ?, so executions with different values add up."""
+    return LITERALS.sub("?", normalize_sql(sql))
+
+
+def frame_label(frame):
+    """Return the flame-graph label of a Python frame: function (file:line)."""
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+class OperationProfile:
+    """What the profiler collected for one operation name, over all its calls."""
+
+    def __init__(self, cprofile=False):
+        self.calls = 0
+        self.seconds = 0.0
+        # Collapsed stack (a tuple of frame labels) -> number of samples.
+        self.samples = Counter()
+        # Statement shape -> executions, trigger programs run, and VM steps.
+        self.statements = Counter()
+        self.trigger_runs = Counter()
+        self.sql_steps = Counter()
+        # Statement shape -> the triggers that can fire for it.
+        self.triggers = {}
+        self.cprofile = cProfile.Profile() if cprofile else None
+
+
+class ProfiledOperation:
+    """
+    Context manager that profiles the block it wraps; see Profiler.operation().
+
+    The stacks are taken relative to the frame that entered the block, so every
+    collapsed stack starts with the operation name followed by the operation's own calls.
+    """
+
+    def __init__(self, profiler, name, conn):
+        self.profiler = profiler
+        self.name = name
+        self.conn = conn
+        self.data = profiler.profile_for(name)
+        self.events = {}
+        self.traced = None
+        self.call = None
+        self.statement = None
+        self.in_trigger = False
+        self.busy = False
+
+    def __enter__(self):
+        self.entry = sys._getframe(1)
+        self.thread_id = threading.get_ident()
+        if self.conn is not None:
+            # Read once here: the trace callback runs mid-statement and cannot query.
+            self.events = trigger_events(self.conn)
+            self.conn.set_trace_callback(self._trace)
+            self.conn.set_progress_handler(self._progress, self.profiler.sql_steps)
+        self.stop = threading.Event()
+        self.sampler = threading.Thread(target=self._sample, name="profile-sampler", daemon=True)
+        self.sampler.start()
+        self.started = time.perf_counter()
+        if self.data.cprofile is not None:
+            self.data.cprofile.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.data.cprofile is not None:
+            self.data.cprofile.disable()
+        self.data.seconds += time.perf_counter() - self.started
+        self.data.calls += 1
+        self.stop.set()
+        self.sampler.join()
+        if self.conn is not None:
+            self.conn.set_trace_callback(None)
+            self.conn.set_progress_handler(None, 0)
+        # Do not keep the last caller's frame, and its locals, alive.
+        self.call = None
+        return False
+
+    def _trace(self, sql):
+        # Statements that SQLite runs for a virtual table (FTS5 reads its shadow tables
+        # this way) are traced as comments; their cost stays with the calling statement.
+        if sql.startswith("--"):
+            return
+        # sqlite3 traces a trigger program with the expanded text of the statement that
+        # fired it, from inside the same call into sqlite3. The same text also comes back
+        # when a statement is run again with the same values, but then from a new call, so
+        # a repeat only counts as trigger work while the calling frame is still at the same
+        # instruction. Identical executemany() rows, or a loop re-running identical SQL
+        # straight from one line, still look like trigger work on a table with triggers.
+        caller = sys._getframe(1)
+        call = (caller, caller.f_lasti)
+        if sql == self.traced and call == self.call and self.data.triggers.get(self.statement):
+            self.in_trigger = True
+            self.data.trigger_runs[self.statement] += 1
+            return
+        shape = statement_shape(sql)
+        self.traced = sql
+        self.call = call
+        self.statement = shape
+        self.in_trigger = False
+        self.data.statements[shape] += 1
+        if shape not in self.data.triggers:
+            self.data.triggers[shape] = triggers_for(self.conn, shape, self.events)
+
+    def _progress(self):
+        self.busy = True
+        self.data.sql_steps[self.statement] += self.profiler.sql_steps
+        return 0
+
+    def _sample(self):
+        while not self.stop.wait(self.profiler.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and frame is not self.entry:
+                # Leave out the profiler's own __enter__ and __exit__.
+                if frame.f_code.co_filename != __file__:
+                    stack.append(frame_label(frame))
+                frame = frame.f_back
+            stack.append(self.name)
+            stack.reverse()
+            # The thread was inside SQLite if the progress handler ran since the last sample.
+            if self.busy and self.statement is not None:
+                self.busy = False
+                stack.append("sqlite: " + self.statement[:MAX_SQL_LABEL])
+                if self.in_trigger:
+                    stack.append("sqlite: triggers")
+            self.data.samples[tuple(label.replace(";", ",") for label in stack)] += 1
+
+
+class Profiler:
+    """
+    Profiles operations and writes collapsed-stack files that flame-graph tools render.
+
+    Each operation() block is profiled three ways:
+    - A sampler thread records the thread's Python stack every `interval` seconds of
+      wall time. Console I/O shows up as time spent on the line that calls input() or
+      print(), and samples taken while SQLite was working get a frame for the statement
+      and, while its triggers run, a "sqlite: triggers" frame under it.
+    - The connection's trace callback counts statements and trigger programs, and its
+      progress handler counts the SQLite VM steps each statement took.
+    - With `cprofile`, a cProfile.Profile per operation name records exact call counts.
+
+    write() puts <name>.folded (one "frame;frame;... samples" line per stack) for every
+    operation into `directory`, plus <name>.pstats with cProfile and a summary.txt.
+    Nothing is installed outside operation() blocks, so code run without a Profiler, or
+    outside its blocks, pays nothing.
+    """
+
+    def __init__(self, directory, interval=DEFAULT_INTERVAL, sql_steps=DEFAULT_SQL_STEPS, cprofile=False):
+        self.directory = directory
+        self.interval = interval
+        self.sql_steps = sql_steps
+        self.cprofile = cprofile
+        self.profiles = {}
+
+    def profile_for(self, name):
+        """Return the OperationProfile for `name`, creating it on first use."""
+        profile = self.profiles.get(name)
+        if profile is None:
+            profile = self.profiles[name] = OperationProfile(self.cprofile)
+        return profile
+
+    def operation(self, name, conn=None):
+        """Profile the block as operation `name`; SQL is traced on `conn` if it is given."""
+        return ProfiledOperation(self, name, conn)
+
+    def summary(self):
+        """Return a text report: calls, time and samples per operation, and its costliest statements."""
+        lines = []
+        for name, profile in sorted(self.profiles.items()):
+            samples = sum(profile.samples.values())
+            lines.append(f"{name}: {profile.calls} calls, {profile.seconds * 1000:.1f} ms, {samples} samples")
+            ranked = sorted(profile.statements, key=lambda shape: -profile.sql_steps[shape])
+            for shape in ranked[:SUMMARY_STATEMENTS]:
+                line = (f"  {profile.statements[shape]:6d} runs {profile.sql_steps[shape]:10d} steps  "
+                        f"{shape[:100]}")
+                if profile.trigger_runs[shape]:
+                    line += (f"\n  {profile.trigger_runs[shape]:6d} trigger programs: "
+                             f"{', '.join(profile.triggers[shape])}")
+                lines.append(line)
+        return "\n".join(lines) + "\n"
+
+    def write(self, directory=None):
+        """Write the collapsed stacks, cProfile stats and summary. Returns the paths written."""
+        directory = directory or self.directory
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for name, profile in self.profiles.items():
+            path = os.path.join(directory, name + ".folded")
+            with open(path, "w") as f:
+                for stack, count in sorted(profile.samples.items()):
+                    f.write(";".join(stack) + f" {count}\n")
+            paths.append(path)
+            if profile.cprofile is not None:
+                path = os.path.join(directory, name + ".pstats")
+                profile.cprofile.dump_stats(path)
+                paths.append(path)
+        path = os.path.join(directory, "summary.txt")
+        with open(path, "w") as f:
+            f.write(self.summary())
+        paths.append(path)
+        return paths
+
+
+def profiler_from_env(environ=None):
+    """
+    Return a Profiler configured from the environment, or None if profiling is off.
+
+    LIBRARY_PROFILE names the directory the profiles are written to and turns profiling
+    on. LIBRARY_PROFILE_INTERVAL_MS sets the sampling interval and LIBRARY_PROFILE_CPROFILE=1
+    also runs cProfile.
+    """
+    environ = os.environ if environ is None else environ
+    if not environ.get("LIBRARY_PROFILE"):
+        return None
+    interval = float(environ.get("LIBRARY_PROFILE_INTERVAL_MS", DEFAULT_INTERVAL * 1000)) / 1000
+    return Profiler(environ["LIBRARY_PROFILE"], interval=interval,
+                    cprofile=environ.get("LIBRARY_PROFILE_CPROFILE") == "1")
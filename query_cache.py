@@ -0,0 +1,154 @@
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+# Connections whose last seen state is remembered; the oldest are forgotten beyond this.
+MAX_TRACKED_CONNECTIONS = 64
+
+# Default limits of a QueryCache.
+DEFAULT_MAX_ENTRIES = 4096
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+DEFAULT_TTL = 300.0
+
+# Counters reported by QueryCache.stats().
+CacheStats = namedtuple("CacheStats", "hits misses evictions expirations invalidations entries bytes")
+
+
+def estimate_size(value):
+    """Roughly estimate the memory held by a cached result: a list, tuple or dict of records."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(sys.getsizeof(key) for key in value)
+        value = list(value.values())
+    if isinstance(value, (list, tuple)):
+        for record in value:
+            size += sys.getsizeof(record)
+            if isinstance(record, tuple):
+                size += sum(sys.getsizeof(field) for field in record)
+    return size
+
+
+class QueryCache:
+    """
+    In-process LRU cache of query results with a time-to-live and a memory cap.
+
+    Results are grouped in namespaces (e.g. "items"), each depending on one or more
+    tables. Before every lookup the cache checks whether the database changed since
+    it last looked: PRAGMA data_version moves when another connection, in this or any
+    other process, commits, and the connection's total_changes moves when it writes
+    itself. Only then does it read TableVersion, whose counters are bumped by
+    triggers on the tracked tables, and drop the namespaces whose tables changed.
+    Writers can also call invalidate() directly. Use one cache per database file;
+    it is safe to share between threads and connections.
+    """
+
+    def __init__(self, tables, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES,
+                 ttl=DEFAULT_TTL):
+        # tables maps each namespace to the tables its results are read from.
+        self.tables = tables
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()   # (namespace, key) -> (value, size, expires)
+        self._generations = dict.fromkeys(tables, 0)
+        self._versions = None           # tableName -> version last read from TableVersion
+        self._seen = {}                 # connection -> (data_version, total_changes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = self._misses = self._evictions = self._expirations = self._invalidations = 0
+
+    def get(self, conn, namespace, key, load):
+        """
+        Return the cached result for (namespace, key), calling load() on a miss.
+
+        `conn` is the connection load() reads from; it is used to notice changes made
+        by other connections and processes. Inside a transaction the result may include
+        uncommitted changes, so it is loaded directly and neither read from nor stored.
+        """
+        if conn.in_transaction:
+            return load()
+        self.validate(conn)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is not None:
+                if entry[2] > now:
+                    self._entries.move_to_end((namespace, key))
+                    self._hits += 1
+                    return entry[0]
+                self._remove((namespace, key))
+                self._expirations += 1
+            self._misses += 1
+            generation = self._generations[namespace]
+        value = load()
+        with self._lock:
+            # Skip the store if the namespace was invalidated while load() ran, since
+            # the result may predate the change.
+            if self._generations[namespace] == generation:
+                self._store((namespace, key), value, now + self.ttl)
+        return value
+
+    def validate(self, conn):
+        """Drop the namespaces whose tables changed since `conn` last looked."""
+        token = (conn.execute("PRAGMA data_version").fetchone()[0], conn.total_changes)
+        if self._seen.get(conn) == token:
+            return
+        try:
+            versions = dict(conn.execute("SELECT tableName, version FROM TableVersion").fetchall())
+        except sqlite3.OperationalError:
+            # Not migrated yet: any change may touch any table.
+            versions = None
+        with self._lock:
+            if versions is None or self._versions is None:
+                changed = None
+            else:
+                changed = {name for name in set(versions) | set(self._versions)
+                           if versions.get(name) != self._versions.get(name)}
+            self._versions = versions
+            if len(self._seen) >= MAX_TRACKED_CONNECTIONS and conn not in self._seen:
+                # Forgetting a connection only costs it one extra TableVersion read.
+                del self._seen[next(iter(self._seen))]
+            self._seen[conn] = token
+        for namespace, tables in self.tables.items():
+            if changed is None or changed.intersection(tables):
+                self.invalidate(namespace)
+
+    def invalidate(self, namespace):
+        """Drop every cached result of `namespace`."""
+        with self._lock:
+            self._generations[namespace] += 1
+            stale = [key for key in self._entries if key[0] == namespace]
+            for key in stale:
+                self._remove(key)
+            self._invalidations += len(stale)
+
+    def forget(self, conn):
+        """Stop tracking `conn`, e.g. before closing it."""
+        with self._lock:
+            self._seen.pop(conn, None)
+
+    def clear(self):
+        for namespace in self.tables:
+            self.invalidate(namespace)
+
+    def stats(self):
+        with self._lock:
+            return CacheStats(self._hits, self._misses, self._evictions, self._expirations,
+                              self._invalidations, len(self._entries), self._bytes)
+
+    def _store(self, key, value, expires):
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (value, size, expires)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self._evictions += 1
+
+    def _remove(self, key):
+        self._bytes -= self._entries.pop(key)[1]
@@ -0,0 +1,314 @@
+import argparse
+import csv
+import datetime
+import json
+import os
+import sqlite3
+import sys
+import time
+from collections import namedtuple
+from urllib.parse import quote
+
+from connection_manager import DEFAULT_DB_PATH, open_connection
+
+# Schema name the library database is attached under, always read-only.
+SOURCE_NAME = "source"
+
+# Rollups kept in the reports database, separate from library.db, so building them
+# never writes to the library. Each fact is counted once, when it becomes final:
+#   * a loan when it is first seen (TitleLoans) and again when it is returned (ReturnsByType),
+#   * a fine when it is seen paid (FineRevenue),
+#   * an event when it has ended (EventFill).
+# The Pending* tables hold the keys that were not final at the last run; together with
+# the highest loanID and EventID already seen (ReportState) they are all a run revisits.
+REPORTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ReportState (
+    name TEXT PRIMARY KEY,
+    value
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS PendingLoan (loanID INTEGER PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS PendingFine (loanID INTEGER PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS PendingEvent (EventID INTEGER PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS TitleLoans (
+    ISBN TEXT PRIMARY KEY,
+    itemType TEXT,
+    loans INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS ReturnsByType (
+    itemType TEXT PRIMARY KEY,
+    returned INTEGER NOT NULL,
+    late INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS FineRevenue (
+    month TEXT PRIMARY KEY,
+    fines INTEGER NOT NULL,
+    amount REAL NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS EventFill (
+    month TEXT,
+    eventType TEXT,
+    events INTEGER NOT NULL,
+    seats INTEGER NOT NULL,
+    capacity INTEGER NOT NULL,
+    PRIMARY KEY (month, eventType)
+) WITHOUT ROWID;
+"""
+
+# One refresh, run in order inside a single read transaction on the library, so every
+# step sees the same snapshot. :last_loan/:max_loan and :last_event/:max_event bound
+# the rows that are new since the previous run.
+REFRESH_STEPS = [
+    # New loans count towards their title and wait in PendingLoan until returned.
+    """
+    INSERT INTO TitleLoans (ISBN, itemType, loans)
+    SELECT COALESCE(Inventory.ISBN, ''), COALESCE(Item.itemType, ''), COUNT(*)
+    FROM source.Activity
+    LEFT JOIN source.Inventory ON Inventory.copyID = Activity.copyID
+    LEFT JOIN source.Item ON Item.ISBN = Inventory.ISBN
+    WHERE Activity.loanID > :last_loan AND Activity.loanID <= :max_loan
+    GROUP BY 1
+    ON CONFLICT (ISBN) DO UPDATE SET loans = loans + excluded.loans
+    """,
+    """
+    INSERT OR IGNORE INTO PendingLoan (loanID)
+    SELECT loanID FROM source.Activity WHERE loanID > :last_loan AND loanID <= :max_loan
+    """,
+    # Returned loans count as on time or late, and their fine (if any) is checked below.
+    """
+    CREATE TEMP TABLE ClosedLoan AS
+    SELECT Activity.loanID, COALESCE(Item.itemType, '') AS itemType,
+           Activity.returnDate > Activity.dueDate AS late
+    FROM PendingLoan
+    JOIN source.Activity ON Activity.loanID = PendingLoan.loanID
+    LEFT JOIN source.Inventory ON Inventory.copyID = Activity.copyID
+    LEFT JOIN source.Item ON Item.ISBN = Inventory.ISBN
+    WHERE Activity.returnDate IS NOT NULL
+    """,
+    """
+    INSERT INTO ReturnsByType (itemType, returned, late)
+    SELECT itemType, COUNT(*), COALESCE(SUM(late), 0) FROM ClosedLoan GROUP BY itemType
+    ON CONFLICT (itemType) DO UPDATE SET
+        returned = returned + excluded.returned, late = late + excluded.late
+    """,
+    "INSERT OR IGNORE INTO PendingFine (loanID) SELECT loanID FROM ClosedLoan",
+    """
+    DELETE FROM PendingLoan
+    WHERE loanID IN (SELECT loanID FROM ClosedLoan)
+       OR NOT EXISTS (SELECT 1 FROM source.Activity WHERE Activity.loanID = PendingLoan.loanID)
+    """,
+    "DROP TABLE ClosedLoan",
+    # Paid fines count in the month they were paid; unpaid ones stay pending.
+    """
+    INSERT INTO FineRevenue (month, fines, amount)
+    SELECT substr(Fine.paymentDate, 1, 7), COUNT(*), SUM(Fine.amount)
+    FROM PendingFine JOIN source.Fine ON Fine.loanID = PendingFine.loanID
+    WHERE Fine.paymentDate IS NOT NULL
+    GROUP BY 1
+    ON CONFLICT (month) DO UPDATE SET
+        fines = fines + excluded.fines, amount = amount + excluded.amount
+    """,
+    """
+    DELETE FROM PendingFine
+    WHERE NOT EXISTS (SELECT 1 FROM source.Fine
+                      WHERE Fine.loanID = PendingFine.loanID AND Fine.paymentDate IS NULL)
+    """,
+    # Events count once they have ended, when their seats can no longer change. A
+    # single-day event may have no endDate; it ends on its startDate.
+    """
+    INSERT OR IGNORE INTO PendingEvent (EventID)
+    SELECT EventID FROM source.Event WHERE EventID > :last_event AND EventID <= :max_event
+    """,
+    """
+    INSERT INTO EventFill (month, eventType, events, seats, capacity)
+    SELECT substr(Event.startDate, 1, 7), COALESCE(Event.eventType, ''), COUNT(*),
+           SUM(COALESCE(Event.reservedSeats, 0)), SUM(COALESCE(Room.maxCapacity, 0))
+    FROM PendingEvent
+    JOIN source.Event ON Event.EventID = PendingEvent.EventID
+    LEFT JOIN source.Room ON Room.roomNumber = Event.roomNumber
+    WHERE COALESCE(Event.endDate, Event.startDate) < :today
+    GROUP BY 1, 2
+    ON CONFLICT (month, eventType) DO UPDATE SET
+        events = events + excluded.events, seats = seats + excluded.seats,
+        capacity = capacity + excluded.capacity
+    """,
+    """
+    DELETE FROM PendingEvent
+    WHERE NOT EXISTS (SELECT 1 FROM source.Event
+                      WHERE Event.EventID = PendingEvent.EventID
+                        AND COALESCE(Event.endDate, Event.startDate) >= :today)
+    """,
+]
+
+# The reports, read from the rollups. Titles come from the attached library.
+REPORTS = {
+    "top_titles": """
+        SELECT TitleLoans.ISBN, Item.title, TitleLoans.itemType, TitleLoans.loans
+        FROM TitleLoans LEFT JOIN source.Item ON Item.ISBN = TitleLoans.ISBN
+        ORDER BY TitleLoans.loans DESC, TitleLoans.ISBN
+        LIMIT :limit
+    """,
+    "overdue_rate": """
+        SELECT itemType, returned, late, ROUND(1.0 * late / returned, 4) AS overdueRate
+        FROM ReturnsByType
+        ORDER BY itemType
+    """,
+    "fine_revenue": "SELECT month, fines, ROUND(amount, 2) AS amount FROM FineRevenue ORDER BY month",
+    "event_fill": """
+        SELECT month, eventType, events, seats, capacity,
+               ROUND(1.0 * seats / NULLIF(capacity, 0), 4) AS fillRate
+        FROM EventFill
+        ORDER BY month, eventType
+    """,
+}
+
+# Summary of one refresh: how far the loan and event IDs moved since the last run, the
+# keys still pending afterwards, and the time it took.
+RefreshStats = namedtuple("RefreshStats", "new_loans new_events pending_loans pending_fines pending_events seconds")
+
+# A report's column names and rows.
+Report = namedtuple("Report", "name columns rows")
+
+EXPORT_FORMATS = ("csv", "columnar")
+
+
+def take_snapshot(source_path, snapshot_path):
+    """
+    Copy the library at `source_path` to `snapshot_path` with the sqlite backup API.
+
+    The copy is made in one step on a read-only connection, so it is a single
+    consistent snapshot and only ever holds a read lock; in WAL mode kiosks keep
+    committing while it runs.
+    """
+    source = open_connection(source_path, read_only=True)
+    target = sqlite3.connect(snapshot_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+def open_reports(reports_path, source_path):
+    """
+    Open the reports database and attach the library at `source_path` read-only.
+
+    The library is attached with mode=ro, so nothing done through this connection
+    can take its write lock.
+    """
+    conn = open_connection(reports_path)
+    conn.execute("ATTACH DATABASE ? AS %s" % SOURCE_NAME,
+                 ("file:%s?mode=ro" % quote(os.path.abspath(source_path)),))
+    conn.executescript(REPORTS_SCHEMA)
+    return conn
+
+
+def _state(conn, name):
+    row = conn.execute("SELECT value FROM ReportState WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else 0
+
+
+def refresh(conn, today=None):
+    """
+    Bring the rollups up to date with the attached library. Returns a RefreshStats.
+
+    Everything runs in one deferred transaction: the reads of the library share one
+    WAL snapshot, and only the reports database is written. The cost follows the
+    rows added since the last run plus the loans, fines and events still pending,
+    not the size of the history.
+    """
+    started = time.perf_counter()
+    today = str(today or datetime.date.today())
+    # Deferred, not IMMEDIATE: IMMEDIATE would start a write on every attached database.
+    conn.execute("BEGIN")
+    try:
+        params = {
+            "today": today,
+            "last_loan": _state(conn, "lastLoanID"),
+            "last_event": _state(conn, "lastEventID"),
+            "max_loan": conn.execute("SELECT COALESCE(MAX(loanID), 0) FROM source.Activity").fetchone()[0],
+            "max_event": conn.execute("SELECT COALESCE(MAX(EventID), 0) FROM source.Event").fetchone()[0],
+        }
+        for sql in REFRESH_STEPS:
+            names = [name for name in params if ":" + name in sql]
+            conn.execute(sql, {name: params[name] for name in names})
+        conn.executemany("INSERT OR REPLACE INTO ReportState (name, value) VALUES (?, ?)", [
+            ("lastLoanID", max(params["max_loan"], params["last_loan"])),
+            ("lastEventID", max(params["max_event"], params["last_event"])),
+            ("lastRefresh", today),
+        ])
+        pending = [conn.execute("SELECT COUNT(*) FROM %s" % table).fetchone()[0]
+                   for table in ("PendingLoan", "PendingFine", "PendingEvent")]
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+    return RefreshStats(max(0, params["max_loan"] - params["last_loan"]),
+                        max(0, params["max_event"] - params["last_event"]),
+                        *pending, time.perf_counter() - started)
+
+
+def run_report(conn, name, limit=20):
+    """Return the Report `name` (a key of REPORTS) from the rollups."""
+    sql = REPORTS[name]
+    cur = conn.execute(sql, {"limit": limit} if ":limit" in sql else {})
+    return Report(name, [column[0] for column in cur.description], cur.fetchall())
+
+
+def export_report(report, directory, fmt="csv"):
+    """
+    Write `report` to `directory` and return the file's path.
+
+    "csv" writes one row per line with a header. "columnar" writes a JSON object with
+    one array per column, which loads straight into a dataframe.
+    """
+    os.makedirs(directory, exist_ok=True)
+    if fmt == "csv":
+        path = os.path.join(directory, report.name + ".csv")
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(report.columns)
+            writer.writerows(report.rows)
+    elif fmt == "columnar":
+        path = os.path.join(directory, report.name + ".columns.json")
+        with open(path, "w") as f:
+            json.dump({column: [row[i] for row in report.rows]
+                       for i, column in enumerate(report.columns)}, f)
+    else:
+        raise ValueError(f"unknown export format {fmt!r}")
+    return path
+
+
+def main(argv=None):
+    """Command-line entry point: python reports.py [database] [--snapshot PATH] [--export DIR]."""
+    parser = argparse.ArgumentParser(description="Update the circulation rollups and print or export reports.")
+    parser.add_argument("database", nargs="?", default=DEFAULT_DB_PATH)
+    parser.add_argument("--reports", default="reports.db", help="database holding the rollups")
+    parser.add_argument("--snapshot", help="back the library up to this file first and read the copy")
+    parser.add_argument("--today", help="events ending before this date count as finished")
+    parser.add_argument("--limit", type=int, default=20, help="rows in the top titles report")
+    parser.add_argument("--export", help="write every report to this directory")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    args = parser.parse_args(argv)
+    source = args.database
+    if args.snapshot:
+        take_snapshot(args.database, args.snapshot)
+        source = args.snapshot
+    conn = open_reports(args.reports, source)
+    stats = refresh(conn, today=args.today)
+    print(f"Rollups updated in {stats.seconds:.3f}s: {stats.new_loans} new loans, {stats.new_events} "
+          f"new events; pending {stats.pending_loans} loans, {stats.pending_fines} fines, "
+          f"{stats.pending_events} events")
+    for name in REPORTS:
+        report = run_report(conn, name, limit=args.limit)
+        if args.export:
+            print(f"{name}: {len(report.rows)} rows -> {export_report(report, args.export, args.format)}")
+        else:
+            print(f"\n{name}")
+            print("  ".join(report.columns))
+            for row in report.rows:
+                print("  ".join("" if value is None else str(value) for value in row))
+    conn.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,53 @@
+class PreparedStatements:
+    """
+    Runs the named statements of a registry on one connection.
+
+    `registry` maps a name to its SQL text. sqlite3 compiles each distinct text once
+    and keeps it in the connection's statement cache (sized by open_connection's
+    STATEMENT_CACHE_SIZE), so naming every statement once keeps that cache small and
+    fully hit. Each name also gets its own cursor, created on first use and reused
+    afterwards, so a call allocates nothing but its result.
+    """
+
+    def __init__(self, conn, registry):
+        self.conn = conn
+        self.registry = registry
+        self._cursors = {}
+
+    def cursor(self, name):
+        cur = self._cursors.get(name)
+        if cur is None:
+            if name not in self.registry:
+                raise KeyError(f"unknown statement {name!r}")
+            cur = self._cursors[name] = self.conn.cursor()
+        return cur
+
+    def execute(self, name, params=()):
+        """
+        Run statement `name` and return its cursor.
+
+        Read the result to the end: a reused cursor whose SELECT is left half-read keeps
+        its read transaction open until the statement runs again.
+        """
+        return self.cursor(name).execute(self.registry[name], params)
+
+    def executemany(self, name, seq_of_params):
+        return self.cursor(name).executemany(self.registry[name], seq_of_params)
+
+    def fetchall(self, name, params=(), record=None):
+        """Run statement `name` and return every row, built with record._make if given."""
+        rows = self.execute(name, params).fetchall()
+        return list(map(record._make, rows)) if record else rows
+
+    def fetchone(self, name, params=(), record=None):
+        """Run statement `name` and return its first row (or None), built with record._make."""
+        # fetchall() steps the statement to the end, which releases its read lock.
+        rows = self.execute(name, params).fetchall()
+        if not rows:
+            return None
+        return record._make(rows[0]) if record else rows[0]
+
+    def close(self):
+        for cur in self._cursors.values():
+            cur.close()
+        self._cursors.clear()
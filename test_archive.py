@@ -0,0 +1,71 @@
+import datetime
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from archive import archive_loans, attach_archive, default_cutoff, shrink_percent
+from bootstrap import create_database
+
+class TestArchive(unittest.TestCase):
+    def setUp(self):
+        """The real schema, fine triggers and sample data, with the archive in a temporary file."""
+        self.tmpdir = tempfile.mkdtemp()
+        self.archive_path = os.path.join(self.tmpdir, "library.archive.db")
+        path = os.path.join(self.tmpdir, "library.db")
+        create_database(path)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA foreign_keys = ON")
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.tmpdir)
+
+    def loan_ids(self, table):
+        return [row[0] for row in self.conn.execute("SELECT loanID FROM %s ORDER BY loanID" % table)]
+
+    def test_moves_settled_history(self):
+        """Old loans without unpaid fines move; open loans, unpaid fines and the newest loan stay."""
+        self.conn.execute("INSERT INTO Activity VALUES (11, 3, 3, '2023-11-01', '2099-01-01', NULL)")
+        self.conn.commit()
+        unpaid = self.loan_ids("Fine WHERE paymentDate IS NULL")
+        history = self.conn.execute("SELECT COUNT(*) FROM Activity").fetchone()[0]
+        stats = archive_loans(self.conn, self.archive_path, "2024-01-01", chunk_size=2)
+        moved = self.loan_ids("archive.Activity")
+        # Loans 2, 4, 7 and 9 have paid fines; 1, 3, 5, 6, 8 and 10 still owe.
+        self.assertEqual(moved, [2, 4, 7, 9])
+        self.assertEqual((stats.loans, stats.fines, stats.chunks), (4, 4, 2))
+        self.assertEqual(self.loan_ids("archive.Fine"), moved)
+        self.assertEqual(self.loan_ids("Fine WHERE paymentDate IS NULL"), unpaid)
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM ActivityHistory").fetchone()[0], history)
+        self.assertEqual(self.conn.execute(
+            "SELECT amount FROM FineHistory WHERE loanID = 2").fetchone()[0], 3.0)
+        self.assertEqual(self.conn.execute("PRAGMA foreign_key_check").fetchall(), [])
+        self.assertEqual(self.conn.execute("PRAGMA archive.foreign_key_check").fetchall(), [])
+        self.assertGreaterEqual(shrink_percent(stats), 0.0)
+        # A second run finds nothing left to move.
+        self.assertEqual(archive_loans(self.conn, self.archive_path, "2024-01-01").loans, 0)
+
+    def test_triggers_still_fire_on_hot_loans(self):
+        """A late return after archival still gets its fine from the db.sql triggers."""
+        archive_loans(self.conn, self.archive_path, "2024-01-01")
+        self.conn.execute("INSERT INTO Activity VALUES (NULL, 3, 3, '2024-01-01', '2024-01-15', NULL)")
+        loan_id = self.conn.execute("SELECT MAX(loanID) FROM Activity").fetchone()[0]
+        self.assertNotIn(loan_id, self.loan_ids("archive.Activity"))
+        self.conn.execute("UPDATE Activity SET returnDate = '2024-01-18' WHERE loanID = ?", (loan_id,))
+        self.assertEqual(self.conn.execute(
+            "SELECT amount FROM Fine WHERE loanID = ?", (loan_id,)).fetchone()[0], 3.0)
+
+    def test_history_views_on_a_new_connection(self):
+        archive_loans(self.conn, self.archive_path, "2024-01-01")
+        other = sqlite3.connect(os.path.join(self.tmpdir, "library.db"))
+        attach_archive(other, self.archive_path)
+        self.assertEqual(other.execute("SELECT COUNT(*) FROM ActivityHistory").fetchone()[0], 10)
+        other.close()
+
+    def test_default_cutoff(self):
+        self.assertEqual(default_cutoff(datetime.date(2024, 3, 1), retention_days=30), "2024-01-31")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import datetime
+import unittest
+
+from availability import check_availability
+from bootstrap import memory_database
+from library_service import LibraryService
+
+class TestAvailability(unittest.TestCase):
+    def setUp(self):
+        """The real schema and sample data, migrated so the counters and triggers exist."""
+        self.conn = memory_database()
+        self.service = LibraryService(self.conn)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def counts(self, isbn):
+        return tuple(self.service.availability([isbn]).get(isbn, (0, 0, 0)))
+
+    def test_counters_follow_loans_and_copies(self):
+        """Borrowing, returning, donating and moving or deleting copies keep the counters exact."""
+        isbn = "9783161484100"
+        self.assertEqual(self.counts(isbn), (1, 1, 0))
+        loan = self.service.borrow(1, 1, today=datetime.date(2024, 1, 1))
+        self.assertEqual(self.counts(isbn), (1, 0, 1))
+        self.service.donate(isbn, "A1", "New")
+        self.assertEqual(self.counts(isbn), (2, 1, 1))
+        self.service.return_loan(loan.loan_id)
+        self.assertEqual(self.counts(isbn), (2, 2, 0))
+        self.service.borrow(1, 1, today=datetime.date(2024, 2, 1))
+        self.conn.execute("UPDATE Inventory SET ISBN = '9780140449136' WHERE copyID = 1")
+        self.assertEqual(self.counts(isbn), (1, 1, 0))
+        self.assertEqual(self.counts("9780140449136"), (2, 1, 1))
+        self.conn.execute("DELETE FROM Fine WHERE loanID IN (SELECT loanID FROM Activity WHERE copyID = 1)")
+        self.conn.execute("DELETE FROM Activity WHERE copyID = 1")
+        self.conn.execute("DELETE FROM Inventory WHERE copyID = 1")
+        self.assertEqual(self.counts("9780140449136"), (1, 1, 0))
+        self.assertEqual(check_availability(self.conn), [])
+
+    def test_find_items_shows_availability(self):
+        item = self.service.find_items("gatsby")[0]
+        self.assertEqual((item.total_copies, item.available_copies, item.open_loans), (1, 1, 0))
+        self.service.borrow(1, 1)
+        item = self.service.find_items_page("gatsby").records[0]
+        self.assertEqual(item.available_copies, 0)
+
+    def test_checker_repairs_drift(self):
+        """Counters edited behind the triggers' back are reported, then rebuilt."""
+        self.conn.execute("UPDATE ItemAvailability SET availableCopies = 7 WHERE ISBN = '9783161484100'")
+        self.conn.execute("INSERT INTO ItemAvailability VALUES ('9999999999999', 1, 0, 0)")
+        self.conn.commit()
+        found = check_availability(self.conn, repair=True)
+        self.assertEqual([(d.isbn, d.expected, d.actual) for d in found], [
+            ("9783161484100", (1, 1, 0), (1, 7, 0)),
+            ("9999999999999", (0, 0, 0), (1, 0, 0)),
+        ])
+        self.assertEqual(check_availability(self.conn), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import datetime
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from benchmark import (
+    BENCHMARKS,
+    STATEMENT_BENCHMARKS,
+    benchmark_database,
+    compare,
+    missed_targets,
+    run_benchmarks,
+)
+from connection_manager import open_connection
+from datagen import generate
+from library_service import LibraryService
+from migrations import LATEST_VERSION, schema_version
+
+SIZES = dict(items=300, members=50, loans=2000, events=30)
+TODAY = datetime.date(2024, 6, 1)
+
+class TestBenchmark(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def generate(self, name, seed=1):
+        path = os.path.join(self.tmpdir, name)
+        counts = generate(path, seed=seed, today=TODAY, **SIZES)
+        return path, counts
+
+    def test_generated_database_is_consistent(self):
+        """The generator fills every table, honours foreign keys and migrates the schema."""
+        path, counts = self.generate("a.db")
+        self.assertEqual(counts["Item"], 300)
+        self.assertEqual(counts["Inventory"], 600)
+        self.assertEqual(counts["Activity"], 2000)
+        self.assertGreater(counts["Fine"], 0)
+        conn = sqlite3.connect(path)
+        self.addCleanup(conn.close)
+        self.assertEqual(conn.execute("PRAGMA foreign_key_check").fetchall(), [])
+        self.assertEqual(schema_version(conn), LATEST_VERSION)
+        # Exactly the copies with an open loan are unavailable.
+        open_copies = conn.execute("SELECT COUNT(*) FROM Activity WHERE returnDate IS NULL").fetchone()[0]
+        unavailable = conn.execute("SELECT COUNT(*) FROM Inventory WHERE Available = 0").fetchone()[0]
+        self.assertEqual(open_copies, unavailable)
+
+    def test_generation_is_reproducible(self):
+        """The same seed gives the same data; another seed does not."""
+        def digest(path):
+            conn = sqlite3.connect(path)
+            rows = conn.execute("SELECT * FROM Activity ORDER BY loanID").fetchall()
+            rows += conn.execute("SELECT * FROM Item ORDER BY ISBN").fetchall()
+            conn.close()
+            return hash(tuple(rows))
+        first, _ = self.generate("a.db", seed=7)
+        second, _ = self.generate("b.db", seed=7)
+        third, _ = self.generate("c.db", seed=8)
+        self.assertEqual(digest(first), digest(second))
+        self.assertNotEqual(digest(first), digest(third))
+
+    def test_benchmark_database_is_cached_per_day(self):
+        """A cached database is reused the same day and regenerated, with fresh dates, the next."""
+        def latest_loan(path):
+            conn = sqlite3.connect(path)
+            try:
+                return datetime.date.fromisoformat(conn.execute("SELECT MAX(borrowDate) FROM Activity").fetchone()[0])
+            finally:
+                conn.close()
+        first = benchmark_database("tiny", cache_dir=self.tmpdir, today=TODAY)
+        modified = os.path.getmtime(first)
+        first_latest = latest_loan(first)
+        self.assertEqual(benchmark_database("tiny", cache_dir=self.tmpdir, today=TODAY), first)
+        self.assertEqual(os.path.getmtime(first), modified)
+        later = TODAY + datetime.timedelta(days=1)
+        second = benchmark_database("tiny", cache_dir=self.tmpdir, today=later)
+        self.assertNotEqual(second, first)
+        self.assertFalse(os.path.exists(first))
+        # Same seed, so the same loans, each dated one day later.
+        self.assertEqual(latest_loan(second), first_latest + datetime.timedelta(days=1))
+
+    def test_run_benchmarks(self):
+        """Every benchmark runs and reports latency figures."""
+        path, _ = self.generate("a.db")
+        conn = open_connection(path)
+        self.addCleanup(conn.close)
+        results = run_benchmarks(conn, iterations=3)
+        self.assertEqual(set(results), {name for name, _, _ in BENCHMARKS})
+        for summary in results.values():
+            self.assertLessEqual(summary["p50_ms"], summary["p99_ms"])
+
+    def test_adhoc_lookups_match_prepared(self):
+        """The ad hoc baselines return what the service returns, one statement per call."""
+        path, _ = self.generate("a.db")
+        conn = open_connection(path)
+        self.addCleanup(conn.close)
+        service = LibraryService(conn)
+        for name, adhoc, prepared, arg in STATEMENT_BENCHMARKS:
+            prepared(service, arg)
+            traced = []
+            conn.set_trace_callback(traced.append)
+            result = adhoc(conn, arg)
+            conn.set_trace_callback(None)
+            self.assertEqual(result, prepared(service, arg), name)
+            # FTS5 reads its shadow tables with statements traced as "--" comments.
+            self.assertEqual(len([sql for sql in traced if not sql.startswith("--")]), 1, name)
+
+    def test_compare_flags_regressions(self):
+        """Only benchmarks slower than the baseline by more than the tolerance are flagged."""
+        baseline = {"a": {"p50_ms": 1.0}, "b": {"p50_ms": 1.0}}
+        current = {"a": {"p50_ms": 1.4}, "b": {"p50_ms": 2.0}, "new": {"p50_ms": 9.0}}
+        self.assertEqual(compare(current, baseline, tolerance=0.5), [("b", 1.0, 2.0)])
+
+    def test_missed_targets(self):
+        results = {"member_account": {"p99_ms": 0.4}, "other": {"p99_ms": 5.0}}
+        self.assertEqual(missed_targets(results), [])
+        results["member_account"]["p99_ms"] = 1.5
+        self.assertEqual(missed_targets(results), [("member_account", 1.0, 1.5)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import bootstrap
+from bootstrap import create_database, memory_database, template_path
+from migrations import LATEST_VERSION, schema_version
+
+class TestBootstrap(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_template_built_once(self):
+        """The template is built from db.sql and migrated once, then reused."""
+        path = template_path(sample_data=False, cache_dir=self.tmpdir)
+        built = os.path.getmtime(path)
+        bootstrap._templates.clear()
+        self.assertEqual(template_path(sample_data=False, cache_dir=self.tmpdir), path)
+        self.assertEqual(os.path.getmtime(path), built)
+        self.assertNotEqual(template_path(sample_data=True, cache_dir=self.tmpdir), path)
+        self.assertEqual(sorted(os.listdir(self.tmpdir)), sorted(
+            os.path.basename(p) for p in (path, template_path(True, self.tmpdir))))
+
+    def test_create_database(self):
+        """A new file is a migrated copy of the sample data; an existing one is left alone."""
+        path = os.path.join(self.tmpdir, "library.db")
+        self.assertTrue(create_database(path, cache_dir=self.tmpdir))
+        conn = sqlite3.connect(path)
+        self.assertEqual(schema_version(conn), LATEST_VERSION)
+        conn.execute("DELETE FROM Event")
+        conn.commit()
+        conn.close()
+        self.assertFalse(create_database(path, cache_dir=self.tmpdir))
+        conn = sqlite3.connect(path)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM Event").fetchone()[0], 0)
+        conn.close()
+
+    def test_memory_database(self):
+        conn = memory_database(sample_data=False, cache_dir=self.tmpdir)
+        self.assertEqual(schema_version(conn), LATEST_VERSION)
+        self.assertEqual(conn.execute("PRAGMA foreign_keys").fetchone()[0], 1)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM Item").fetchone()[0], 0)
+        conn.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import unittest
+import sqlite3
+
+from catalog_search import (
+    build_match_query,
+    ensure_search_index,
+    has_search_index,
+    search_items,
+    search_items_page,
+)
+
+class TestCatalogSearch(unittest.TestCase):
+    def setUp(self):
+        """Load the real schema and sample data into an in-memory database."""
+        self.conn = sqlite3.connect(":memory:")
+        with open("db.sql") as f:
+            self.conn.executescript(f.read())
+        with open("populate.sql") as f:
+            self.conn.executescript(f.read())
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_build_match_query(self):
+        """User text is split into quoted prefix tokens; punctuation is ignored."""
+        self.assertEqual(build_match_query("gats fitz"), '"gats"* "fitz"*')
+        self.assertEqual(build_match_query('"; DROP'), '"DROP"*')
+        self.assertIsNone(build_match_query("  -- "))
+
+    def test_index_built_from_existing_rows(self):
+        """The first search builds the index over the rows already in Item."""
+        self.assertFalse(has_search_index(self.conn))
+        results = search_items(self.conn, "Gatsby")
+        self.assertTrue(has_search_index(self.conn))
+        self.assertEqual([row[0] for row in results], ["9783161484100"])
+        self.assertFalse(ensure_search_index(self.conn))
+
+    def test_prefix_and_multi_token_match(self):
+        """Prefixes match whole words and every token must match."""
+        self.assertEqual(search_items(self.conn, "orw")[0][1], "1984")
+        self.assertEqual(search_items(self.conn, "pride austen")[0][1], "Pride and Prejudice")
+        self.assertEqual(search_items(self.conn, "pride orwell"), [])
+
+    def test_title_hits_rank_first(self):
+        """A title match outranks a match in a less important column."""
+        self.conn.execute("""
+            INSERT INTO Item VALUES ('9780000000001', 'Print Book', 'A Study',
+            'Anne Time', '2001-01-01', 'Example Press')
+        """)
+        results = search_items(self.conn, "time")
+        self.assertEqual([row[1] for row in results], ["Time", "A Study"])
+
+    def test_triggers_keep_index_in_sync(self):
+        """Inserts, updates and deletes on Item are reflected in search results."""
+        ensure_search_index(self.conn)
+        self.conn.execute("""
+            INSERT INTO Item VALUES ('9780000000002', 'Print Book', 'Dune',
+            'Frank Herbert', '1965-08-01', 'Chilton')
+        """)
+        self.assertEqual(search_items(self.conn, "dune")[0][0], "9780000000002")
+        self.conn.execute("UPDATE Item SET title = 'Dune Messiah' WHERE ISBN = '9780000000002'")
+        self.assertEqual(search_items(self.conn, "messiah")[0][1], "Dune Messiah")
+        self.conn.execute("DELETE FROM Item WHERE ISBN = '9780000000002'")
+        self.assertEqual(search_items(self.conn, "dune"), [])
+
+    def test_results_are_paged(self):
+        """Searches return a bounded page and later pages continue where the last stopped."""
+        first = search_items(self.conn, "", limit=4)
+        second = search_items(self.conn, "", limit=4, offset=4)
+        self.assertEqual(len(first), 4)
+        self.assertEqual(len(second), 4)
+        self.assertFalse(set(first) & set(second))
+
+    def test_keyset_pages_cover_every_match(self):
+        """Following next_after visits every result once, in search_items() order."""
+        for search in ("", "the"):
+            expected = search_items(self.conn, search, limit=100)
+            rows, after = search_items_page(self.conn, search, limit=2)
+            while after is not None:
+                more, after = search_items_page(self.conn, search, limit=2, after=after)
+                rows += more
+            self.assertEqual(len(rows), len(set(rows)))
+            self.assertEqual(sorted(rows), sorted(expected))
+            if search:
+                self.assertEqual(rows, expected)
+
+    def test_one_letter_search_is_listed_not_ranked(self):
+        """A one-letter search pages through its matches in index order, reading only the page."""
+        ensure_search_index(self.conn)
+        expected = {row[0] for row in self.conn.execute(
+            "SELECT Item.ISBN FROM ItemSearch JOIN Item ON Item.rowid = ItemSearch.rowid "
+            "WHERE ItemSearch MATCH 't*'")}
+        rows, after = search_items_page(self.conn, "t", limit=2)
+        self.assertIsInstance(after, int)
+        while after is not None:
+            more, after = search_items_page(self.conn, "t", limit=2, after=after)
+            rows += more
+        self.assertEqual([row[0] for row in rows], [row[0] for row in sorted(
+            rows, key=lambda row: self.conn.execute("SELECT rowid FROM Item WHERE ISBN = ?", row[:1]).fetchone())])
+        self.assertEqual({row[0] for row in rows}, expected)
+
+    def test_one_letter_search_cost_does_not_grow(self):
+        """The first page of "a" costs the same with ten times as many matches."""
+        def steps_for_first_page(extra):
+            conn = sqlite3.connect(":memory:")
+            with open("db.sql") as f:
+                conn.executescript(f.read())
+            conn.executemany("INSERT INTO Item VALUES (?, 'Print Book', ?, 'Anon', '2000-01-01', 'Pub')",
+                             [(f"97800000{n:05d}", f"Atlas {n}") for n in range(extra)])
+            ensure_search_index(conn)
+            steps = [0]
+            def count():
+                steps[0] += 1
+            conn.set_progress_handler(count, 1)
+            search_items_page(conn, "a", ensure_index=False)
+            conn.close()
+            return steps[0]
+        self.assertLess(steps_for_first_page(5000), 2 * steps_for_first_page(500))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+from connection_manager import ConnectionManager, immediate_transaction, open_connection
+from migrations import LATEST_VERSION, schema_version
+
+class TestConnectionManager(unittest.TestCase):
+    def setUp(self):
+        """Create a database file from db.sql in a temporary directory."""
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "library.db")
+        conn = sqlite3.connect(self.path)
+        with open("db.sql") as f:
+            conn.executescript(f.read())
+        with open("populate.sql") as f:
+            conn.executescript(f.read())
+        conn.close()
+        self.manager = ConnectionManager(self.path)
+
+    def tearDown(self):
+        self.manager.close_all()
+        shutil.rmtree(self.tmpdir)
+
+    def test_pragmas_applied(self):
+        """Connections run in WAL mode with the tuned settings."""
+        conn = self.manager.writer()
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        self.assertEqual(conn.execute("PRAGMA synchronous").fetchone()[0], 1)
+        self.assertEqual(conn.execute("PRAGMA foreign_keys").fetchone()[0], 1)
+        self.assertEqual(conn.execute("PRAGMA busy_timeout").fetchone()[0], 5000)
+        self.assertEqual(conn.execute("PRAGMA cache_size").fetchone()[0], -65536)
+        reader = self.manager.reader()
+        self.assertEqual(reader.execute("PRAGMA foreign_keys").fetchone()[0], 1)
+
+    def test_schema_migrated_on_first_writer(self):
+        """The first writer brings the file to the latest schema version."""
+        self.assertEqual(schema_version(self.manager.reader()), LATEST_VERSION)
+
+    def test_reader_is_read_only(self):
+        """Writes through the read-only role are refused."""
+        with self.assertRaises(sqlite3.OperationalError):
+            self.manager.reader().execute("DELETE FROM Room")
+
+    def test_connections_are_per_thread(self):
+        """A thread always gets the same connection; other threads get their own."""
+        main_conn = self.manager.writer()
+        self.assertIs(self.manager.writer(), main_conn)
+        seen = []
+        def worker():
+            seen.append(self.manager.writer())
+            self.manager.close_thread()
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+        self.assertIsNot(seen[0], main_conn)
+
+    def test_readers_not_blocked_by_writer(self):
+        """In WAL mode a reader sees the last committed data while a write is open."""
+        writer = self.manager.writer()
+        writer.execute("BEGIN IMMEDIATE")
+        writer.execute("UPDATE Room SET maxCapacity = 99 WHERE roomNumber = 'R001'")
+        result = []
+        def read():
+            cur = self.manager.reader().execute(
+                "SELECT maxCapacity FROM Room WHERE roomNumber = 'R001'")
+            result.append(cur.fetchone()[0])
+            self.manager.close_thread()
+        thread = threading.Thread(target=read)
+        thread.start()
+        thread.join()
+        writer.commit()
+        self.assertEqual(result, [30])
+
+    def test_memory_database_rejected(self):
+        """The manager needs a file that several connections can share."""
+        with self.assertRaises(ValueError):
+            ConnectionManager(":memory:")
+
+    def test_open_connection_overrides(self):
+        """Pragma overrides replace the defaults."""
+        conn = open_connection(self.path, pragmas={"synchronous": "FULL"})
+        self.assertEqual(conn.execute("PRAGMA synchronous").fetchone()[0], 2)
+        conn.close()
+
+    def test_nested_units_roll_back_alone(self):
+        """A failing inner block undoes only its own writes; the outer one still commits."""
+        conn = self.manager.writer()
+        with immediate_transaction(conn):
+            conn.execute("INSERT INTO Member (memberID, firstName) VALUES (100, 'Kept')")
+            with self.assertRaises(ValueError):
+                with immediate_transaction(conn):
+                    conn.execute("INSERT INTO Member (memberID, firstName) VALUES (101, 'Undone')")
+                    raise ValueError("inner failure")
+            with immediate_transaction(conn):
+                conn.execute("INSERT INTO Member (memberID, firstName) VALUES (102, 'Also kept')")
+        self.assertFalse(conn.in_transaction)
+        self.assertEqual([row[0] for row in conn.execute(
+            "SELECT memberID FROM Member WHERE memberID >= 100 ORDER BY memberID")], [100, 102])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import datetime
+import unittest
+
+from bootstrap import memory_database
+from fines import accrue_fines, last_run_date, rows_per_second
+
+class TestFineAccrual(unittest.TestCase):
+    def setUp(self):
+        """Load the real schema, with its fine triggers, and the sample data."""
+        self.conn = memory_database()
+        self.today = self.conn.execute("SELECT date('now')").fetchone()[0]
+
+    def tearDown(self):
+        self.conn.close()
+
+    def days_ago(self, days):
+        today = datetime.date.fromisoformat(self.today)
+        return (today - datetime.timedelta(days=days)).isoformat()
+
+    def add_open_loans(self, due_dates, first_loan_id=100):
+        self.conn.executemany(
+            "INSERT INTO Activity VALUES (?, 1, 1, '2000-01-01', ?, NULL)",
+            [(first_loan_id + i, due) for i, due in enumerate(due_dates)])
+        self.conn.commit()
+
+    def fines(self):
+        cur = self.conn.execute("SELECT loanID, amount, paymentDate FROM Fine WHERE loanID >= 100 ORDER BY loanID")
+        return cur.fetchall()
+
+    def test_matches_trigger_semantics(self):
+        """Accrued fines equal what the overdue triggers compute for the same loans."""
+        self.add_open_loans([self.days_ago(d) for d in (30, 5, 1, 0, -3)])
+        expected = self.fines()
+        self.assertEqual([row[1] for row in expected], [30.0, 5.0, 1.0])
+        # Make the fines stale, as they would be a few days after the loans were written.
+        self.conn.execute("UPDATE Fine SET amount = 0 WHERE loanID >= 100")
+        self.conn.commit()
+        stats = accrue_fines(self.conn)
+        self.assertEqual(self.fines(), expected)
+        self.assertEqual((stats.scanned, stats.changed), (3, 3))
+
+    def test_returned_loans_untouched(self):
+        """Closed loans keep the fine set when they were returned."""
+        before = self.conn.execute("SELECT * FROM Fine ORDER BY loanID").fetchall()
+        accrue_fines(self.conn)
+        after = self.conn.execute("SELECT * FROM Fine ORDER BY loanID").fetchall()
+        self.assertEqual(before, after)
+
+    def test_chunks_cover_every_loan(self):
+        """Chunk boundaries inside a run of equal due dates neither skip nor repeat loans."""
+        self.add_open_loans([self.days_ago(10)] * 7 + [self.days_ago(2)] * 6)
+        self.conn.execute("DELETE FROM Fine WHERE loanID >= 100")
+        self.conn.commit()
+        stats = accrue_fines(self.conn, chunk_size=4)
+        self.assertEqual((stats.scanned, stats.changed, stats.chunks), (13, 13, 4))
+        self.assertEqual([row[1] for row in self.fines()], [10.0] * 7 + [2.0] * 6)
+        self.assertFalse(self.conn.in_transaction)
+
+    def test_incremental_runs(self):
+        """A second run for the same day is skipped; a forced run rewrites nothing."""
+        self.add_open_loans([self.days_ago(4)])
+        first = accrue_fines(self.conn)
+        self.assertEqual(last_run_date(self.conn), self.today)
+        self.assertGreater(rows_per_second(first), 0)
+        self.assertTrue(accrue_fines(self.conn).skipped)
+        forced = accrue_fines(self.conn, force=True)
+        self.assertEqual((forced.scanned, forced.changed), (1, 0))
+        # A day later the fine grows by one unit.
+        tomorrow = (datetime.date.fromisoformat(self.today) + datetime.timedelta(days=1)).isoformat()
+        later = accrue_fines(self.conn, today=tomorrow)
+        self.assertEqual(later.changed, 1)
+        self.assertEqual(self.fines()[0][1], 5.0)
+
+    def test_paid_fine_on_open_loan_is_reset(self):
+        """A paid fine on a loan still out is owed again, as the trigger would have it."""
+        self.add_open_loans([self.days_ago(4)])
+        self.conn.execute("UPDATE Fine SET paymentDate = ? WHERE loanID = 100", (self.today,))
+        self.conn.commit()
+        stats = accrue_fines(self.conn)
+        self.assertEqual(stats.changed, 1)
+        self.assertEqual(self.fines(), [(100, 4.0, None)])
+
+if __name__ == '__main__':
+    unittest.main()
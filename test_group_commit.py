@@ -0,0 +1,142 @@
+import os
+import shutil
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from bootstrap import create_database
+from connection_manager import open_connection
+from group_commit import CommitterClosedError, GroupCommitter
+
+# Run in a child process: commit one member and print its ID, then queue a group of
+# members whose last operation kills the process before the group can commit. The tiny
+# page cache makes the uncommitted rows spill into the WAL before the kill.
+CRASH_SCRIPT = """
+import os, signal, sys
+from connection_manager import open_connection
+from group_commit import GroupCommitter
+
+committer = GroupCommitter(lambda: open_connection(
+    sys.argv[1], pragmas={"synchronous": "FULL", "cache_size": 10}), window=0.2)
+def add(name):
+    return lambda conn: conn.execute(
+        "INSERT INTO Member (firstName, lastName) VALUES (?, ?)", (name, "x" * 500)).lastrowid
+print(committer.call(add("acknowledged")), flush=True)
+def crash(conn):
+    os.kill(os.getpid(), signal.SIGKILL)
+futures = [committer.submit(add("lost")) for _ in range(200)] + [committer.submit(crash)]
+for future in futures:
+    future.result()
+"""
+
+class TestGroupCommit(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "library.db")
+        create_database(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def members(self, name):
+        conn = sqlite3.connect(self.path)
+        self.addCleanup(conn.close)
+        return conn.execute("SELECT COUNT(*) FROM Member WHERE firstName = ?", (name,)).fetchone()[0]
+
+    def add_member(self, name):
+        return lambda conn: conn.execute("INSERT INTO Member (firstName) VALUES (?)", (name,)).lastrowid
+
+    def test_failed_operation_is_rolled_back_alone(self):
+        """One operation raising leaves the rest of its group to commit."""
+        committer = GroupCommitter(lambda: open_connection(self.path), window=0.05)
+        def fail(conn):
+            conn.execute("INSERT INTO Member (firstName) VALUES ('failed')")
+            raise ValueError("rejected")
+        futures = [committer.submit(self.add_member("kept")), committer.submit(fail),
+                   committer.submit(self.add_member("kept"))]
+        self.assertIsInstance(futures[0].result(), int)
+        with self.assertRaises(ValueError):
+            futures[1].result()
+        futures[2].result()
+        committer.close()
+        self.assertEqual(committer.stats().batches, 1)
+        self.assertEqual((self.members("kept"), self.members("failed")), (2, 0))
+
+    def test_dead_writer_fails_waiting_operations(self):
+        """If the writer thread dies, queued and later operations fail instead of hanging."""
+        class Fatal(BaseException):
+            pass
+        # The writer thread is meant to die here; keep its traceback out of the test output.
+        hook = threading.excepthook
+        threading.excepthook = lambda args: None
+        self.addCleanup(setattr, threading, "excepthook", hook)
+        committer = GroupCommitter(lambda: open_connection(self.path), window=0.05, max_batch=1)
+        started = threading.Event()
+        def fatal(conn):
+            started.wait(5)
+            raise Fatal()
+        futures = [committer.submit(fatal)] + [committer.submit(self.add_member("queued")) for _ in range(3)]
+        started.set()
+        with self.assertRaises(Fatal):
+            futures[0].result(timeout=5)
+        for future in futures[1:]:
+            with self.assertRaises(CommitterClosedError):
+                future.result(timeout=5)
+        with self.assertRaises(CommitterClosedError):
+            committer.submit(self.add_member("late"))
+        committer.close()
+        self.assertEqual(self.members("queued"), 0)
+
+    def test_submit_after_close(self):
+        committer = GroupCommitter(lambda: open_connection(self.path))
+        committer.call(self.add_member("before"))
+        committer.close()
+        with self.assertRaises(CommitterClosedError):
+            committer.submit(self.add_member("after"))
+        self.assertEqual(self.members("before"), 1)
+
+    def test_concurrent_callers_share_commits(self):
+        """
+        Stress test: many threads write through one committer; every write lands and
+        they share far fewer commits than there were operations.
+        """
+        threads, calls = 16, 25
+        committer = GroupCommitter(lambda: open_connection(self.path, pragmas={"synchronous": "FULL"}))
+        def caller():
+            for _ in range(calls):
+                committer.call(self.add_member("grouped"))
+        workers = [threading.Thread(target=caller) for _ in range(threads)]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+        committer.close()
+        stats = committer.stats()
+        self.assertEqual(self.members("grouped"), threads * calls)
+        self.assertEqual(stats.operations, threads * calls)
+        self.assertLess(stats.batches, threads * calls / 4)
+        print(f"\n{stats.operations / elapsed:.0f} writes/sec in {stats.batches} commits "
+              f"across {threads} threads")
+
+    def test_crash_mid_group_loses_only_the_group(self):
+        """Killing the process mid-group keeps acknowledged writes and none of the group."""
+        here = os.path.dirname(os.path.abspath(__file__))
+        child = subprocess.run([sys.executable, "-c", CRASH_SCRIPT, self.path], cwd=here,
+                               capture_output=True, text=True, timeout=60)
+        self.assertEqual(child.returncode, -signal.SIGKILL, child.stderr)
+        self.assertTrue(child.stdout.strip().isdigit())
+        self.assertTrue(os.path.getsize(self.path + "-wal") > 0, "uncommitted pages should be in the WAL")
+        conn = open_connection(self.path)
+        self.addCleanup(conn.close)
+        self.assertEqual(conn.execute("PRAGMA integrity_check").fetchone()[0], "ok")
+        self.assertEqual((self.members("acknowledged"), self.members("lost")), (1, 0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import datetime
+import io
+import json
+import unittest
+
+from bootstrap import memory_database
+from library_service import LibraryService
+from ingest import format_for, ingest, read_feed, reject_writer
+
+FEED_CSV = """isbn,title,author,itemType,publishDate,copies,shelfNumber,physicalCondition
+978-0-00-000001-1,Ingested Title,Ann Author,Print Book,2001-02-03,2,B1,New
+9780000000011,,,,,1,B2,Good
+9783161484100,,,,,1,A9,Worn
+not-an-isbn,Bad,,,,1,,
+9780000000029,No Title Given,,,,1,,
+9780000000037,,,,,1,,
+9780000000045,Bad Date,,,2020-13-01,1,,
+"""
+
+class TestIngest(unittest.TestCase):
+    def setUp(self):
+        self.conn = memory_database()
+        self.today = datetime.date(2024, 5, 1)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def copies_of(self, isbn):
+        return self.conn.execute("SELECT COUNT(*) FROM Inventory WHERE ISBN = ?", (isbn,)).fetchone()[0]
+
+    def test_csv_feed(self):
+        """New titles and copies are loaded, repeats merged and bad rows rejected."""
+        rejects = io.StringIO()
+        before = self.copies_of("9783161484100")
+        stats = ingest(self.conn, read_feed(io.StringIO(FEED_CSV), "csv"), batch_size=3,
+                       rejects=reject_writer(rejects), today=self.today)
+        self.assertEqual((stats.rows, stats.items_added, stats.copies, stats.rejected, stats.batches),
+                         (7, 2, 5, 3, 3))
+        self.assertEqual(self.copies_of("9780000000011"), 3)
+        self.assertEqual(self.copies_of("9783161484100"), before + 1)
+        title, published = self.conn.execute(
+            "SELECT title, publishDate FROM Item WHERE ISBN = '9780000000011'").fetchone()
+        self.assertEqual((title, published), ("Ingested Title", "2001-02-03"))
+        acquired, source = self.conn.execute(
+            "SELECT acquisitionDate, Source FROM Inventory WHERE ISBN = '9780000000011' LIMIT 1").fetchone()
+        self.assertEqual((acquired, source), ("2024-05-01", "Purchased"))
+        lines = [json.loads(line) for line in rejects.getvalue().splitlines()]
+        self.assertEqual([line["line"] for line in lines], [5, 7, 8])
+        self.assertIn("ISBN", lines[0]["error"])
+        # The search index follows the new titles.
+        self.assertEqual(self.conn.execute(
+            "SELECT COUNT(*) FROM ItemSearch WHERE ItemSearch MATCH 'ingested'").fetchone()[0], 1)
+
+    def test_upsert_only_rewrites_changed_items(self):
+        """Reloading a feed updates changed details and leaves the rest untouched."""
+        feed = '{"ISBN": "9780000000011", "title": "First", "copies": 0}\n'
+        ingest(self.conn, read_feed(io.StringIO(feed), "jsonl"))
+        stats = ingest(self.conn, read_feed(io.StringIO(feed), "jsonl"))
+        self.assertEqual((stats.items_added, stats.items_updated), (0, 0))
+        feed = ('{"ISBN": "9780000000011", "author": "Later Author", "copies": 0}\n'
+                'not json\n')
+        rejects = io.StringIO()
+        stats = ingest(self.conn, read_feed(io.StringIO(feed), "jsonl"), rejects=reject_writer(rejects),
+                       defer_foreign_keys=True)
+        self.assertEqual((stats.items_updated, stats.rejected), (1, 1))
+        self.assertEqual(self.conn.execute(
+            "SELECT title, author FROM Item WHERE ISBN = '9780000000011'").fetchone(),
+            ("First", "Later Author"))
+        self.assertIn("invalid JSON", rejects.getvalue())
+
+    def test_new_copies_serve_holds(self):
+        """Ingested copies of a title with a queue go to the waiting members in order."""
+        service = LibraryService(self.conn)
+        isbn = "9783161484100"
+        service.borrow(1, 1, today=self.today)
+        holds = [service.place_hold(member_id, isbn, today=self.today) for member_id in (2, 3)]
+        feed = '{"ISBN": "9783161484100", "copies": 3}\n{"ISBN": "9780000000011", "title": "Other", "copies": 1}\n'
+        ingest(self.conn, read_feed(io.StringIO(feed), "jsonl"), today=self.today)
+        served = [service.find_hold(hold.hold_id) for hold in holds]
+        self.assertEqual([hold.status for hold in served], ["ready", "ready"])
+        self.assertLess(served[0].copy_id, served[1].copy_id)
+        # Two of the three new copies were set aside; the third is on the shelf.
+        self.assertEqual(service.availability([isbn])[isbn].available_copies, 1)
+
+    def test_format_for(self):
+        self.assertEqual(format_for("feed.jsonl"), "jsonl")
+        self.assertEqual(format_for("feed.CSV"), "csv")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+from bootstrap import create_database
+from instrumentation import Metrics, metrics_from_env, triggers_for
+from library_service import LibraryService
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self):
+        """Build the sample database in a file and open it through a Metrics."""
+        self.workdir = tempfile.mkdtemp()
+        path = os.path.join(self.workdir, "library.db")
+        create_database(path)
+        self.metrics = Metrics()
+        self.conn = self.metrics.connect(path)
+        self.service = LibraryService(self.conn)
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.workdir)
+
+    def stats_for(self, operation, prefix):
+        for (op, sql), values in self.metrics.snapshot().items():
+            if op == operation and sql.startswith(prefix):
+                return values
+        self.fail(f"no statement starting with {prefix!r} under {operation!r}")
+
+    def test_rows_and_latency_per_operation(self):
+        """Rows fetched by iterating a cursor are attributed to the operation's statement."""
+        with self.metrics.operation("find_item"):
+            items = self.service.find_items("Harry")
+        calls, seconds, rows, _, _, _ = self.stats_for("find_item", "SELECT Item.ISBN")
+        self.assertEqual((calls, rows), (1, len(items)))
+        self.assertGreater(seconds, 0)
+        # Statements outside any operation are kept apart.
+        self.conn.execute("SELECT 1").fetchone()
+        self.assertEqual(self.stats_for("-", "SELECT 1")[:3:2], (1, 1))
+
+    def test_trigger_rows(self):
+        """Rows written by triggers are counted and the candidate triggers are named."""
+        copy_id = self.conn.execute("SELECT copyID FROM Inventory WHERE Available = 1").fetchone()[0]
+        with self.metrics.operation("borrow_item"):
+            loan = self.service.borrow(1, copy_id, today=datetime.date(2000, 1, 1))
+        with self.metrics.operation("return_item"):
+            self.service.return_loan(loan.loan_id)
+        _, _, rows, trigger_rows, _, triggers = self.stats_for("borrow_item", "INSERT INTO Activity")
+        # The loan is long overdue, so one trigger adds a fine (listed in UnpaidFine) and
+        # another counts the open loan, which in turn bumps the ItemAvailability version.
+        self.assertEqual((rows, trigger_rows), (1, 4))
+        self.assertIn("insert_fine_for_overdue_loan", triggers)
+        self.assertIn("availability_loan_insert", triggers)
+        self.assertGreater(self.stats_for("return_item", "UPDATE Activity")[3], 0)
+
+    def test_slow_query_log(self):
+        """Statements over the threshold are logged with their query plan."""
+        self.metrics.slow_threshold = 0
+        self.conn.execute("SELECT * FROM Activity WHERE memberID = ?", (1,)).fetchall()
+        entry = self.metrics.slow_log[-1]
+        self.assertTrue(entry.sql.startswith("SELECT * FROM Activity"))
+        self.assertTrue(any("idx_activity_member" in line for line in entry.plan))
+        self.assertIn("Slow queries:", self.metrics.export_text())
+
+    def test_prometheus_export(self):
+        with self.metrics.operation("find_event"):
+            self.service.find_events("Book")
+        text = self.metrics.export_prometheus()
+        self.assertIn('library_sql_statements_total{operation="find_event",statement="SELECT EventID', text)
+        self.assertIn('library_sql_statement_seconds_bucket{operation="find_event",le="+Inf"} 1', text)
+
+    def test_triggers_for(self):
+        self.assertEqual(triggers_for(self.conn, "SELECT 1"), ())
+        self.assertIn("insert_fine_for_overdue_loan",
+                      triggers_for(self.conn, "INSERT INTO Activity VALUES (1)"))
+        self.assertNotIn("insert_fine_for_overdue_loan",
+                         triggers_for(self.conn, "update Activity set returnDate = 1"))
+
+    def test_metrics_from_env(self):
+        self.assertIsNone(metrics_from_env({}))
+        metrics = metrics_from_env({"LIBRARY_METRICS": "out.txt", "LIBRARY_SLOW_QUERY_MS": "20"})
+        self.assertAlmostEqual(metrics.slow_threshold, 0.02)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,9 @@
 import unittest
 from io import StringIO
 import sys
-import sqlite3
 import datetime
+import os
+import tempfile
 
 # Import your functions from the library_app.py file.
 from library_app import (
@@ -14,93 +15,21 @@ from library_app import (
     find_event,
     register_event,
     volunteer,
-    ask_for_help
+    ask_for_help,
+    main
 )
+from bootstrap import memory_database
 
 class TestLibraryApp(unittest.TestCase):
     def setUp(self):
-        """Set up an in-memory SQLite database with the minimal schema and sample data."""
-        self.conn = sqlite3.connect(":memory:")
-        self.conn.execute("PRAGMA foreign_keys = ON;")
-        self.create_schema()
+        """Set up an in-memory copy of the empty schema from db.sql, then add the test records."""
+        self.conn = memory_database(sample_data=False)
         self.populate_data()
 
     def tearDown(self):
         """Close the database connection."""
         self.conn.close()
 
-    def create_schema(self):
-        """Creates the necessary tables for testing."""
-        self.conn.executescript("""
-            CREATE TABLE Item (
-                ISBN TEXT PRIMARY KEY,
-                itemType TEXT,
-                title TEXT,
-                author TEXT,
-                publishDate DATE,
-                Publisher TEXT
-            );
-            CREATE TABLE Member (
-                memberID INTEGER PRIMARY KEY,
-                firstName TEXT,
-                lastName TEXT,
-                DOB DATE
-            );
-            CREATE TABLE Room (
-                roomNumber TEXT PRIMARY KEY,
-                maxCapacity INTEGER
-            );
-            CREATE TABLE Personnel (
-                personnelID INTEGER PRIMARY KEY,
-                Position TEXT,
-                startDate DATE,
-                salary REAL,
-                roomNumber TEXT,
-                FOREIGN KEY (roomNumber) REFERENCES Room(roomNumber)
-            );
-            CREATE TABLE Inventory (
-                copyID INTEGER PRIMARY KEY,
-                ISBN TEXT,
-                Available BOOLEAN,
-                shelfNumber TEXT,
-                acquisitionDate DATE,
-                physicalCondition TEXT,
-                Source TEXT,
-                FOREIGN KEY (ISBN) REFERENCES Item(ISBN)
-            );
-            CREATE TABLE Activity (
-                loanID INTEGER PRIMARY KEY,
-                copyID INTEGER,
-                memberID INTEGER,
-                borrowDate DATE,
-                dueDate DATE,
-                returnDate DATE,
-                FOREIGN KEY (copyID) REFERENCES Inventory(copyID),
-                FOREIGN KEY (memberID) REFERENCES Member(memberID)
-            );
-            CREATE TABLE Fine (
-                loanID INTEGER PRIMARY KEY,
-                amount REAL,
-                paymentDate DATE,
-                FOREIGN KEY (loanID) REFERENCES Activity(loanID)
-            );
-            CREATE TABLE Event (
-                EventID INTEGER PRIMARY KEY,
-                startDate DATE,
-                endDate DATE,
-                startTime TIME,
-                endTime TIME,
-                reservedSeats INTEGER,
-                roomNumber TEXT,
-                eventName TEXT,
-                eventType TEXT,
-                personnelID INTEGER,
-                FOREIGN KEY (roomNumber) REFERENCES Room(roomNumber),
-                FOREIGN KEY (personnelID) REFERENCES Personnel(personnelID)
-            );
-        """)
-        self.conn.commit()
-
     def populate_data(self):
         """Insert sample records used by several tests."""
         # Insert one item.
@@ -292,6 +221,32 @@ class TestLibraryApp(unittest.TestCase):
         sys.stdout = sys.__stdout__
         self.assertIn("R001", output.getvalue(), "Output should indicate a librarian in room R001 is available.")
 
+    def test_9_find_item_pages(self):
+        """Test paging through search results: Enter shows the next page, q stops."""
+        self.conn.executemany("INSERT INTO Item VALUES (?, 'Print Book', ?, 'Anon', '2000-01-01', 'Pub')",
+                              [(f"978000000{n:04d}", f"Atlas Volume {n}") for n in range(45)])
+        self.conn.commit()
+        sys.stdin = StringIO("Atlas\n\nq\n")
+        output = StringIO()
+        sys.stdout = output
+        find_item(self.conn)
+        sys.stdout = sys.__stdout__
+        sys.stdin = sys.__stdin__
+        self.assertEqual(output.getvalue().count("Atlas Volume"), 40)
+        self.assertEqual(output.getvalue().count("Press Enter for more results"), 2)
+
+    def test_10_menu_exit(self):
+        """Test that 9 still exits the menu, as it did before holds were added."""
+        with tempfile.TemporaryDirectory() as workdir:
+            sys.stdin = StringIO("9\n")
+            output = StringIO()
+            sys.stdout = output
+            main(os.path.join(workdir, "library.db"))
+            sys.stdout = sys.__stdout__
+            sys.stdin = sys.__stdin__
+        self.assertIn("9. Exit", output.getvalue())
+        self.assertIn("Exiting application.", output.getvalue())
+
 # Custom TestResult class to print messages after each test.
 class CustomTestResult(unittest.TextTestResult):
     def addSuccess(self, test):
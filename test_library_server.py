@@ -0,0 +1,124 @@
+import asyncio
+import http.client
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from bootstrap import create_database
+from library_server import LibraryServer
+from loadgen import run_load
+
+class TestLibraryServer(unittest.TestCase):
+    def setUp(self):
+        """Serve a copy of the sample database from a background event loop."""
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "library.db")
+        create_database(self.path)
+        self.server = self.start_server(LibraryServer(self.path, port=0, readers=2))
+
+    def start_server(self, server):
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever)
+        thread.start()
+        asyncio.run_coroutine_threadsafe(server.start(), loop).result()
+        def stop():
+            asyncio.run_coroutine_threadsafe(server.close(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+        self.addCleanup(stop)
+        self.loop = loop
+        return server
+
+    def tearDown(self):
+        self.doCleanups()
+        shutil.rmtree(self.tmpdir)
+
+    def request(self, conn, method, path, payload=None):
+        body = json.dumps(payload) if payload is not None else None
+        conn.request(method, path, body=body, headers={"Content-Type": "application/json"})
+        response = conn.getresponse()
+        return response.status, json.loads(response.read())
+
+    def test_search_and_keep_alive(self):
+        """Several requests are served over one kept-alive connection."""
+        conn = http.client.HTTPConnection("127.0.0.1", self.server.port, timeout=5)
+        status, items = self.request(conn, "GET", "/items?q=gatsby")
+        self.assertEqual(status, 200)
+        self.assertEqual(items[0]["title"], "The Great Gatsby")
+        status, events = self.request(conn, "GET", "/events?q=Book%20Club")
+        self.assertEqual(events[0]["name"], "Book Club Meeting")
+        status, librarian = self.request(conn, "GET", "/librarian")
+        self.assertEqual(librarian["room_number"], "R001")
+        conn.close()
+
+    def test_writes_and_errors(self):
+        """Writes return the created records; service errors map to HTTP statuses."""
+        conn = http.client.HTTPConnection("127.0.0.1", self.server.port, timeout=5)
+        status, loan = self.request(conn, "POST", "/loans", {"member_id": 1, "copy_id": 1})
+        self.assertEqual(status, 201)
+        self.assertEqual(self.request(conn, "POST", "/loans", {"member_id": 2, "copy_id": 1})[0], 409)
+        status, returned = self.request(conn, "POST", "/returns", {"loan_id": loan["loan_id"]})
+        self.assertEqual((status, returned["copy_id"]), (200, 1))
+        self.assertEqual(self.request(conn, "POST", "/returns", {"loan_id": 999})[0], 404)
+        self.assertEqual(self.request(conn, "POST", "/events/1/registrations", {})[0], 201)
+        self.assertEqual(self.request(conn, "POST", "/events/3/registrations", {})[0], 409)
+        for seats in (-1000, 0, "many", 1.5):
+            self.assertEqual(self.request(conn, "POST", "/events/1/registrations", {"seats": seats})[0], 400)
+        self.assertEqual(self.request(conn, "POST", "/registrations", {"event_ids": "12"})[0], 400)
+        for loans in (["12"], [[1]], [[1, 2, 3]], "12", {"1": 2}):
+            self.assertEqual(self.request(conn, "POST", "/loans", {"loans": loans})[0], 400)
+        for loan_ids in ("123", 123, {"1": 2}):
+            self.assertEqual(self.request(conn, "POST", "/returns", {"loan_ids": loan_ids})[0], 400)
+        status, results = self.request(conn, "POST", "/loans", {"loans": [[1, 2], [1, 999]]})
+        self.assertEqual((status, [result["ok"] for result in results]), (200, [True, False]))
+        status, results = self.request(conn, "POST", "/returns", {"loan_ids": [results[0]["result"]["loan_id"]]})
+        self.assertEqual((status, results[0]["ok"]), (200, True))
+        self.assertEqual(self.request(conn, "POST", "/registrations", {"event_ids": [1], "seats": -1})[0], 400)
+        self.assertEqual(self.request(conn, "POST", "/loans", {"member_id": 1})[0], 400)
+        status, hold = self.request(conn, "POST", "/holds", {"member_id": 2, "isbn": "9783161484100"})
+        self.assertEqual((status, hold["status"], hold["copy_id"]), (201, "ready", 1))
+        event = {"name": "Clash", "event_type": "Talk", "room_number": "R004",
+                 "start": "2023-11-05T20:00", "end": "2023-11-05T22:00"}
+        self.assertEqual(self.request(conn, "POST", "/events", event)[0], 409)
+        status, rooms = self.request(conn, "GET", "/rooms/free?start=2023-11-05T20:00&end=2023-11-05T21:00&seats=55")
+        self.assertEqual((status, [room["room_number"] for room in rooms]), (200, ["R010", "R009"]))
+        self.assertEqual(self.request(conn, "GET", "/loans")[0], 405)
+        self.assertEqual(self.request(conn, "GET", "/nowhere")[0], 404)
+        conn.close()
+
+    def test_backpressure(self):
+        """With no capacity left the server answers 503 straight away."""
+        self.server.max_pending = 0
+        conn = http.client.HTTPConnection("127.0.0.1", self.server.port, timeout=5)
+        conn.request("GET", "/items?q=gatsby")
+        response = conn.getresponse()
+        self.assertEqual(response.status, 503)
+        self.assertEqual(response.getheader("Retry-After"), "1")
+        conn.close()
+
+    def test_group_commit(self):
+        """With group commit on, writes and their errors come back as before."""
+        server = self.start_server(LibraryServer(self.path, port=0, readers=2, group_commit_ms=2))
+        conn = http.client.HTTPConnection("127.0.0.1", server.port, timeout=5)
+        status, loan = self.request(conn, "POST", "/loans", {"member_id": 1, "copy_id": 1})
+        self.assertEqual(status, 201)
+        self.assertEqual(self.request(conn, "POST", "/loans", {"member_id": 2, "copy_id": 1})[0], 409)
+        self.assertEqual(self.request(conn, "POST", "/returns", {"loan_id": loan["loan_id"]})[0], 200)
+        conn.close()
+        self.assertEqual(server._committer.stats().operations, 3)
+
+    def test_load_generator(self):
+        """The load generator reports throughput and latency percentiles."""
+        future = asyncio.run_coroutine_threadsafe(
+            run_load("127.0.0.1", self.server.port, concurrency=4, duration=0.3), self.loop)
+        result = future.result()
+        self.assertGreater(result["requests"], 0)
+        self.assertLessEqual(result["p50_ms"], result["p99_ms"])
+        self.assertNotIn(500, result["statuses"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,397 @@
+import datetime
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+
+from bootstrap import memory_database
+from connection_manager import open_connection
+from library_service import (
+    EVENT_NOT_FOUND,
+    FULLY_BOOKED,
+    RESERVED,
+    EventFullError,
+    InvalidRequestError,
+    LibraryService,
+    NotFoundError,
+    ScheduleConflictError,
+    UnavailableError,
+)
+
+class TestLibraryService(unittest.TestCase):
+    def setUp(self):
+        """Load the real schema, with its triggers, and the sample data."""
+        self.conn = memory_database()
+        self.service = LibraryService(self.conn)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_find_items(self):
+        """Searches return typed Item records."""
+        items = self.service.find_items("gatsby")
+        self.assertEqual(items[0].isbn, "9783161484100")
+        self.assertEqual(items[0].author, "F. Scott Fitzgerald")
+
+    def test_pages(self):
+        """Item and event pages chain through next_after without gaps or repeats."""
+        page = self.service.find_items_page("", limit=3)
+        self.assertEqual(len(page.records), 3)
+        self.assertIsNotNone(page.next_after)
+        items = list(self.service.iter_items("", page_size=3))
+        self.assertEqual(items[:3], list(page.records))
+        self.assertEqual(len(items), len({item.isbn for item in items}))
+        events = list(self.service.iter_events("", page_size=2))
+        self.assertEqual([e.event_id for e in events],
+                         sorted(e.event_id for e in self.service.find_events("")))
+
+    def test_borrow_and_return(self):
+        """A loan is created, its copy becomes unavailable, and returning it reverses that."""
+        loan = self.service.borrow(1, 1, today=datetime.date(2024, 1, 1))
+        self.assertEqual((loan.member_id, loan.copy_id, loan.due_date), (1, 1, "2024-01-15"))
+        with self.assertRaises(UnavailableError):
+            self.service.borrow(2, 1)
+        returned = self.service.return_loan(loan.loan_id, today=datetime.date(2024, 1, 10))
+        self.assertEqual(returned.copy_id, 1)
+        with self.assertRaises(UnavailableError):
+            self.service.return_loan(loan.loan_id)
+        cur = self.conn.execute("SELECT Available FROM Inventory WHERE copyID = 1")
+        self.assertEqual(cur.fetchone()[0], 1)
+
+    def test_borrow_errors(self):
+        """Unknown members and copies and malformed IDs raise typed errors."""
+        with self.assertRaises(NotFoundError):
+            self.service.borrow(99, 1)
+        with self.assertRaises(NotFoundError):
+            self.service.borrow(1, 99)
+        with self.assertRaises(InvalidRequestError):
+            self.service.borrow("abc", 1)
+        with self.assertRaises(NotFoundError):
+            self.service.return_loan(999)
+
+    def test_borrow_many(self):
+        """
+        Bulk checkout: valid loans are written together; bad members, unknown,
+        unavailable and repeated copies fail alone.
+        """
+        results = self.service.borrow_many([(1, 1), (2, 2), (1, 3), (2, 1), (99, 4), (1, 42), ("x", 4)])
+        self.assertEqual([r.ok for r in results], [True, True, False, False, False, False, False])
+        self.assertEqual([str(r.error) for r in results[2:]], [
+            "copy not available", "copy not available", "member not found",
+            "copy not found", "invalid member or copy ID"])
+        cur = self.conn.execute("SELECT copyID, memberID, loanID FROM Activity WHERE returnDate IS NULL ORDER BY copyID")
+        self.assertEqual(cur.fetchall(), [(1, 1, results[0].result.loan_id), (2, 2, results[1].result.loan_id)])
+        cur = self.conn.execute("SELECT Available FROM Inventory WHERE copyID IN (1, 2)")
+        self.assertEqual(cur.fetchall(), [(0,), (0,)], "Borrowed copies should be marked unavailable.")
+        self.assertFalse(self.conn.in_transaction, "The batch should be committed.")
+
+    def test_borrow_many_malformed_requests(self):
+        """Short, long, empty and non-sequence requests are reported like any other bad ID."""
+        results = self.service.borrow_many([(1,), (), (1, 2, 3), 7, None, "12", (1, 2)])
+        self.assertEqual([r.ok for r in results], [False] * 6 + [True])
+        self.assertEqual({str(r.error) for r in results[:6]}, {"invalid member or copy ID"})
+
+    def test_return_many(self):
+        """
+        Bulk check-in fires the fine triggers per loan: a late return is fined,
+        an on-time one is not, and bad loan IDs fail alone.
+        """
+        self.conn.executemany("INSERT INTO Activity VALUES (?, ?, 1, '2023-01-01', ?, NULL)",
+                              [(11, 1, '2023-01-15'), (12, 2, '2023-02-15')])
+        self.conn.execute("UPDATE Inventory SET Available = 0 WHERE copyID IN (1, 2)")
+        self.conn.commit()
+        results = self.service.return_many([11, 12, 11, 1, 999], today=datetime.date(2023, 1, 20))
+        self.assertEqual([r.ok for r in results], [True, True, False, False, False])
+        self.assertEqual([str(r.error) for r in results[2:]], [
+            "loan already returned", "loan already returned", "loan not found"])
+        cur = self.conn.execute("SELECT loanID, amount FROM Fine WHERE loanID IN (11, 12)")
+        self.assertEqual(cur.fetchall(), [(11, 5.0)], "Only the late return should be fined.")
+        cur = self.conn.execute("SELECT Available FROM Inventory WHERE copyID IN (1, 2)")
+        self.assertEqual(cur.fetchall(), [(1,), (1,)])
+
+    def test_donate(self):
+        """Donating a known ISBN adds a copy; an unknown ISBN needs catalog details."""
+        donation = self.service.donate("9780140449136", "A2", "Good")
+        self.assertFalse(donation.added_to_catalog)
+        with self.assertRaises(NotFoundError):
+            self.service.donate("9789999999999", "S1", "Good")
+        details = {"itemType": "Print Book", "title": "Test Book", "author": "Test Author",
+                   "publishDate": "2023-01-01", "Publisher": "Test Publisher"}
+        donation = self.service.donate("9789999999999", "S1", "Good", details)
+        self.assertTrue(donation.added_to_catalog)
+        cur = self.conn.execute("SELECT ISBN, Source FROM Inventory WHERE copyID = ?", (donation.copy_id,))
+        self.assertEqual(cur.fetchone(), ("9789999999999", "Donated"))
+
+    def test_donate_is_atomic(self):
+        """If the copy cannot be added, the new catalog entry is rolled back too."""
+        self.conn.execute("""
+            CREATE TRIGGER reject_copy BEFORE INSERT ON Inventory
+            BEGIN SELECT RAISE(ABORT, 'rejected'); END
+        """)
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.service.donate("9789999999999", "S1", "Good", {"title": "Lost"})
+        self.assertFalse(self.service.item_exists("9789999999999"))
+        self.assertFalse(self.conn.in_transaction)
+
+    def test_holds(self):
+        """Returned copies go to waiting members in order; uncollected holds expire."""
+        day = datetime.date(2024, 1, 1)
+        isbn = "9783161484100"
+        loan = self.service.borrow(1, 1, today=day)
+        first = self.service.place_hold(2, isbn, today=day)
+        second = self.service.place_hold(3, isbn, today=day)
+        self.assertEqual((first.status, second.status), ("waiting", "waiting"))
+        with self.assertRaises(InvalidRequestError):
+            self.service.place_hold(2, isbn, today=day)
+        returned = self.service.return_loan(loan.loan_id, today=day)
+        self.assertEqual(returned.hold_id, first.hold_id)
+        ready = self.service.find_hold(first.hold_id)
+        self.assertEqual((ready.status, ready.copy_id, ready.expires_on), ("ready", 1, "2024-01-08"))
+        # The copy stays off the shelf, and only member 2 may take it.
+        with self.assertRaises(UnavailableError):
+            self.service.borrow(3, 1, today=day)
+        loan = self.service.borrow(2, 1, today=day)
+        self.assertEqual(self.service.find_hold(first.hold_id).status, "fulfilled")
+        self.service.return_loan(loan.loan_id, today=day)
+        self.assertEqual(self.service.find_hold(second.hold_id).status, "ready")
+        # Member 3 never collects it; the sweep puts the copy back on the shelf.
+        self.assertEqual(self.service.expire_holds(today=day + datetime.timedelta(days=7)), 0)
+        self.assertEqual(self.service.expire_holds(today=day + datetime.timedelta(days=8)), 1)
+        self.assertEqual(self.service.find_hold(second.hold_id).status, "expired")
+        self.assertEqual(self.service.availability([isbn])[isbn].available_copies, 1)
+        # With a copy on the shelf a new hold is ready at once; cancelling frees the copy.
+        hold = self.service.place_hold(4, isbn, today=day)
+        self.assertEqual((hold.status, hold.copy_id), ("ready", 1))
+        self.service.cancel_hold(hold.hold_id)
+        self.assertEqual(self.service.availability([isbn])[isbn].available_copies, 1)
+
+    def test_donated_copy_serves_holds(self):
+        """A donated copy of a title with a queue goes to the first waiting member, not the shelf."""
+        day = datetime.date(2024, 1, 1)
+        isbn = "9783161484100"
+        self.service.borrow(1, 1, today=day)
+        first = self.service.place_hold(2, isbn, today=day)
+        donation = self.service.donate(isbn, "A1", "New", today=day)
+        self.assertEqual(donation.hold_id, first.hold_id)
+        ready = self.service.find_hold(first.hold_id)
+        self.assertEqual((ready.status, ready.copy_id), ("ready", donation.copy_id))
+        with self.assertRaises(UnavailableError):
+            self.service.borrow(4, donation.copy_id, today=day)
+        self.assertEqual(self.service.availability([isbn])[isbn].available_copies, 0)
+        # With nobody waiting, the next copy goes on the shelf.
+        self.assertIsNone(self.service.donate(isbn, "A1", "New", today=day).hold_id)
+        self.assertEqual(self.service.availability([isbn])[isbn].available_copies, 1)
+
+    def test_member_account(self):
+        """Open loans, overdue flags and unpaid fines come back together."""
+        day = datetime.date(2024, 1, 1)
+        loan = self.service.borrow(1, 1, today=day)
+        account = self.service.member_account(1, today=day + datetime.timedelta(days=20))
+        lines = {line.loan_id: line for line in account.loans}
+        self.assertTrue(lines[loan.loan_id].overdue)
+        self.assertEqual(lines[loan.loan_id].title, "The Great Gatsby")
+        self.assertTrue(all(line.return_date is None or line.fine for line in account.loans))
+        self.assertEqual(account.fines_owed, sum(line.fine or 0 for line in account.loans))
+        self.assertFalse(self.service.member_account(1, today=day).loans[-1].overdue)
+        with self.assertRaises(NotFoundError):
+            self.service.member_account(999)
+        # Returned late, the loan stays on the account until its fine is paid.
+        self.service.return_loan(loan.loan_id, today=day + datetime.timedelta(days=20))
+        lines = {line.loan_id: line for line in self.service.member_account(1).loans}
+        self.assertEqual(lines[loan.loan_id].fine, 6.0)
+        self.conn.execute("UPDATE Fine SET paymentDate = '2024-02-01' WHERE loanID = ?", (loan.loan_id,))
+        self.assertNotIn(loan.loan_id, {line.loan_id for line in self.service.member_account(1).loans})
+
+    def test_events(self):
+        """Events are found by name or type, and registration honours capacity."""
+        events = self.service.find_events("Book Club")
+        self.assertEqual(events[0].name, "Book Club Meeting")
+        # Event 7 is in R006 (capacity 35) with 20 seats taken.
+        self.service.register(7, seats=15)
+        with self.assertRaises(EventFullError):
+            self.service.register(7)
+        with self.assertRaises(NotFoundError):
+            self.service.register(999)
+
+    def test_register_invalid_seats(self):
+        """Seat counts below 1 are refused before anything is reserved."""
+        # Event 1 has 25 seats reserved.
+        for seats in (-50, 0, 1.5, "2", True):
+            with self.assertRaises(InvalidRequestError):
+                self.service.register(1, seats=seats)
+            with self.assertRaises(InvalidRequestError):
+                self.service.register_many([1, 2], seats=seats)
+        cur = self.conn.execute("SELECT reservedSeats FROM Event WHERE EventID = 1")
+        self.assertEqual(cur.fetchone()[0], 25)
+
+    def test_schedule_events(self):
+        """Bookings that overlap in a room are refused; back-to-back ones and moves are not."""
+        at = lambda day, hour: datetime.datetime(2023, 11, day, hour)
+        # Event 2 is in R004 (capacity 40) on 2023-11-05 from 19:00 to 21:00.
+        with self.assertRaises(ScheduleConflictError):
+            self.service.schedule_event("Clash", "Talk", "R004", at(5, 20), at(5, 22))
+        event = self.service.schedule_event("After", "Talk", "R004", at(5, 21), at(5, 22))
+        self.assertEqual((event.start_date, event.start_time, event.room_number), ("2023-11-05", "21:00", "R004"))
+        with self.assertRaises(ScheduleConflictError):
+            self.service.move_event(2, "R004", at(5, 20), at(5, 22))
+        self.service.move_event(2, "R004", at(5, 18), at(5, 21))
+        with self.assertRaises(InvalidRequestError):
+            self.service.schedule_event("Backwards", "Talk", "R001", at(5, 22), at(5, 21))
+        with self.assertRaises(NotFoundError):
+            self.service.schedule_event("Nowhere", "Talk", "R999", at(5, 9), at(5, 10))
+        # Event 5 has 40 seats reserved; R007 only seats 15.
+        with self.assertRaises(InvalidRequestError):
+            self.service.move_event(5, "R007", at(20, 9), at(20, 10))
+        # On the evening of the 5th R004 is taken. Rooms seating 45 or more are free,
+        # smallest first; R009 is free because event 5 is on the 20th.
+        free = self.service.free_rooms(at(5, 20), at(5, 21), seats=45)
+        self.assertEqual([room.room_number for room in free], ["R008", "R002", "R010", "R009"])
+        self.assertNotIn("R004", [room.room_number for room in self.service.free_rooms(at(5, 20), at(5, 21))])
+
+    def test_free_rooms_with_roomless_event(self):
+        """An event without a room takes no room, and does not hide the free ones."""
+        at = lambda day, hour: datetime.datetime(2023, 11, day, hour)
+        before = self.service.free_rooms(at(5, 20), at(5, 21))
+        self.conn.execute(
+            "INSERT INTO Event (startDate, endDate, startTime, endTime, reservedSeats, roomNumber, eventName, "
+            "eventType) VALUES ('2023-11-05', '2023-11-05', '19:00', '22:00', 0, NULL, 'Online', 'Talk')")
+        self.assertEqual(self.service.free_rooms(at(5, 20), at(5, 21)), before)
+        self.assertEqual(self.conn.execute("SELECT count(*) FROM EventSchedule WHERE roomNumber IS NULL").fetchone(),
+                         (0,))
+        # Taking event 2 out of R004 frees the room.
+        self.conn.execute("UPDATE Event SET roomNumber = NULL WHERE EventID = 2")
+        self.assertIn("R004", [room.room_number for room in self.service.free_rooms(at(5, 20), at(5, 21))])
+
+    def test_register_many(self):
+        """
+        Batch seat reservation: several events are booked in one call and full or
+        unknown events are skipped.
+        """
+        # Event 3 is in R003 (capacity 20) and already full.
+        results = self.service.register_many([1, 3, 999])
+        self.assertEqual(results, [(1, RESERVED), (3, FULLY_BOOKED), (999, EVENT_NOT_FOUND)])
+        cur = self.conn.execute("SELECT reservedSeats FROM Event WHERE EventID IN (1, 3)")
+        self.assertEqual(cur.fetchall(), [(26,), (20,)], "Only successful reservations change reservedSeats.")
+        self.assertFalse(self.conn.in_transaction, "The batch should be committed.")
+
+    def test_staff(self):
+        """Volunteers are added as Personnel and the front-desk librarian is found."""
+        personnel_id = self.service.volunteer("R001")
+        cur = self.conn.execute("SELECT Position FROM Personnel WHERE personnelID = ?", (personnel_id,))
+        self.assertEqual(cur.fetchone()[0], "Volunteer")
+        with self.assertRaises(NotFoundError):
+            self.service.volunteer("R999")
+        self.assertEqual(self.service.find_librarian("R001").personnel_id, 1)
+        self.assertIsNone(self.service.find_librarian("R002"))
+
+    def test_register_concurrent(self):
+        """
+        Stress test: many threads register for the same event on separate connections.
+        The event must end up exactly full, never oversold.
+        """
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, "library.db")
+        setup = open_connection(path)
+        setup.executescript("""
+            CREATE TABLE Room (roomNumber TEXT PRIMARY KEY, maxCapacity INTEGER);
+            CREATE TABLE Event (EventID INTEGER PRIMARY KEY, reservedSeats INTEGER, roomNumber TEXT);
+            INSERT INTO Room VALUES ('R001', 200);
+            INSERT INTO Event VALUES (1, 0, 'R001');
+        """)
+        setup.close()
+
+        threads, attempts = 16, 25
+        outcomes = []
+        lock = threading.Lock()
+        def patron():
+            conn = open_connection(path, pragmas={"busy_timeout": 30000})
+            service = LibraryService(conn)
+            for _ in range(attempts):
+                try:
+                    service.register(1)
+                    outcome = RESERVED
+                except EventFullError:
+                    outcome = FULLY_BOOKED
+                with lock:
+                    outcomes.append(outcome)
+            conn.close()
+
+        start = time.perf_counter()
+        workers = [threading.Thread(target=patron) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+
+        check = open_connection(path)
+        reserved = check.execute("SELECT reservedSeats FROM Event WHERE EventID = 1").fetchone()[0]
+        check.close()
+        self.assertEqual(len(outcomes), threads * attempts)
+        self.assertEqual(outcomes.count(RESERVED), 200)
+        self.assertEqual(outcomes.count(FULLY_BOOKED), threads * attempts - 200)
+        self.assertEqual(reserved, 200, "The event should be exactly full, never oversold.")
+        print(f"\n{len(outcomes) / elapsed:.0f} registrations/sec across {threads} threads")
+
+    def test_holds_concurrent(self):
+        """
+        Stress test: many members queue for the same title on separate connections while
+        each, once served, borrows and returns the copy. Every member is served exactly
+        once, always in the order the holds were placed.
+        """
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, "library.db")
+        self.conn.executemany("INSERT INTO Member (memberID, firstName) VALUES (?, 'Patron')",
+                              [(member_id,) for member_id in range(100, 124)])
+        self.conn.execute("INSERT INTO Inventory (ISBN, Available) VALUES ('9783161484100', 1)")
+        self.conn.commit()
+        target = sqlite3.connect(path)
+        self.conn.backup(target)
+        target.close()
+
+        errors = []
+        def patron(member_id):
+            conn = open_connection(path, pragmas={"busy_timeout": 30000})
+            service = LibraryService(conn)
+            try:
+                hold = service.place_hold(member_id, "9783161484100")
+                deadline = time.monotonic() + 60
+                while hold.status == "waiting":
+                    if time.monotonic() > deadline:
+                        raise AssertionError(f"member {member_id} was never served")
+                    time.sleep(0.002)
+                    hold = service.find_hold(hold.hold_id)
+                # Nobody who queued earlier may still be waiting.
+                ahead = conn.execute("""
+                    SELECT COUNT(*) FROM Hold
+                    WHERE ISBN = '9783161484100' AND status = 'waiting' AND holdID < ?
+                """, (hold.hold_id,)).fetchone()[0]
+                if ahead:
+                    raise AssertionError(f"hold {hold.hold_id} was served ahead of {ahead} others")
+                loan = service.borrow(member_id, hold.copy_id)
+                service.return_loan(loan.loan_id)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                conn.close()
+
+        workers = [threading.Thread(target=patron, args=(member_id,)) for member_id in range(100, 124)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(errors, [])
+        check = open_connection(path)
+        self.addCleanup(check.close)
+        statuses = check.execute("SELECT status, COUNT(*) FROM Hold GROUP BY status").fetchall()
+        self.assertEqual(statuses, [("fulfilled", 24)])
+        self.assertEqual(check.execute(
+            "SELECT COUNT(*) FROM Inventory WHERE ISBN = '9783161484100' AND Available = 1").fetchone()[0], 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from migrations import LATEST_VERSION, find_full_scans, migrate, schema_version
+
+class TestMigrations(unittest.TestCase):
+    def setUp(self):
+        """Create an in-memory database from db.sql, before any migration."""
+        self.conn = sqlite3.connect(":memory:")
+        with open("db.sql") as f:
+            self.conn.executescript(f.read())
+
+    def tearDown(self):
+        self.conn.close()
+
+    def index_names(self):
+        cur = self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+        return {row[0] for row in cur}
+
+    def test_migrate_new_database(self):
+        """A fresh database is brought to the latest version with all indexes."""
+        self.assertEqual(schema_version(self.conn), 0)
+        applied = migrate(self.conn)
+        self.assertEqual(applied, list(range(1, LATEST_VERSION + 1)))
+        self.assertEqual(schema_version(self.conn), LATEST_VERSION)
+        for name in ("idx_activity_open_member", "idx_inventory_available", "idx_event_room"):
+            self.assertIn(name, self.index_names())
+
+    def test_migrate_is_idempotent(self):
+        """Running migrate twice applies nothing the second time."""
+        migrate(self.conn)
+        self.assertEqual(migrate(self.conn), [])
+
+    def test_migrate_existing_database(self):
+        """An existing populated library.db is upgraded in place without data loss."""
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, "library.db")
+        shutil.copy("library.db", path)
+        conn = sqlite3.connect(path)
+        self.addCleanup(conn.close)
+        before = conn.execute("SELECT COUNT(*) FROM Item").fetchone()[0]
+        migrate(conn)
+        self.assertEqual(schema_version(conn), LATEST_VERSION)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM Item").fetchone()[0], before)
+        hits = conn.execute("SELECT COUNT(*) FROM ItemSearch WHERE ItemSearch MATCH 'gatsby'")
+        self.assertEqual(hits.fetchone()[0], 1)
+
+    def test_failed_migration_rolls_back(self):
+        """A migration that fails leaves the version and schema untouched."""
+        self.conn.execute("DROP TABLE Event")
+        migrate(self.conn, target=1)
+        with self.assertRaises(sqlite3.Error):
+            migrate(self.conn)
+        self.assertEqual(schema_version(self.conn), 1)
+        self.assertNotIn("idx_activity_copy", self.index_names())
+
+    def test_plan_check_detects_scans(self):
+        """Without its index a lookup is reported by the plan check."""
+        migrate(self.conn)
+        self.conn.execute("DROP INDEX idx_personnel_room_position")
+        offenders = find_full_scans(self.conn)
+        self.assertIn("_find_librarian", [offender[2] for offender in offenders])
+
+    def test_no_full_scans(self):
+        """No statement in the application falls back to an unexpected full table scan."""
+        migrate(self.conn)
+        self.assertEqual(find_full_scans(self.conn), [])
+
+if __name__ == '__main__':
+    unittest.main()
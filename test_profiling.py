@@ -0,0 +1,126 @@
+import datetime
+import os
+import pstats
+import shutil
+import tempfile
+import time
+import unittest
+
+from bootstrap import memory_database
+from library_service import LibraryService
+from profiling import Profiler, profiler_from_env, statement_shape
+
+# Enough SQLite work for the sampler to catch the thread inside it.
+SLOW_QUERY = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 300000) SELECT count(*) FROM n"
+
+def wait_at_console():
+    time.sleep(0.03)
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.conn = memory_database()
+        self.service = LibraryService(self.conn)
+        self.profiler = Profiler(self.workdir, cprofile=True)
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.workdir)
+
+    def read_stacks(self, name):
+        stacks = {}
+        with open(os.path.join(self.workdir, name + ".folded")) as f:
+            for line in f:
+                stack, count = line.rsplit(" ", 1)
+                stacks[stack] = int(count)
+        return stacks
+
+    def test_collapsed_stacks(self):
+        """Samples are rooted at the operation and show Python and SQLite time apart."""
+        with self.profiler.operation("find_item", self.conn):
+            wait_at_console()
+            self.conn.execute(SLOW_QUERY).fetchone()
+        self.profiler.write()
+        stacks = self.read_stacks("find_item")
+        self.assertTrue(all(stack.split(";")[0] == "find_item" for stack in stacks))
+        self.assertTrue(any("wait_at_console (test_profiling.py" in stack for stack in stacks))
+        # The query was run straight from the block, so its frame sits under the operation.
+        self.assertTrue(any(stack.startswith("find_item;sqlite: WITH RECURSIVE n(i) AS (SELECT ? UNION ALL")
+                            for stack in stacks))
+        stats = pstats.Stats(os.path.join(self.workdir, "find_item.pstats"))
+        self.assertIn("wait_at_console", {func[2] for func in stats.stats})
+
+    def test_statements_and_triggers(self):
+        """Statements are counted by shape, with their VM steps and trigger programs."""
+        for copy_id in (1, 2):
+            with self.profiler.operation("borrow_item", self.conn):
+                loan = self.service.borrow(copy_id, copy_id, today=datetime.date(2000, 1, 1))
+        profile = self.profiler.profiles["borrow_item"]
+        self.assertEqual(profile.calls, 2)
+        insert = next(shape for shape in profile.statements if shape.startswith("INSERT INTO Activity"))
+        self.assertEqual(profile.statements[insert], 2)
+        self.assertGreater(profile.trigger_runs[insert], 0)
+        self.assertIn("insert_fine_for_overdue_loan", profile.triggers[insert])
+        self.assertIn("insert_fine_for_overdue_loan", self.profiler.summary())
+        # Outside a block the connection is no longer traced.
+        traced = sum(profile.statements.values())
+        self.service.return_loan(loan.loan_id)
+        self.assertEqual(sum(profile.statements.values()), traced)
+
+    def test_executemany_rows_are_statements(self):
+        """Each row of an executemany() counts as a run, not as a trigger program."""
+        self.conn.execute("CREATE TABLE Scratch (n INTEGER)")
+        with self.profiler.operation("bulk", self.conn):
+            self.conn.executemany("INSERT INTO Scratch (n) VALUES (?)", [(n,) for n in range(50)])
+            # Repeating the same values on a table without triggers is still a new run.
+            self.conn.execute("INSERT INTO Scratch (n) VALUES (1)")
+            self.conn.execute("INSERT INTO Scratch (n) VALUES (1)")
+        profile = self.profiler.profiles["bulk"]
+        self.assertEqual(profile.statements["INSERT INTO Scratch (n) VALUES (?)"], 52)
+        self.assertEqual(profile.trigger_runs, {})
+
+    def test_repeated_statement_is_not_trigger_work(self):
+        """Running the same statement again on a table with triggers is a second run."""
+        # Inventory has UPDATE triggers, but none of them watch shelfNumber.
+        move = "UPDATE Inventory SET shelfNumber = 'S9' WHERE copyID = 1"
+        # The availability trigger's program runs once per update of Available, and its
+        # WHEN clause (checked inside the program) is false as copy 1 is already available.
+        restock = "UPDATE Inventory SET Available = 1 WHERE copyID = 1"
+        with self.profiler.operation("move", self.conn):
+            self.conn.execute(move)
+            self.conn.execute(move)
+        with self.profiler.operation("restock", self.conn):
+            self.conn.execute(restock)
+            self.conn.execute(restock)
+        profile = self.profiler.profiles["move"]
+        self.assertIn("availability_copy_available", profile.triggers[statement_shape(move)])
+        self.assertEqual(profile.statements[statement_shape(move)], 2)
+        self.assertEqual(profile.trigger_runs, {})
+        profile = self.profiler.profiles["restock"]
+        self.assertEqual(profile.statements[statement_shape(restock)], 2)
+        self.assertEqual(profile.trigger_runs[statement_shape(restock)], 2)
+
+    def test_batch_borrow(self):
+        """A batch insert into a table with triggers counts every row and the triggers it fires."""
+        with self.profiler.operation("borrow_many", self.conn):
+            results = self.service.borrow_many([(1, 2), (2, 5), (3, 7)], today=datetime.date(2000, 1, 1))
+        self.assertTrue(all(result.ok for result in results))
+        profile = self.profiler.profiles["borrow_many"]
+        insert = next(shape for shape in profile.statements if shape.startswith("INSERT INTO Activity"))
+        self.assertEqual(profile.statements[insert], 3)
+        self.assertGreaterEqual(profile.trigger_runs[insert], 3)
+        self.assertEqual(set(profile.trigger_runs) - {shape for shape, names in profile.triggers.items() if names},
+                         set())
+
+    def test_statement_shape(self):
+        self.assertEqual(statement_shape("SELECT * FROM Room WHERE roomNumber = 'R001' AND capacity > 10"),
+                         "SELECT * FROM Room WHERE roomNumber = ? AND capacity > ?")
+
+    def test_from_env(self):
+        """Profiling is off unless LIBRARY_PROFILE is set."""
+        self.assertIsNone(profiler_from_env({}))
+        profiler = profiler_from_env({"LIBRARY_PROFILE": self.workdir, "LIBRARY_PROFILE_INTERVAL_MS": "5"})
+        self.assertEqual((profiler.directory, profiler.interval, profiler.cprofile), (self.workdir, 0.005, False))
+
+if __name__ == '__main__':
+    unittest.main()
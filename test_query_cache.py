@@ -0,0 +1,95 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from bootstrap import create_database
+from connection_manager import open_connection
+from library_service import LibraryService, make_cache
+from query_cache import QueryCache
+
+class TestQueryCache(unittest.TestCase):
+    def setUp(self):
+        """A migrated copy of the sample data in a file, so other connections can share it."""
+        self.workdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.workdir, "library.db")
+        create_database(self.path)
+        self.conn = open_connection(self.path)
+        self.cache = make_cache()
+        self.service = LibraryService(self.conn, cache=self.cache)
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.workdir)
+
+    def test_hits_and_misses(self):
+        first = self.service.find_items("gatsby")
+        self.assertEqual(self.service.find_items("Gatsby!"), first)
+        self.service.find_events("Book")
+        self.service.find_events("Book")
+        stats = self.cache.stats()
+        # find_items() reads the search results and their availability counts.
+        self.assertEqual((stats.hits, stats.misses, stats.entries), (3, 3, 3))
+        self.assertGreater(stats.bytes, 0)
+
+    def test_writes_invalidate(self):
+        """A donation, registration or new volunteer is visible at once."""
+        self.assertEqual(self.service.find_items("Cached Title"), [])
+        self.service.donate("9990000000001", "A1", "New", {"itemType": "Print Book", "title": "Cached Title"})
+        self.assertEqual(len(self.service.find_items("Cached Title")), 1)
+        self.service.find_events("Book")
+        self.service.register(1)
+        self.service.find_librarian("R001")
+        self.service.volunteer("R001")
+        self.assertGreaterEqual(self.cache.stats().invalidations, 3)
+
+    def test_only_changed_tables_invalidate(self):
+        self.service.find_items("gatsby")
+        other = open_connection(self.path)
+        self.addCleanup(other.close)
+        other.execute("UPDATE Event SET eventName = eventName")
+        other.commit()
+        self.service.find_items("gatsby")
+        self.assertEqual(self.cache.stats().hits, 2)
+        # A loan changes the availability counts but not the search results.
+        self.service.borrow(1, 1)
+        self.service.find_items("gatsby")
+        self.assertEqual(self.cache.stats().hits, 3)
+
+    def test_change_by_other_process(self):
+        """PRAGMA data_version exposes a commit made by another process."""
+        self.assertEqual(self.service.find_events("Poetry Night"), [])
+        subprocess.run([sys.executable, "-c", (
+            "import sqlite3, sys\n"
+            "conn = sqlite3.connect(sys.argv[1])\n"
+            "conn.execute(\"UPDATE Event SET eventName = 'Poetry Night' WHERE EventID = 1\")\n"
+            "conn.commit()\n"), self.path], check=True)
+        self.assertEqual([e.event_id for e in self.service.find_events("Poetry Night")], [1])
+
+    def test_change_on_same_connection(self):
+        """Writes made directly on the reading connection are noticed through total_changes."""
+        librarian = self.service.find_librarian("R001")
+        self.conn.execute("UPDATE Personnel SET Position = 'Janitor' WHERE personnelID = ?",
+                          (librarian.personnel_id,))
+        self.conn.commit()
+        self.assertNotEqual(self.service.find_librarian("R001"), librarian)
+
+    def test_limits(self):
+        """Entries are evicted least recently used first, by count, by size and by age."""
+        cache = QueryCache({"n": ()}, max_entries=2)
+        for key in ("a", "b", "a", "c"):
+            cache.get(self.conn, "n", key, lambda: [key])
+        self.assertEqual(cache.stats().evictions, 1)
+        self.assertEqual(cache.get(self.conn, "n", "b", lambda: ["reloaded"]), ["reloaded"])
+        cache = QueryCache({"n": ()}, max_bytes=200)
+        cache.get(self.conn, "n", "big", lambda: ["x" * 500])
+        self.assertEqual(cache.stats().entries, 0)
+        cache = QueryCache({"n": ()}, ttl=0)
+        cache.get(self.conn, "n", "k", lambda: [1])
+        cache.get(self.conn, "n", "k", lambda: [1])
+        self.assertEqual(cache.stats().expirations, 1)
+
+if __name__ == '__main__':
+    unittest.main()
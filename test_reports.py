@@ -0,0 +1,94 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from bootstrap import create_database
+from connection_manager import open_connection
+from reports import export_report, open_reports, refresh, run_report, take_snapshot
+
+class TestReports(unittest.TestCase):
+    def setUp(self):
+        """The sample data in a WAL-mode file, with the rollups in a second file."""
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "library.db")
+        create_database(self.path)
+        self.library = open_connection(self.path)
+        self.reports_path = os.path.join(self.tmpdir, "reports.db")
+
+    def tearDown(self):
+        self.library.close()
+        shutil.rmtree(self.tmpdir)
+
+    def report(self, conn, name):
+        return run_report(conn, name).rows
+
+    def test_rollups_and_incremental_refresh(self):
+        conn = open_reports(self.reports_path, self.path)
+        self.addCleanup(conn.close)
+        stats = refresh(conn, today="2024-01-01")
+        self.assertEqual((stats.new_loans, stats.new_events, stats.pending_loans), (10, 10, 0))
+        # Loans 1, 3, 5, 6 and 8 have unpaid fines; 10 has a fine too.
+        self.assertEqual(stats.pending_fines, 6)
+        self.assertEqual(self.report(conn, "fine_revenue"),
+                         [("2023-02", 1, 3.0), ("2023-04", 1, 5.0), ("2023-07", 1, 0.0), ("2023-09", 1, 3.0)])
+        rates = {row[0]: row[1:3] for row in self.report(conn, "overdue_rate")}
+        self.assertEqual(sum(returned for returned, late in rates.values()), 10)
+        self.assertEqual(sum(late for returned, late in rates.values()), 9)
+        fill = self.report(conn, "event_fill")
+        self.assertEqual(sum(row[2] for row in fill), 10)
+        self.assertIn(("2023-11", "Book Club", 1, 25, 50, 0.5), fill)
+
+        # A new late loan, a paid fine and a new event: only they are counted on the next run.
+        self.library.execute("INSERT INTO Activity VALUES (11, 1, 2, '2023-12-01', '2023-12-15', NULL)")
+        self.library.execute("UPDATE Activity SET returnDate = '2023-12-20' WHERE loanID = 11")
+        self.library.execute("UPDATE Fine SET paymentDate = '2023-12-21' WHERE loanID IN (1, 11)")
+        self.library.execute("""INSERT INTO Event VALUES (11, '2024-02-01', '2024-02-01', '10:00', '11:00',
+                                5, 'R001', 'Later', 'Talk', 1)""")
+        self.library.commit()
+        stats = refresh(conn, today="2024-01-01")
+        self.assertEqual((stats.new_loans, stats.new_events, stats.pending_events), (1, 1, 1))
+        self.assertEqual(self.report(conn, "fine_revenue")[-1], ("2023-12", 2, 10.0))
+        self.assertEqual(self.report(conn, "top_titles")[0][3], 2)
+        self.assertEqual(refresh(conn, today="2024-03-01").pending_events, 0)
+        self.assertIn(("2024-02", "Talk", 1, 5, 30, 0.1667), self.report(conn, "event_fill"))
+
+    def test_event_without_end_date(self):
+        """A single-day event with no endDate is counted once its start date has passed."""
+        self.library.execute("""INSERT INTO Event VALUES (11, '2024-02-01', NULL, '10:00', '11:00',
+                                5, 'R001', 'Later', 'Talk', 1)""")
+        self.library.commit()
+        conn = open_reports(self.reports_path, self.path)
+        self.addCleanup(conn.close)
+        self.assertEqual(refresh(conn, today="2024-01-01").pending_events, 1)
+        self.assertEqual(refresh(conn, today="2024-03-01").pending_events, 0)
+        self.assertIn(("2024-02", "Talk", 1, 5, 30, 0.1667), self.report(conn, "event_fill"))
+
+    def test_never_waits_for_the_write_lock(self):
+        """A refresh and a snapshot run while a kiosk holds the write lock, and skip its uncommitted work."""
+        self.library.execute("BEGIN IMMEDIATE")
+        self.library.execute("INSERT INTO Activity VALUES (11, 1, 2, '2023-12-01', '2023-12-15', NULL)")
+        snapshot = os.path.join(self.tmpdir, "snapshot.db")
+        take_snapshot(self.path, snapshot)
+        conn = open_reports(self.reports_path, snapshot)
+        self.addCleanup(conn.close)
+        self.assertEqual(refresh(conn).new_loans, 10)
+        live = open_reports(os.path.join(self.tmpdir, "live-reports.db"), self.path)
+        self.addCleanup(live.close)
+        self.assertEqual(refresh(live).new_loans, 10)
+        self.library.rollback()
+
+    def test_export(self):
+        conn = open_reports(self.reports_path, self.path)
+        self.addCleanup(conn.close)
+        refresh(conn, today="2024-01-01")
+        report = run_report(conn, "fine_revenue")
+        path = export_report(report, self.tmpdir, "csv")
+        with open(path) as f:
+            self.assertEqual(f.readline().strip(), "month,fines,amount")
+        path = export_report(report, self.tmpdir, "columnar")
+        with open(path) as f:
+            self.assertIn('"month": ["2023-02", "2023-04", "2023-07", "2023-09"]', f.read())
+
+if __name__ == '__main__':
+    unittest.main()
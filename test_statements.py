@@ -0,0 +1,58 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from library_service import STATEMENTS, Librarian
+from statements import PreparedStatements
+
+class TestPreparedStatements(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        with open("db.sql") as f:
+            self.conn.executescript(f.read())
+        with open("populate.sql") as f:
+            self.conn.executescript(f.read())
+        self.statements = PreparedStatements(self.conn, STATEMENTS)
+
+    def tearDown(self):
+        self.statements.close()
+        self.conn.close()
+
+    def test_cursor_reused_per_name(self):
+        first = self.statements.execute("item_exists", ("x",))
+        again = self.statements.execute("item_exists", ("y",))
+        other = self.statements.execute("event_exists", (1,))
+        self.assertIs(first, again)
+        self.assertIsNot(first, other)
+
+    def test_records(self):
+        librarian = self.statements.fetchone("find_librarian", ("R001",), Librarian)
+        self.assertIsInstance(librarian, Librarian)
+        self.assertEqual(librarian.room_number, "R001")
+        self.assertIsNone(self.statements.fetchone("find_librarian", ("R999",), Librarian))
+
+    def test_unknown_statement(self):
+        with self.assertRaises(KeyError):
+            self.statements.execute("no_such_statement")
+
+    def test_fetchone_releases_read_lock(self):
+        """A reused cursor must not hold its read transaction after fetchone()."""
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, "library.db")
+        self.conn.backup(sqlite3.connect(path))
+        reader = sqlite3.connect(path)
+        writer = sqlite3.connect(path, timeout=0)
+        self.addCleanup(reader.close)
+        self.addCleanup(writer.close)
+        statements = PreparedStatements(reader, STATEMENTS)
+        # find_events matches several rows; fetchone() must still finish the statement.
+        self.assertIsNotNone(statements.fetchone("find_events", ("%", "%")))
+        # In rollback-journal mode an open read would block this exclusive lock.
+        writer.execute("BEGIN EXCLUSIVE")
+        writer.rollback()
+
+if __name__ == '__main__':
+    unittest.main()